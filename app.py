@@ -1,13 +1,20 @@
-from flask import Flask, render_template_string, request, jsonify, send_file, abort, send_from_directory
-import threading
+from flask import Flask, render_template_string, request, jsonify, abort, send_from_directory, Response, stream_with_context
+import json
 import os
-import time
-from main import VideoDownloader
+from main import PoolTimeout, VideoDownloader
+from pipeline import (submit_download, busy_response, result_cache, info_cache, download_flights, downloader_pool,
+                      create_job_manager, start_retention, job_file_path, legacy_file_path, extract_preview_info, info_summary,
+                      parse_download_request, queued_response, info_busy_response, info_pool)
+from werkzeug.exceptions import HTTPException
+from extractor_cache import default_extractor_cache
+from delivery import serve_media, stream_job_file
+from postprocess import default_scheduler
+from probe import probe_cache
 import tempfile
 from pathlib import Path
 
 app = Flask(__name__, static_folder='static', static_url_path='/static')
-downloader = VideoDownloader()
+downloader = VideoDownloader(download_path=downloader_pool.download_path)
 
 # HTML template with modern, animated, attractive design
 HTML = '''
@@ -275,8 +282,11 @@ HTML = '''
 </html>
 '''
 
-# Thread-safe download status
-download_results = {}
+# Background download jobs
+job_manager = create_job_manager()
+
+# Keeps the download folder within its disk quota
+retention = start_retention(job_manager)
 
 @app.route('/')
 def index():
@@ -284,190 +294,128 @@ def index():
 
 @app.route('/download', methods=['POST'])
 def download():
-    """Download video endpoint with better error handling"""
-    data = request.get_json()
-    url = data.get('url')
-    remove_watermark = data.get('removeWatermark', True)
-    
-    if not url:
-        return jsonify({'success': False, 'message': 'No URL provided.'})
+    """Queue a download job and return its id immediately"""
+    url, options, error = parse_download_request(request.get_json(silent=True))
+    if error:
+        return jsonify({'success': False, 'message': error})
     
-    # Validate URL format
+    job, retry_after = submit_download(job_manager, url, options)
+    if job is None:
+        return jsonify(busy_response(retry_after)), 503, {'Retry-After': str(retry_after)}
+    return jsonify(queued_response(job)), 202
+
+@app.route('/info')
+def video_info():
+    """Preview a video's metadata without downloading it"""
+    url = request.args.get('url', '')
     if not url.startswith(('http://', 'https://')):
-        return jsonify({'success': False, 'message': 'Please provide a valid URL starting with http:// or https://'})
-    
-    # Create unique session ID for this download
-    session_id = str(time.time()).replace('.', '')
-    status_updates = []
-    
-    def status_callback(msg, error=False):
-        status_updates.append((msg, error))
-        print(f"Status: {msg}")
+        return jsonify({'success': False, 'message': 'Please provide a valid URL starting with http:// or https://'}), 400
     
-    # Create downloader instance for this request
-    current_downloader = VideoDownloader(headless=True, status_callback=status_callback)
-    print(f"[DEBUG] Using download path: {current_downloader.download_path}")
-    
-    def download_worker():
-        """Worker function to handle download"""
-        try:
-            # Detect platform
-            platform = current_downloader.detect_platform_from_url(url)
-            print(f"[DEBUG] Detected platform: {platform}")
-            
-            # Download video
-            success = current_downloader.download_video(url)
-            print(f"[DEBUG] Download success: {success}")
-            
-            if not success:
-                print(f"[DEBUG] Download failed for URL: {url}")
-                download_results[session_id] = {
-                    'success': False,
-                    'message': 'Download failed. Please check the URL and try again.',
-                    'file_url': None
-                }
-                return
-            
-            # Find downloaded files
-            files = []
-            if os.path.exists(current_downloader.download_path):
-                print(f"[DEBUG] Scanning directory: {current_downloader.download_path}")
-                for file in os.listdir(current_downloader.download_path):
-                    file_path = os.path.join(current_downloader.download_path, file)
-                    print(f"[DEBUG] Found file: {file_path}")
-                    if os.path.isfile(file_path):
-                        # Check if file was created recently (within last 5 minutes)
-                        file_mtime = os.path.getmtime(file_path)
-                        if time.time() - file_mtime < 300:  # 5 minutes
-                            file_size = os.path.getsize(file_path)
-                            if file_size > 1024:  # At least 1KB
-                                files.append({
-                                    'name': file,
-                                    'path': file_path,
-                                    'size': file_size,
-                                    'mtime': file_mtime
-                                })
-            print(f"[DEBUG] Video files found: {[f['name'] for f in files]}")
-            
-            # Sort by modification time to get the latest file
-            if files:
-                # Filter for video files
-                video_exts = ('.mp4', '.mkv', '.webm', '.mov', '.avi', '.flv', '.m4v')
-                video_files = [f for f in files if f['name'].lower().endswith(video_exts)]
-                
-                if video_files:
-                    # Get the most recent video file
-                    latest_file = max(video_files, key=lambda x: x['mtime'])
-                    result_path = latest_file['path']
-                    
-                    # Remove watermark if requested and FFmpeg is available
-                    if remove_watermark and current_downloader.ffmpeg_available:
-                        status_callback('🧹 Removing watermarks...')
-                        cleaned_path = current_downloader.remove_watermark_from_video(result_path, platform)
-                        if cleaned_path and cleaned_path != result_path and os.path.exists(cleaned_path):
-                            result_path = cleaned_path
-                            status_callback('✨ Watermarks removed successfully!')
-                    
-                    # Store result
-                    filename = os.path.basename(result_path)
-                    file_url = f'/file/{filename}'
-                    
-                    download_results[session_id] = {
-                        'success': True,
-                        'message': f'Download completed: {filename}',
-                        'file_url': file_url,
-                        'file_path': result_path,
-                        'filename': filename,
-                        'size': os.path.getsize(result_path)
-                    }
-                else:
-                    download_results[session_id] = {
-                        'success': False,
-                        'message': 'No video files found after download.',
-                        'file_url': None
-                    }
-            else:
-                download_results[session_id] = {
-                    'success': False,
-                    'message': 'No files were downloaded. The URL might be invalid or the content may be private.',
-                    'file_url': None
-                }
-                
-        except Exception as e:
-            error_msg = str(e)
-            print(f"Download error: {error_msg}")
-            download_results[session_id] = {
-                'success': False,
-                'message': f'Download error: {error_msg[:100]}',
-                'file_url': None
-            }
+    try:
+        info = extract_preview_info(url)
+    except PoolTimeout:
+        body = info_busy_response()
+        return jsonify(body), 503, {'Retry-After': str(body['retry_after'])}
+    if not info:
+        return jsonify({'success': False, 'message': 'Could not extract video information from this URL'}), 422
     
-    # Start download in background thread
-    thread = threading.Thread(target=download_worker)
-    thread.daemon = True
-    thread.start()
+    data = info_summary(info)
+    data['success'] = True
+    return jsonify(data)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report the state of a download job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown job id.'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Abort a queued or running download job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown job id.'}), 404
+    cancelled = job.cancel()
+    return jsonify({'success': cancelled, 'message': 'Cancelling job' if cancelled else 'Job already finished'})
+
+@app.route('/jobs/<job_id>/stream')
+def job_stream(job_id):
+    """Stream a job's file to the browser while it is still downloading"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown job id.'}), 404
+    response = stream_job_file(request, job, root=downloader.download_path, pin=retention.serving)
+    if response is None:
+        message = job.message if job.done else 'Download has not started yet. Try again shortly.'
+        return jsonify({'success': False, 'message': message}), 409 if job.done else 503
+    return response
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Stream job status and progress as Server-Sent Events"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown job id.'}), 404
     
-    # Wait for download to complete (with timeout)
-    timeout = 120  # 2 minutes timeout
-    start_time = time.time()
+    try:
+        last_id = int(request.headers.get('Last-Event-ID', request.args.get('since', 0)))
+    except ValueError:
+        last_id = 0
     
-    while session_id not in download_results:
-        if time.time() - start_time > timeout:
-            return jsonify({
-                'success': False,
-                'message': 'Download timeout. The video might be too large or the server is busy.'
-            })
-        time.sleep(1)
+    def stream():
+        nonlocal last_id
+        yield 'retry: 3000\n\n'
+        while True:
+            events = job.events_since(last_id, timeout=15)
+            if not events:
+                if job.done:
+                    return
+                yield ': keepalive\n\n'
+                continue
+            for event_id, event_type, data in events:
+                last_id = event_id
+                yield f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n'
+                if event_type == 'done':
+                    return
     
-    # Get result
-    result = download_results.pop(session_id, {
-        'success': False,
-        'message': 'Unknown error occurred',
-        'file_url': None
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
     })
-    
-    return jsonify(result)
 
-@app.route('/file/<filename>')
+def send_download(file_path, filename):
+    """Send a downloaded file with Range/ETag support"""
+    print(f"[DEBUG] Serving file: {file_path}")
+    # Last-served time drives retention; the file stays pinned until the response is sent
+    return serve_media(request, file_path, filename, root=downloader.download_path, pin=retention.serving)
+
+@app.route('/file/<job_id>/<filename>', methods=['GET', 'HEAD'])
+def serve_job_file(job_id, filename):
+    """Serve a file from a job's work directory"""
+    try:
+        # Security check - only allow files from the job directory
+        safe_job_id = os.path.basename(job_id)
+        safe_filename = os.path.basename(filename)
+        file_path = job_file_path(downloader.download_path, safe_job_id, safe_filename)
+        return send_download(file_path, safe_filename)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error serving file {filename}: {e}")
+        abort(404)
+
+@app.route('/file/<filename>', methods=['GET', 'HEAD'])
 def serve_file(filename):
-    """Serve downloaded files with proper headers"""
+    """Serve files linked by bare name (saved directly in the download directory by older versions)"""
     try:
         # Security check - only allow files from download directory
         safe_filename = os.path.basename(filename)  # Remove any path traversal
-        file_path = os.path.join(downloader.download_path, safe_filename)
-        print(f"[DEBUG] Serving file: {file_path}")
-        
-        # Check if file exists and is actually a file
-        if not os.path.exists(file_path) or not os.path.isfile(file_path):
-            print(f"[DEBUG] File not found: {file_path}")
-            abort(404)
-        
-        # Check file size to ensure it's not empty
-        if os.path.getsize(file_path) == 0:
-            print(f"[DEBUG] File is empty: {file_path}")
-            abort(404)
-        
-        # Determine MIME type based on extension
-        ext = os.path.splitext(filename)[1].lower()
-        mime_types = {
-            '.mp4': 'video/mp4',
-            '.mkv': 'video/x-matroska',
-            '.webm': 'video/webm',
-            '.mov': 'video/quicktime',
-            '.avi': 'video/x-msvideo',
-            '.flv': 'video/x-flv',
-            '.m4v': 'video/mp4'
-        }
-        
-        mimetype = mime_types.get(ext, 'application/octet-stream')
-        
-        return send_file(
-            file_path,
-            as_attachment=True,
-            download_name=filename,
-            mimetype=mimetype
-        )
-        
+        file_path = legacy_file_path(downloader.download_path, safe_filename)
+        return send_download(file_path, safe_filename)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error serving file {filename}: {e}")
         abort(404)
@@ -475,7 +423,38 @@ def serve_file(filename):
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'download_path': downloader.download_path})
+    return jsonify({
+        'status': 'healthy',
+        'download_path': downloader.download_path,
+        'cache': result_cache.stats(),
+        'info_cache': info_cache.stats(),
+        'in_flight_downloads': len(download_flights.in_flight()),
+        'downloader_pool': downloader_pool.stats(),
+        'info_pool': info_pool.stats(),
+        'extractor_cache': default_extractor_cache.stats(),
+        'postprocess': default_scheduler.stats(),
+        'probe_cache': probe_cache.stats(),
+        'jobs': job_manager.stats(),
+        'retention': retention.stats()
+    })
+
+@app.route('/cache/extractor', methods=['DELETE'])
+def invalidate_extractor_cache():
+    """Invalidate the shared yt-dlp cache (requires DAZZLO_ADMIN_TOKEN)"""
+    token = os.environ.get('DAZZLO_ADMIN_TOKEN')
+    if not token or request.headers.get('X-Admin-Token') != token:
+        abort(403)
+    section = request.args.get('section')
+    invalidated = default_extractor_cache.invalidate(section)
+    return jsonify({'success': True, 'invalidated': invalidated, 'section': section})
+
+@app.route('/debug/jobs')
+def debug_jobs():
+    """Job registry size and memory use (requires DAZZLO_ADMIN_TOKEN)"""
+    token = os.environ.get('DAZZLO_ADMIN_TOKEN')
+    if not token or request.headers.get('X-Admin-Token') != token:
+        abort(403)
+    return jsonify(job_manager.memory_report())
 
 @app.route('/download')
 def download_page():
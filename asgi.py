@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for DazzloGet
+Serves the same routes as app.py on an event loop so that thousands of idle
+progress (SSE) and streaming connections do not each hold an OS thread.
+Blocking yt-dlp/ffmpeg work still runs on the job pool and thread executors.
+
+Run with:  uvicorn asgi:app   (or gunicorn -k uvicorn.workers.UvicornWorker asgi:app)
+"""
+
+import asyncio
+import json
+import os
+import stat
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+from pipeline import (submit_download, busy_response, result_cache, info_cache, download_flights, downloader_pool,
+                      create_job_manager, start_retention, job_file_path, legacy_file_path, extract_preview_info, info_summary,
+                      parse_download_request, queued_response, info_busy_response, info_pool)
+from main import PoolTimeout
+from extractor_cache import default_extractor_cache
+from postprocess import default_scheduler
+from probe import probe_cache
+from delivery import (CHUNK_SIZE, StreamAborted, content_disposition, download_failed, etag_matches, guess_mimetype,
+                      make_etag, offload_headers, open_growing_file, resolve_range)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+download_path = downloader_pool.download_path
+
+# Background download jobs
+job_manager = create_job_manager()
+
+# Keeps the download folder within its disk quota
+retention = start_retention(job_manager)
+
+
+async def wait_for_job_event(job, last_id, timeout):
+    """Sleep until the job publishes an event past last_id (or timeout) without a thread"""
+    if job.last_event_id > last_id or job.done:
+        return
+    if job.poll_interval:
+        # Owned by another process: nothing will call a listener, so poll the store
+        await asyncio.sleep(min(timeout, job.poll_interval))
+        await run_in_threadpool(job.refresh)
+        return
+    loop = asyncio.get_running_loop()
+    woken = asyncio.Event()
+
+    def listener():
+        loop.call_soon_threadsafe(woken.set)
+
+    job.add_listener(listener)
+    try:
+        # Re-check now that we cannot miss a wake-up
+        if job.last_event_id > last_id or job.done:
+            return
+        await asyncio.wait_for(woken.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        job.remove_listener(listener)
+
+
+def job_not_found():
+    return JSONResponse({'success': False, 'message': 'Unknown job id.'}, status_code=404)
+
+
+def static_page(filename):
+    async def page(request):
+        return FileResponse(os.path.join(STATIC_DIR, filename))
+    return page
+
+
+async def download(request):
+    """Queue a download job and return its id immediately"""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    url, options, error = parse_download_request(data)
+    if error:
+        return JSONResponse({'success': False, 'message': error})
+    # Saving to the job store / publishing to the broker may wait on a lock
+    job, retry_after = await run_in_threadpool(submit_download, job_manager, url, options)
+    if job is None:
+        return JSONResponse(busy_response(retry_after), status_code=503, headers={'Retry-After': str(retry_after)})
+    return JSONResponse(queued_response(job), status_code=202)
+
+
+async def video_info(request):
+    """Preview a video's metadata without downloading it"""
+    url = request.query_params.get('url', '')
+    if not url.startswith(('http://', 'https://')):
+        return JSONResponse({'success': False, 'message': 'Please provide a valid URL starting with http:// or https://'},
+                            status_code=400)
+
+    try:
+        info = await run_in_threadpool(extract_preview_info, url)
+    except PoolTimeout:
+        body = info_busy_response()
+        return JSONResponse(body, status_code=503, headers={'Retry-After': str(body['retry_after'])})
+    if not info:
+        return JSONResponse({'success': False, 'message': 'Could not extract video information from this URL'},
+                            status_code=422)
+    data = info_summary(info)
+    data['success'] = True
+    return JSONResponse(data)
+
+
+async def job_status(request):
+    """Report the state of a download job"""
+    job = await run_in_threadpool(job_manager.get, request.path_params['job_id'])
+    if job is None:
+        return job_not_found()
+    return JSONResponse(job.to_dict())
+
+
+async def cancel_job(request):
+    """Abort a queued or running download job"""
+    job = await run_in_threadpool(job_manager.get, request.path_params['job_id'])
+    if job is None:
+        return job_not_found()
+    cancelled = await run_in_threadpool(job.cancel)
+    return JSONResponse({'success': cancelled, 'message': 'Cancelling job' if cancelled else 'Job already finished'})
+
+
+async def job_events(request):
+    """Stream job status and progress as Server-Sent Events"""
+    job = await run_in_threadpool(job_manager.get, request.path_params['job_id'])
+    if job is None:
+        return job_not_found()
+    try:
+        last_id = int(request.headers.get('last-event-id', request.query_params.get('since', 0)))
+    except ValueError:
+        last_id = 0
+
+    async def stream():
+        nonlocal last_id
+        yield 'retry: 3000\n\n'
+        while True:
+            await wait_for_job_event(job, last_id, timeout=15)
+            # Jobs owned by another process read the store
+            events = await run_in_threadpool(job.events_since, last_id)
+            if not events:
+                if job.done:
+                    return
+                yield ': keepalive\n\n'
+                continue
+            for event_id, event_type, data in events:
+                last_id = event_id
+                yield f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n'
+                if event_type == 'done':
+                    return
+
+    return StreamingResponse(stream(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+async def _read_file(path, start, length):
+    """Async generator over a byte range; file reads run in the threadpool"""
+    f = await run_in_threadpool(open, path, 'rb')
+    try:
+        await run_in_threadpool(f.seek, start)
+        remaining = length
+        while remaining > 0:
+            chunk = await run_in_threadpool(f.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+async def serve_media(request, file_path, download_name):
+    """Async counterpart of delivery.serve_media"""
+    try:
+        st = await run_in_threadpool(os.stat, file_path)
+    except OSError:
+        return Response(status_code=404)
+    if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+        return Response(status_code=404)
+
+    size = st.st_size
+    etag = make_etag(st)
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Content-Disposition': content_disposition(download_name),
+        'Cache-Control': 'private, max-age=3600',
+        'ETag': f'"{etag}"',
+    }
+    media_type = guess_mimetype(download_name)
+
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+
+    offload = offload_headers(file_path, download_path)
+    if offload:
+        headers.update(offload)
+        return Response(status_code=200, media_type=media_type, headers=headers)
+
+    byte_range = resolve_range(request.headers.get('range'), request.headers.get('if-range'), size, etag)
+    if byte_range is False:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status_code=416, headers=headers)
+
+    start, stop = byte_range or (0, size)
+    if byte_range:
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+    headers['Content-Length'] = str(stop - start)
+    status_code = 206 if byte_range else 200
+
+    if request.method == 'HEAD':
+        return Response(status_code=status_code, media_type=media_type, headers=headers)
+    return StreamingResponse(_read_file(file_path, start, stop - start), status_code=status_code,
+                             media_type=media_type, headers=headers)
+
+
+async def serve_job_file(request):
+    """Serve a file from a job's work directory"""
+    safe_job_id = os.path.basename(request.path_params['job_id'])
+    safe_filename = os.path.basename(request.path_params['filename'])
+    file_path = job_file_path(download_path, safe_job_id, safe_filename)
+    return await send_download(request, file_path, safe_filename)
+
+
+async def serve_file(request):
+    """Serve files linked by bare name (saved directly in the download directory by older versions)"""
+    safe_filename = os.path.basename(request.path_params['filename'])
+    return await send_download(request, legacy_file_path(download_path, safe_filename), safe_filename)
+
+
+async def send_download(request, file_path, filename):
+    """serve_media, recording the file as served and pinning it until the response is sent"""
+    response = await serve_media(request, file_path, filename)
+    if response.status_code < 400:
+        response.background = BackgroundTask(retention.serving(file_path))
+    return response
+
+
+async def _follow_growing_file(job, f):
+    """Async version of delivery._follow_growing_file"""
+    last_event = job.last_event_id
+    try:
+        while True:
+            chunk = await run_in_threadpool(f.read, CHUNK_SIZE)
+            if chunk:
+                yield chunk
+                continue
+            if job.done or job.progress.get('status') == 'finished':
+                while True:
+                    chunk = await run_in_threadpool(f.read, CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+                if download_failed(job):
+                    raise StreamAborted(f"Job {job.id} failed after {f.tell()} bytes: {job.message}")
+                return
+            await wait_for_job_event(job, last_event, timeout=1)
+            last_event = job.last_event_id
+    except OSError as e:
+        raise StreamAborted(f"Job {job.id}: {e}") from e
+    finally:
+        f.close()
+
+
+async def job_stream(request, wait_timeout=30):
+    """Stream a job's file to the browser while it is still downloading"""
+    job = await run_in_threadpool(job_manager.get, request.path_params['job_id'])
+    if job is None:
+        return job_not_found()
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait_timeout
+    while not job.done and not job.partial_path and loop.time() < deadline:
+        await wait_for_job_event(job, job.last_event_id, timeout=1)
+
+    if job.done:
+        result = job.result or {}
+        if result.get('success') and result.get('file_path'):
+            return await send_download(request, result['file_path'], result['filename'])
+        return JSONResponse({'success': False, 'message': job.message}, status_code=409)
+    if not job.partial_path:
+        return JSONResponse({'success': False, 'message': 'Download has not started yet. Try again shortly.'},
+                            status_code=503)
+
+    path = job.partial_path
+    f = await run_in_threadpool(open_growing_file, job, path)
+    if f is None:
+        return JSONResponse({'success': False, 'message': job.message}, status_code=409)
+    final_name = os.path.basename(path)
+    if final_name.endswith('.part'):
+        final_name = final_name[:-len('.part')]
+    headers = {
+        'Content-Disposition': content_disposition(final_name),
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no',
+    }
+    # Closes the file even if the client leaves before the first chunk
+    return StreamingResponse(_follow_growing_file(job, f), media_type=guess_mimetype(final_name), headers=headers,
+                             background=BackgroundTask(f.close))
+
+
+async def health_check(request):
+    """Health check endpoint"""
+    return JSONResponse({
+        'status': 'healthy',
+        'download_path': download_path,
+        'cache': result_cache.stats(),
+        'info_cache': info_cache.stats(),
+        'in_flight_downloads': len(download_flights.in_flight()),
+        'downloader_pool': downloader_pool.stats(),
+        'info_pool': info_pool.stats(),
+        'extractor_cache': default_extractor_cache.stats(),
+        'postprocess': default_scheduler.stats(),
+        'probe_cache': probe_cache.stats(),
+        'jobs': await run_in_threadpool(job_manager.stats),
+        'retention': retention.stats()
+    })
+
+
+async def invalidate_extractor_cache(request):
+    """Invalidate the shared yt-dlp cache (requires DAZZLO_ADMIN_TOKEN)"""
+    token = os.environ.get('DAZZLO_ADMIN_TOKEN')
+    if not token or request.headers.get('x-admin-token') != token:
+        return Response(status_code=403)
+    section = request.query_params.get('section')
+    invalidated = await run_in_threadpool(default_extractor_cache.invalidate, section)
+    return JSONResponse({'success': True, 'invalidated': invalidated, 'section': section})
+
+
+async def debug_jobs(request):
+    """Job registry size and memory use (requires DAZZLO_ADMIN_TOKEN)"""
+    token = os.environ.get('DAZZLO_ADMIN_TOKEN')
+    if not token or request.headers.get('x-admin-token') != token:
+        return Response(status_code=403)
+    return JSONResponse(await run_in_threadpool(job_manager.memory_report))
+
+
+routes = [
+    Route('/', static_page('index.html')),
+    Route('/download', download, methods=['POST']),
+    Route('/download', static_page('download.html')),
+    Route('/info', video_info),
+    Route('/jobs/{job_id}', job_status, methods=['GET']),
+    Route('/jobs/{job_id}', cancel_job, methods=['DELETE']),
+    Route('/jobs/{job_id}/events', job_events),
+    Route('/jobs/{job_id}/stream', job_stream),
+    Route('/file/{job_id}/{filename}', serve_job_file, methods=['GET', 'HEAD']),
+    Route('/file/{filename}', serve_file, methods=['GET', 'HEAD']),
+    Route('/health', health_check),
+    Route('/cache/extractor', invalidate_extractor_cache, methods=['DELETE']),
+    Route('/debug/jobs', debug_jobs),
+    Route('/about', static_page('about.html')),
+    Route('/pricing', static_page('pricing.html')),
+    Route('/contact', static_page('contact.html')),
+    Route('/terms', static_page('terms.html')),
+    Route('/privacy', static_page('privacy.html')),
+    Mount('/static', app=StaticFiles(directory=STATIC_DIR), name='static'),
+]
+
+app = Starlette(routes=routes)
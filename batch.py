@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Headless batch watermark removal for DazzloGet
+Runs the Visual Watermark Remover's processing on directories or manifests of
+videos, several encodes at once, and writes a JSON report with per-file
+timings. No display needed.
+
+    python batch.py videos/ --preset tiktok --workers 4 --report report.json
+    python batch.py manifest.json --output-dir clean/ --skip-existing
+
+A manifest is a JSON list (or JSON lines) of paths or objects such as
+    {"input": "a.mp4", "regions": [[10, 10, 200, 60]], "preset": "instagram",
+     "detect": true, "crop": false, "enhance": true, "profile": "fast", "output": "a_clean.mp4"}
+optionally wrapped as {"defaults": {...}, "videos": [...]}. Relative paths are
+resolved against the manifest; unset keys fall back to the command line.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from encoding import PROFILES, default_profile_name, get_profile
+from filtergraph import WATERMARK_PRESETS
+from postprocess import PostProcessScheduler
+from removal import OUTPUT_SUFFIXES, VIDEO_EXTS, output_path_for, remove_watermarks
+
+
+def parse_region(text):
+    """'x,y,w,h' -> (x, y, w, h)"""
+    try:
+        values = tuple(int(v) for v in text.split(','))
+    except ValueError:
+        values = ()
+    if len(values) != 4 or min(values) < 0:
+        raise argparse.ArgumentTypeError(f"Region must be x,y,w,h in video pixels, got '{text}'")
+    return values
+
+
+def find_videos(directory, recursive=False):
+    """Video files in directory, sorted, skipping outputs of earlier runs"""
+    found = []
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            stem, ext = os.path.splitext(name)
+            if ext.lower() in VIDEO_EXTS and not stem.endswith(OUTPUT_SUFFIXES):
+                found.append(os.path.join(root, name))
+        if not recursive:
+            break
+    return sorted(found)
+
+
+def load_manifest(path):
+    """Job dicts from a JSON / JSON-lines manifest"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    defaults = {}
+    if isinstance(data, dict):
+        defaults = data.get('defaults', {})
+        data = data.get('videos', [])
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    jobs = []
+    for entry in data:
+        job = dict(defaults)
+        job.update({'input': entry} if isinstance(entry, str) else entry)
+        if 'input' not in job:
+            raise ValueError(f"Manifest entry without 'input': {entry}")
+        job['input'] = os.path.join(base_dir, job['input'])
+        if job.get('output'):
+            job['output'] = os.path.join(base_dir, job['output'])
+        if job.get('regions'):
+            job['regions'] = [tuple(int(v) for v in region) for region in job['regions']]
+        jobs.append(job)
+    return jobs
+
+
+def job_error(job):
+    """Why a job can't run as given (an unknown profile or preset), or None"""
+    if job.get('profile') and job['profile'] not in PROFILES:
+        return f"Unknown encoder profile '{job['profile']}'. Choose from: {', '.join(sorted(PROFILES))}"
+    if job.get('preset') and job['preset'] not in WATERMARK_PRESETS:
+        return f"Unknown preset '{job['preset']}'. Choose from: {', '.join(sorted(WATERMARK_PRESETS))}"
+    return None
+
+
+def collect_jobs(inputs, defaults, recursive=False):
+    """Expand directories, manifests and single files into job dicts
+
+    Jobs that can't run carry the reason in 'error', so run_batch reports
+    them as failed without holding up the rest.
+    """
+    jobs = []
+    for item in inputs:
+        if os.path.isdir(item):
+            # root: outputs mirror the layout below the directory (see output_path_for)
+            jobs += [dict(defaults, input=path, root=item) for path in find_videos(item, recursive)]
+        elif item.lower().endswith(('.json', '.jsonl')):
+            jobs += [dict(defaults, **job) for job in load_manifest(item)]
+        else:
+            jobs.append(dict(defaults, input=item))
+    for job in jobs:
+        error = job_error(job)
+        if error:
+            job['error'] = error
+    return jobs
+
+
+def run_batch(jobs, workers, output_dir=None, skip_existing=False, timeout=0, log=None):
+    """Process jobs with up to workers concurrent encodes; returns the report dict"""
+    scheduler = PostProcessScheduler(max_concurrent=workers, timeout=timeout)
+    started = time.time()
+    report = {
+        'started': datetime.now(timezone.utc).isoformat(),
+        'workers': scheduler.max_concurrent,
+        'threads_per_encode': scheduler.threads_per_encode,
+        'results': [],
+    }
+
+    def output_for(job):
+        return job.get('output') or output_path_for(job['input'], get_profile(job.get('profile')), output_dir,
+                                                    job.get('root'))
+
+    # Two jobs writing one file would overwrite each other mid-encode
+    claimed = {}
+    collisions = {}
+    for job in jobs:
+        if job.get('error'):
+            continue
+        output_path = os.path.abspath(output_for(job))
+        if output_path in claimed:
+            collisions[id(job)] = f"Output {output_path} is also written for {claimed[output_path]}"
+        else:
+            claimed[output_path] = job['input']
+
+    def process(job):
+        message = job.get('error') or collisions.get(id(job))
+        if message:
+            return {'input': job['input'], 'success': False, 'message': message, 'timings': {}}
+        profile = get_profile(job.get('profile'))
+        output_path = output_for(job)
+        if skip_existing and os.path.exists(output_path):
+            return {'input': job['input'], 'output_path': output_path, 'success': True,
+                    'skipped': True, 'message': 'Output already exists', 'timings': {}}
+        os.makedirs(os.path.dirname(output_path) or os.curdir, exist_ok=True)
+        return remove_watermarks(
+            job['input'], job.get('regions') or (), output_path,
+            crop=job.get('crop', True), enhance=job.get('enhance', True), preset=job.get('preset'),
+            detect=job.get('detect', False), profile=profile.name, scheduler=scheduler)
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    # One thread per encode slot, so per-file timings never include time spent queued
+    with ThreadPoolExecutor(max_workers=scheduler.max_concurrent, thread_name_prefix='dazzlo-batch') as executor:
+        futures = {executor.submit(process, job): job for job in jobs}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'input': futures[future]['input'], 'success': False, 'message': str(e), 'timings': {}}
+            report['results'].append(result)
+            if log:
+                mark = '⏭️' if result.get('skipped') else '✅' if result['success'] else '❌'
+                seconds = result['timings'].get('total', 0)
+                log(f"{mark} [{done}/{len(jobs)}] {os.path.basename(result['input'])} ({seconds}s)"
+                    + ('' if result['success'] else f": {result['message']}"))
+
+    wall = time.time() - started
+    results = report['results']
+    results.sort(key=lambda r: r['input'])
+    busy = sum(r['timings'].get('total', 0) for r in results)
+    report.update({
+        'wall_seconds': round(wall, 3),
+        'files': len(results),
+        'succeeded': sum(1 for r in results if r['success'] and not r.get('skipped')),
+        'skipped': sum(1 for r in results if r.get('skipped')),
+        'failed': sum(1 for r in results if not r['success']),
+        'encode_seconds': round(sum(r['timings'].get('encode', 0) for r in results), 3),
+        # Summed per-file time over wall time: files in flight on average
+        'average_concurrency': round(busy / wall, 2) if wall else None,
+        'scheduler': scheduler.stats(),
+    })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Remove watermarks from many videos without the GUI')
+    parser.add_argument('inputs', nargs='+', help='video files, directories or .json/.jsonl manifests')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 2),
+                        help='concurrent encodes (default: half the CPUs)')
+    parser.add_argument('--output-dir', help='write outputs here instead of next to the inputs, mirroring the input folders')
+    parser.add_argument('--region', action='append', type=parse_region, default=[], metavar='X,Y,W,H',
+                        help='area to paint out, in video pixels (repeatable)')
+    parser.add_argument('--preset', choices=sorted(WATERMARK_PRESETS), help='platform watermark preset')
+    parser.add_argument('--detect', action='store_true', help='also paint out auto-detected static overlays')
+    parser.add_argument('--no-crop', action='store_true', help="don't crop the borders")
+    parser.add_argument('--no-enhance', action='store_true', help="don't sharpen")
+    parser.add_argument('--profile', choices=sorted(PROFILES), default=default_profile_name(),
+                        help='encoder profile')
+    parser.add_argument('--recursive', action='store_true', help='descend into subdirectories')
+    parser.add_argument('--skip-existing', action='store_true', help='leave videos whose output exists')
+    parser.add_argument('--timeout', type=float, default=0,
+                        help='seconds per encode, 0 for none (stalled encodes are always killed)')
+    parser.add_argument('--report', help='write the JSON report here (default: stdout)')
+    args = parser.parse_args()
+
+    defaults = {
+        'regions': args.region,
+        'preset': args.preset,
+        'detect': args.detect,
+        'crop': not args.no_crop,
+        'enhance': not args.no_enhance,
+        'profile': args.profile,
+    }
+    try:
+        jobs = collect_jobs(args.inputs, defaults, args.recursive)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    if not jobs:
+        print("❌ No videos found", file=sys.stderr)
+        return 2
+
+    def log(line):
+        print(line, file=sys.stderr, flush=True)
+
+    log(f"🎬 Processing {len(jobs)} video(s) with {args.workers} worker(s)")
+    report = run_batch(jobs, args.workers, args.output_dir, args.skip_existing, args.timeout, log)
+    log(f"🏁 {report['succeeded']} done, {report['skipped']} skipped, {report['failed']} failed "
+        f"in {report['wall_seconds']}s")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 1 if report['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
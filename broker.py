@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Job brokers for DazzloGet's distributed mode
+With DAZZLO_BROKER set, web processes stop running downloads themselves:
+they record the job in the job store, publish a task here and return, and
+worker processes (worker.py) reserve tasks, run them and acknowledge them.
+Web and worker nodes then scale independently; they share the job store
+and the download folder.
+
+A reserved task is leased to its worker for a while. Workers extend the
+lease as long as the job runs; if a worker dies its leases run out and the
+task is handed to another worker.
+
+    sqlite:///var/lib/dazzlo/broker.sqlite3   (sqlite:// alone: broker.sqlite3 in the download folder)
+    redis://[:password@]host:6379/0           (anything speaking the Redis protocol)
+Other backends plug in with register_broker(scheme, factory).
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from urllib.parse import unquote, urlparse
+from jobstore import Transaction
+from postprocess import PRIORITY_NORMAL
+
+# How long a reserved task stays with its worker without an extend() (seconds)
+LEASE_SECONDS = 120
+
+# Sleep between polls of an empty queue
+POLL_INTERVAL = 0.5
+
+
+class Delivery:
+    """A task reserved by a worker: what to run and the lease to ack or release"""
+
+    def __init__(self, task_id, task, consumer, deliveries):
+        self.id = task_id
+        self.task = task
+        self.consumer = consumer
+        # 1 on first delivery; more means earlier workers died or let go of it
+        self.deliveries = deliveries
+
+
+class Broker(ABC):
+    """Interface every broker backend implements
+
+    Tasks are JSON-serialisable dicts; lower priority values are handed out first.
+    """
+
+    @abstractmethod
+    def publish(self, task, priority=PRIORITY_NORMAL):
+        """Queue a task"""
+
+    @abstractmethod
+    def reserve(self, consumer, lease=LEASE_SECONDS, timeout=0):
+        """Lease the next task to consumer, waiting up to timeout seconds; a Delivery or None"""
+
+    @abstractmethod
+    def extend(self, delivery, lease=LEASE_SECONDS):
+        """Keep a delivery leased for another lease seconds; False if it was lost"""
+
+    @abstractmethod
+    def ack(self, delivery):
+        """The task is done: remove it for good"""
+
+    @abstractmethod
+    def release(self, delivery):
+        """Hand a task back unprocessed so another worker picks it up at once"""
+
+    @abstractmethod
+    def stats(self):
+        """Backend name and queue sizes for /health"""
+
+    def _wait(self, reserve_once, timeout):
+        deadline = time.time() + (timeout or 0)
+        while True:
+            delivery = reserve_once()
+            remaining = deadline - time.time()
+            if delivery is not None or remaining <= 0:
+                return delivery
+            time.sleep(min(POLL_INTERVAL, remaining))
+
+
+class SQLiteBroker(Broker):
+    """Task queue in a SQLite database in WAL mode; needs no extra service
+
+    Every web and worker process must see the same file, so this suits one
+    machine or a shared volume with working locks.
+    """
+
+    def __init__(self, path, busy_timeout=10.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._write() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    consumer TEXT,
+                    lease_expires REAL NOT NULL DEFAULT 0,
+                    deliveries INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL
+                )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (lease_expires, priority, id)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _write(self):
+        return Transaction(self._conn())
+
+    def publish(self, task, priority=PRIORITY_NORMAL):
+        with self._write() as conn:
+            conn.execute('INSERT INTO tasks (task, priority, created_at) VALUES (?, ?, ?)',
+                         (json.dumps(task), priority, time.time()))
+
+    def reserve(self, consumer, lease=LEASE_SECONDS, timeout=0):
+        return self._wait(lambda: self._reserve_once(consumer, lease), timeout)
+
+    def _reserve_once(self, consumer, lease):
+        now = time.time()
+        # Unleased tasks have lease_expires 0, so one range covers new and abandoned ones
+        with self._write() as conn:
+            row = conn.execute('SELECT id, task, deliveries FROM tasks WHERE lease_expires < ? '
+                               'ORDER BY priority, id LIMIT 1', (now,)).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE tasks SET consumer = ?, lease_expires = ?, deliveries = deliveries + 1 '
+                         'WHERE id = ?', (consumer, now + lease, row[0]))
+        return Delivery(row[0], json.loads(row[1]), consumer, row[2] + 1)
+
+    def extend(self, delivery, lease=LEASE_SECONDS):
+        with self._write() as conn:
+            cursor = conn.execute('UPDATE tasks SET lease_expires = ? WHERE id = ? AND consumer = ?',
+                                  (time.time() + lease, delivery.id, delivery.consumer))
+        return cursor.rowcount == 1
+
+    def ack(self, delivery):
+        with self._write() as conn:
+            conn.execute('DELETE FROM tasks WHERE id = ? AND consumer = ?', (delivery.id, delivery.consumer))
+
+    def release(self, delivery):
+        with self._write() as conn:
+            conn.execute('UPDATE tasks SET consumer = NULL, lease_expires = 0 WHERE id = ? AND consumer = ?',
+                         (delivery.id, delivery.consumer))
+
+    def stats(self):
+        queued, leased = self._conn().execute(
+            'SELECT COALESCE(SUM(lease_expires < ?), 0), COALESCE(SUM(lease_expires >= ?), 0) FROM tasks',
+            (time.time(),) * 2).fetchone()
+        return {'backend': 'sqlite', 'path': self.path, 'queued': queued, 'leased': leased}
+
+
+class RedisError(Exception):
+    """Error reply from the Redis server"""
+
+
+class RedisConnection:
+    """Minimal Redis protocol (RESP2) client: one socket, one command at a time
+
+    Enough for the broker, without requiring the redis package; works with
+    Redis, Valkey, KeyDB and other servers that speak the protocol.
+    """
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None, username=None, timeout=10.0):
+        self.address = (host, port)
+        self.db = db
+        self.password = password
+        self.username = username
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self._sock = socket.create_connection(self.address, timeout=self.timeout)
+        self._file = self._sock.makefile('rb')
+        if self.password:
+            self._send(['AUTH', self.username, self.password] if self.username else ['AUTH', self.password])
+        if self.db:
+            self._send(['SELECT', self.db])
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._file.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = self._file = None
+
+    def execute(self, *args):
+        """Send one command and return its reply; reconnects once on a dropped connection"""
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._send(args)
+                except (ConnectionError, socket.timeout, OSError):
+                    self.close()
+                    if attempt == 2:
+                        raise
+
+    def _send(self, args):
+        payload = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            payload.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        self._sock.sendall(b''.join(payload))
+        return self._read()
+
+    def _read(self):
+        line = self._file.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError('Connection closed by Redis server')
+        kind, value = line[:1], line[1:-2]
+        if kind == b'+':
+            return value.decode('utf-8')
+        if kind == b'-':
+            raise RedisError(value.decode('utf-8', 'replace'))
+        if kind == b':':
+            return int(value)
+        if kind == b'$':
+            if int(value) < 0:
+                return None
+            data = self._file.read(int(value) + 2)
+            return data[:-2].decode('utf-8')
+        if kind == b'*':
+            if int(value) < 0:
+                return None
+            return [self._read() for _ in range(int(value))]
+        raise ConnectionError(f'Unexpected reply from Redis server: {line[:40]!r}')
+
+
+class RedisBroker(Broker):
+    """Task queue in Redis, shared by any number of hosts
+
+    One list per priority holds waiting task ids, a hash per task holds its
+    body, and a sorted set scores leased ids by expiry. Only plain list,
+    hash and sorted-set commands are used.
+    """
+
+    # Seconds between scans for leased ids that never got a lease
+    ORPHAN_CHECK_INTERVAL = 30
+
+    def __init__(self, connection, prefix='dazzlo'):
+        self.redis = connection
+        self.prefix = prefix
+        self._orphans_checked = 0
+
+    @classmethod
+    def from_url(cls, location):
+        url = urlparse(f'redis://{location}')
+        db = (url.path or '/').strip('/')
+        connection = RedisConnection(url.hostname or 'localhost', url.port or 6379, int(db or 0),
+                                     unquote(url.password) if url.password else None,
+                                     unquote(url.username) if url.username else None)
+        return cls(connection)
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix,) + parts)
+
+    def _queue(self, priority):
+        return self._key('queue', str(priority))
+
+    def publish(self, task, priority=PRIORITY_NORMAL):
+        task_id = str(self.redis.execute('INCR', self._key('task-id')))
+        self.redis.execute('HSET', self._key('task', task_id), 'task', json.dumps(task),
+                           'priority', priority, 'deliveries', 0)
+        self.redis.execute('ZADD', self._key('priorities'), priority, priority)
+        self.redis.execute('LPUSH', self._queue(priority), task_id)
+
+    def reserve(self, consumer, lease=LEASE_SECONDS, timeout=0):
+        return self._wait(lambda: self._reserve_once(consumer, lease), timeout)
+
+    def _reserve_once(self, consumer, lease):
+        if time.time() - self._orphans_checked >= self.ORPHAN_CHECK_INTERVAL:
+            self._orphans_checked = time.time()
+            self._lease_orphans(lease)
+        self._requeue_expired()
+        for priority in self.redis.execute('ZRANGE', self._key('priorities'), 0, -1):
+            task_id = self.redis.execute('RPOPLPUSH', self._queue(priority), self._key('leased'))
+            if task_id is None:
+                continue
+            self.redis.execute('ZADD', self._key('leases'), time.time() + lease, task_id)
+            key = self._key('task', task_id)
+            deliveries = self.redis.execute('HINCRBY', key, 'deliveries', 1)
+            self.redis.execute('HSET', key, 'consumer', consumer)
+            body = self.redis.execute('HGET', key, 'task')
+            if body is None:
+                # Acked while it was being handed back; nothing left to run
+                self._forget(task_id)
+                continue
+            return Delivery(task_id, json.loads(body), consumer, deliveries)
+        return None
+
+    def _lease_orphans(self, lease):
+        """Lease ids left in the leased list by a worker that died between RPOPLPUSH and
+        ZADD, so they are requeued like any other expired lease"""
+        leased = self.redis.execute('LRANGE', self._key('leased'), 0, -1)
+        if not leased:
+            return
+        with_lease = set(self.redis.execute('ZRANGE', self._key('leases'), 0, -1))
+        for task_id in leased:
+            if task_id not in with_lease:
+                # NX: a reserve merely between its two writes still sets its own lease, overriding this one
+                self.redis.execute('ZADD', self._key('leases'), 'NX', time.time() + lease, task_id)
+
+    def _requeue_expired(self):
+        """Put tasks whose worker stopped extending back in their queue"""
+        for task_id in self.redis.execute('ZRANGEBYSCORE', self._key('leases'), '-inf', time.time()):
+            # Whoever removes the lease does the requeue, so a task is never queued twice
+            if self.redis.execute('ZREM', self._key('leases'), task_id):
+                self._requeue(task_id)
+
+    def _requeue(self, task_id):
+        priority = self.redis.execute('HGET', self._key('task', task_id), 'priority')
+        self.redis.execute('LREM', self._key('leased'), 1, task_id)
+        if priority is not None:
+            # The right end is served next
+            self.redis.execute('RPUSH', self._queue(priority), task_id)
+
+    def _owns(self, delivery):
+        return self.redis.execute('HGET', self._key('task', delivery.id), 'consumer') == delivery.consumer
+
+    def extend(self, delivery, lease=LEASE_SECONDS):
+        if not self._owns(delivery):
+            return False
+        # XX: only while still leased; an expired lease may already be queued again
+        return self.redis.execute('ZADD', self._key('leases'), 'XX', 'CH', time.time() + lease, delivery.id) == 1
+
+    def ack(self, delivery):
+        if self._owns(delivery):
+            self._forget(delivery.id)
+
+    def _forget(self, task_id):
+        self.redis.execute('ZREM', self._key('leases'), task_id)
+        self.redis.execute('LREM', self._key('leased'), 1, task_id)
+        self.redis.execute('DEL', self._key('task', task_id))
+
+    def release(self, delivery):
+        if self._owns(delivery) and self.redis.execute('ZREM', self._key('leases'), delivery.id):
+            self.redis.execute('HDEL', self._key('task', delivery.id), 'consumer')
+            self._requeue(delivery.id)
+
+    def stats(self):
+        queued = sum(self.redis.execute('LLEN', self._queue(priority))
+                     for priority in self.redis.execute('ZRANGE', self._key('priorities'), 0, -1))
+        host, port = self.redis.address
+        return {'backend': 'redis', 'server': f'{host}:{port}', 'queued': queued,
+                'leased': self.redis.execute('ZCARD', self._key('leases'))}
+
+
+BROKERS = {}
+
+
+def register_broker(scheme, factory):
+    """Make factory(location, default_path) available as DAZZLO_BROKER=<scheme>://<location>"""
+    BROKERS[scheme] = factory
+
+
+def _sqlite_broker(location, default_path):
+    if not (location or default_path):
+        raise ValueError('DAZZLO_BROKER=sqlite:// needs a path here')
+    return SQLiteBroker(location or default_path)
+
+
+register_broker('sqlite', _sqlite_broker)
+register_broker('redis', lambda location, default_path: RedisBroker.from_url(location))
+
+
+def open_broker(url=None, default_path=None):
+    """Build the broker named by url (or DAZZLO_BROKER); None means jobs run in the web process"""
+    url = url or os.environ.get('DAZZLO_BROKER')
+    if not url:
+        return None
+    scheme, sep, location = url.partition('://')
+    if not sep:
+        # A bare path means SQLite
+        return SQLiteBroker(url)
+    if scheme not in BROKERS:
+        raise ValueError(f"Unknown broker '{scheme}'. Choose from: {', '.join(sorted(BROKERS))}")
+    return BROKERS[scheme](location, default_path)
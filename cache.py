@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Caches for DazzloGet
+ResultCache maps a canonical video (extractor + id + format + processing
+options) to a finished output file so repeated requests skip the download
+and re-encode; InfoCache keeps recent extract_info results in memory and
+ProbeCache keeps ffprobe results per local file.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from storage import moved_path
+
+INDEX_FILENAME = '.dazzlo-cache.json'
+
+
+def make_cache_key(info, options=None):
+    """Build a cache key from a yt-dlp info dict and the processing options"""
+    if not info or info.get('_type') == 'playlist' or 'entries' in info or not info.get('id'):
+        return None
+    key_data = {
+        'extractor': info.get('extractor_key') or info.get('extractor'),
+        'id': info.get('id'),
+        'format': info.get('format_id'),
+        'options': options or {},
+    }
+    if key_data['extractor'] == 'Generic':
+        # The generic extractor's id is just the file name, shared by unrelated hosts
+        key_data['url'] = info.get('webpage_url') or info.get('original_url') or info.get('url')
+    raw = json.dumps(key_data, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """On-disk index of finished downloads with TTL and size-bounded LRU eviction"""
+
+    def __init__(self, root, max_bytes=None, ttl=None):
+        if max_bytes is None:
+            max_bytes = int(os.environ.get('DAZZLO_CACHE_MAX_BYTES', str(10 * 1024 ** 3)))
+        if ttl is None:
+            ttl = float(os.environ.get('DAZZLO_CACHE_TTL', str(24 * 3600)))
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.index_path = os.path.join(root, INDEX_FILENAME)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = {}
+        self._index_mtime = None
+        self._lock = threading.Lock()
+        with self._lock:
+            self._load()
+
+    def get(self, key):
+        """Return the cached entry for key, or None on a miss"""
+        if not key:
+            return None
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry and not self._expired(entry) and os.path.isfile(entry['path']):
+                entry['last_access'] = time.time()
+                entry['hits'] = entry.get('hits', 0) + 1
+                self.hits += 1
+                self._save()
+                return dict(entry)
+            if entry:
+                # Stale or missing on disk
+                self._entries.pop(key, None)
+                self._save()
+            self.misses += 1
+            return None
+
+    def put(self, key, path, metadata=None):
+        """Record a finished output file under key"""
+        if not key or not os.path.isfile(path):
+            return
+        now = time.time()
+        entry = {
+            'path': path,
+            'size': os.path.getsize(path),
+            'created': now,
+            'last_access': now,
+            'hits': 0,
+        }
+        if metadata:
+            entry.update(metadata)
+        with self._lock:
+            self._load()
+            self._entries[key] = entry
+            self._evict()
+            self._save()
+
+    def invalidate(self, key=None):
+        """Forget one entry, or the whole index when key is None (files are kept)"""
+        with self._lock:
+            self._load()
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+            self._save()
+
+    def relocate(self, moves):
+        """Follow outputs that moved (see storage.moved_path)"""
+        with self._lock:
+            self._load()
+            changed = False
+            for entry in self._entries.values():
+                path = moved_path(entry['path'], moves)
+                if path != entry['path']:
+                    entry['path'] = path
+                    changed = True
+            if changed:
+                self._save()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': sum(e['size'] for e in self._entries.values()),
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+            }
+
+    def _expired(self, entry):
+        return self.ttl > 0 and time.time() - entry['created'] > self.ttl
+
+    def _evict(self):
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        for key in [k for k, e in self._entries.items() if self._expired(e)]:
+            self._remove(key)
+        total = sum(e['size'] for e in self._entries.values())
+        for key in sorted(self._entries, key=lambda k: self._entries[k]['last_access']):
+            if total <= self.max_bytes:
+                break
+            total -= self._entries[key]['size']
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.evictions += 1
+        try:
+            os.remove(entry['path'])
+            print(f"🧹 Evicted cached file: {os.path.basename(entry['path'])}")
+        except OSError:
+            pass
+
+    def _load(self):
+        """Reload the index if another process has rewritten it"""
+        try:
+            mtime = os.path.getmtime(self.index_path)
+        except OSError:
+            return
+        if mtime == self._index_mtime:
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+            self._index_mtime = mtime
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read cache index: {e}")
+
+    def _save(self):
+        """Atomically rewrite the on-disk index"""
+        tmp_path = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.index_path)
+            self._index_mtime = os.path.getmtime(self.index_path)
+        except OSError as e:
+            print(f"⚠️ Could not write cache index: {e}")
+
+
+class InfoCache:
+    """In-memory TTL cache of yt-dlp info dicts keyed by URL"""
+
+    def __init__(self, ttl=None, max_entries=512):
+        if ttl is None:
+            ttl = float(os.environ.get('DAZZLO_INFO_TTL', '600'))
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """Return a private copy of the cached info for url, or None"""
+        with self._lock:
+            item = self._entries.get(url)
+            if item and time.time() - item[0] <= self.ttl:
+                self._entries.move_to_end(url)
+                self.hits += 1
+                info = item[1]
+            else:
+                if item:
+                    del self._entries[url]
+                self.misses += 1
+                return None
+        # yt-dlp mutates info dicts while downloading
+        return copy.deepcopy(info)
+
+    def put(self, url, info):
+        if not info:
+            return
+        try:
+            info = copy.deepcopy(info)
+        except Exception:
+            return  # Some extractors return objects that cannot be copied
+        with self._lock:
+            self._entries[url] = (time.time(), info)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+class ProbeCache:
+    """In-memory LRU of ffprobe results keyed by file identity (path, size, mtime)"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(path):
+        """Identity of the file's current contents, or None if it is missing"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(self._entries[key])
+            self.misses += 1
+            return None
+
+    def put(self, key, media):
+        if key is None or media is None:
+            return
+        with self._lock:
+            self._entries[key] = copy.deepcopy(media)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+            }
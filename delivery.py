@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Media file delivery for DazzloGet
+Serves downloads with HTTP Range / ETag support and without buffering whole
+files in Python: the WSGI server's file wrapper (os.sendfile under gunicorn)
+does the copying, or a front proxy does via X-Accel-Redirect / X-Sendfile.
+"""
+
+import os
+import stat
+import time
+import urllib.parse
+from flask import Response, abort
+from werkzeug.http import parse_etags, parse_if_range_header, parse_range_header
+from werkzeug.wsgi import ClosingIterator
+
+CHUNK_SIZE = 256 * 1024
+
+MIME_TYPES = {
+    '.mp4': 'video/mp4',
+    '.mkv': 'video/x-matroska',
+    '.webm': 'video/webm',
+    '.mov': 'video/quicktime',
+    '.avi': 'video/x-msvideo',
+    '.flv': 'video/x-flv',
+    '.m4v': 'video/mp4'
+}
+
+# 'nginx' -> X-Accel-Redirect, 'apache'/'lighttpd' -> X-Sendfile, unset -> serve here
+SENDFILE_MODE = os.environ.get('DAZZLO_SENDFILE', '').lower()
+# Internal nginx location that maps onto the download directory
+ACCEL_PREFIX = os.environ.get('DAZZLO_ACCEL_PREFIX', '/protected-downloads/')
+
+
+def guess_mimetype(filename):
+    return MIME_TYPES.get(os.path.splitext(filename)[1].lower(), 'application/octet-stream')
+
+
+def content_disposition(filename):
+    """Attachment header that survives non-ASCII titles"""
+    ascii_name = filename.encode('ascii', 'ignore').decode('ascii').replace('"', '') or 'download'
+    quoted = urllib.parse.quote(filename)
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quoted}"
+
+
+def make_etag(st):
+    """Cheap validator from inode, size and mtime (no hashing of content)"""
+    return f"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"
+
+
+def offload_headers(file_path, root=None):
+    """Headers that make the front proxy send the file, or None to serve it here"""
+    if SENDFILE_MODE == 'nginx' and root:
+        rel_path = os.path.relpath(file_path, root).replace(os.sep, '/')
+        return {'X-Accel-Redirect': ACCEL_PREFIX.rstrip('/') + '/' + urllib.parse.quote(rel_path)}
+    if SENDFILE_MODE in ('apache', 'lighttpd'):
+        return {'X-Sendfile': os.path.abspath(file_path)}
+    return None
+
+
+class _ReleasingFile:
+    """File object that runs release once when closed, for wsgi.file_wrapper"""
+
+    def __init__(self, f, release):
+        self._f = f
+        self._release = release
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def close(self):
+        try:
+            self._f.close()
+        finally:
+            release, self._release = self._release, None
+            if release:
+                release()
+
+
+def _read_range(f, start, length):
+    """Yield length bytes from f starting at start, then close it"""
+    try:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def resolve_range(range_header, if_range_header, size, etag):
+    """Return (start, stop) for a satisfiable single Range, None for a full
+    response, or False when the range cannot be satisfied"""
+    requested = parse_range_header(range_header)
+    if requested is None or requested.units != 'bytes':
+        return None
+    if len(requested.ranges) != 1:
+        return None  # Multipart ranges are not worth it for media; send everything
+    if if_range_header:
+        if_range = parse_if_range_header(if_range_header)
+        if if_range.date is not None or if_range.etag != etag:
+            return None  # Only a matching strong ETag keeps the Range
+    byte_range = requested.range_for_length(size)
+    return byte_range if byte_range else False
+
+
+def etag_matches(if_none_match_header, etag):
+    return bool(if_none_match_header) and parse_etags(if_none_match_header).contains(etag)
+
+
+def serve_media(request, file_path, download_name, root=None, pin=None):
+    """Build the response for a media file (404 when missing or empty)
+
+    root is the directory X-Accel-Redirect paths are computed relative to.
+    pin(file_path), if given, is called once the file is found and returns
+    the callable to run when the response is done with it.
+    """
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        abort(404)
+    if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+        abort(404)
+
+    size = st.st_size
+    etag = make_etag(st)
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Content-Disposition': content_disposition(download_name),
+        'Cache-Control': 'private, max-age=3600',
+    }
+    mimetype = guess_mimetype(download_name)
+    release = pin(file_path) if pin else None
+
+    def finish(response):
+        response.set_etag(etag)
+        response.last_modified = st.st_mtime
+        # Passthrough bodies skip Response.close(); they release the pin themselves
+        if release and not response.direct_passthrough:
+            response.call_on_close(release)
+        return response
+
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return finish(Response(status=304, headers=headers))
+
+    # Hand the transfer to the front proxy; it handles Range itself
+    offload = offload_headers(file_path, root)
+    if offload:
+        headers.update(offload)
+        return finish(Response(status=200, mimetype=mimetype, headers=headers))
+
+    byte_range = resolve_range(request.headers.get('Range'), request.headers.get('If-Range'), size, etag)
+    if byte_range is False:
+        headers['Content-Range'] = f'bytes */{size}'
+        return finish(Response(status=416, headers=headers))
+
+    start, stop = byte_range or (0, size)
+    length = stop - start
+    if byte_range:
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+    headers['Content-Length'] = str(length)
+    status = 206 if byte_range else 200
+
+    if request.method == 'HEAD':
+        return finish(Response(status=status, mimetype=mimetype, headers=headers))
+
+    try:
+        f = open(file_path, 'rb')
+    except OSError:
+        if release:
+            release()
+        abort(404)
+    if release:
+        f = _ReleasingFile(f, release)
+    f.seek(start)
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    # gunicorn's wrapper sends exactly Content-Length bytes with os.sendfile;
+    # other servers' wrappers may read to EOF, so only trust them for whole files
+    server = request.environ.get('SERVER_SOFTWARE', '')
+    if file_wrapper and (not byte_range or server.startswith('gunicorn')):
+        body = file_wrapper(f, CHUNK_SIZE)
+    else:
+        # A generator closed before its first chunk never runs its finally
+        body = ClosingIterator(_read_range(f, start, length), f.close)
+
+    response = Response(body, status=status, mimetype=mimetype, headers=headers, direct_passthrough=True)
+    return finish(response)
+
+
+class StreamAborted(Exception):
+    """Cuts a live stream short once its headers are out
+
+    The server drops the connection without ending the body, so the client
+    sees a failed transfer rather than a truncated file that looks complete.
+    """
+
+
+def open_growing_file(job, path):
+    """Open the file yt-dlp is writing, wherever it is by now, or None"""
+    candidates = [path, job.partial_path]
+    if path.endswith('.part'):
+        # Renamed from .part to its final name between the check and the open
+        candidates.insert(1, path[:-len('.part')])
+    for candidate in candidates:
+        try:
+            return open(candidate, 'rb')
+        except OSError:
+            continue
+    return None
+
+
+def download_failed(job):
+    """Whether the job ended without producing its file (failed or cancelled)"""
+    return job.done and not (job.result or {}).get('success')
+
+
+def _follow_growing_file(job, f):
+    """Yield bytes from a file yt-dlp is still writing until its download ends"""
+    last_event = job.last_event_id
+    try:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if chunk:
+                yield chunk
+                continue
+            download_over = job.done or job.progress.get('status') == 'finished'
+            if download_over:
+                # Writer has finished; drain anything written since the last read
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+                if download_failed(job):
+                    raise StreamAborted(f"Job {job.id} failed after {f.tell()} bytes: {job.message}")
+                return
+            # Wait for the next progress event instead of spinning
+            job.events_since(last_event, timeout=1)
+            last_event = job.last_event_id
+    except OSError as e:
+        raise StreamAborted(f"Job {job.id}: {e}") from e
+    finally:
+        f.close()
+
+
+def stream_job_file(request, job, wait_timeout=30, root=None, pin=None):
+    """Stream a job's output while it is still downloading
+
+    Falls back to a normal (Range-capable) response once the job has finished;
+    root and pin are passed on to serve_media for it. Returns None if nothing
+    is available to stream within wait_timeout. If the job fails mid-stream
+    the body ends with StreamAborted instead of completing.
+    """
+    deadline = time.time() + wait_timeout
+    last_event = 0
+    while not job.done and not job.partial_path and time.time() < deadline:
+        job.events_since(last_event, timeout=1)
+        last_event = job.last_event_id
+
+    if job.done:
+        result = job.result or {}
+        if result.get('success') and result.get('file_path'):
+            return serve_media(request, result['file_path'], result['filename'], root=root, pin=pin)
+        return None
+    if not job.partial_path:
+        return None
+
+    path = job.partial_path
+    f = open_growing_file(job, path)
+    if f is None:
+        # The job's directory was cleaned up; it failed or is about to
+        return None
+    final_name = os.path.basename(path)
+    if final_name.endswith('.part'):
+        final_name = final_name[:-len('.part')]
+    headers = {
+        'Content-Disposition': content_disposition(final_name),
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no',
+    }
+    # A generator closed before its first chunk never runs its finally
+    body = ClosingIterator(_follow_growing_file(job, f), f.close)
+    return Response(body, mimetype=guess_mimetype(final_name), headers=headers, direct_passthrough=True)
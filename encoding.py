@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Encoder profiles for DazzloGet
+Named speed/quality trade-offs for every ffmpeg re-encode, so a deployment can
+run 'fast' under peak load and 'archive' overnight without touching the code.
+
+Select the default with DAZZLO_ENCODE_PROFILE and add or override profiles
+with a JSON file named by DAZZLO_ENCODE_PROFILES_FILE, e.g.
+    {"peak": {"preset": "superfast", "crf": 24, "audio": "aac", "audio_bitrate": "128k"}}
+
+Benchmark the profiles on a reference clip with:
+    python encoding.py --benchmark [clip.mp4] [--json]
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_PROFILE_NAME = 'balanced'
+
+
+class EncoderProfile:
+    """One libx264 encoding configuration"""
+
+    def __init__(self, name, preset='medium', crf=18, threads=None, tune=None, audio='copy',
+                 audio_bitrate=None, container='mp4', description=''):
+        self.name = name
+        self.preset = preset
+        self.crf = crf
+        self.threads = threads
+        self.tune = tune
+        self.audio = audio
+        self.audio_bitrate = audio_bitrate
+        self.container = container
+        self.description = description
+
+    def video_args(self, threads=None, limits=None):
+        """ffmpeg video encoder arguments; threads overrides an unset profile value
+
+        limits are source-derived extras such as filtergraph.encode_limits().
+        """
+        args = ['-c:v', 'libx264', '-crf', str(self.crf), '-preset', self.preset]
+        if self.tune:
+            args += ['-tune', self.tune]
+        threads = self.threads or threads
+        if threads:
+            args += ['-threads', str(threads)]
+        return args + list(limits or ())
+
+    def audio_args(self):
+        """'copy' keeps the source audio, 'none' drops it, anything else is an encoder name"""
+        if self.audio == 'none':
+            return ['-an']
+        args = ['-c:a', self.audio]
+        if self.audio != 'copy' and self.audio_bitrate:
+            args += ['-b:a', self.audio_bitrate]
+        return args
+
+    def output_args(self, threads=None, limits=None):
+        """Everything that goes between the filter graph and the output path"""
+        args = self.video_args(threads, limits) + self.audio_args()
+        if self.container in ('mp4', 'mov'):
+            # Moov atom up front so players can start before the file is complete
+            args += ['-movflags', '+faststart']
+        return args
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'preset': self.preset,
+            'crf': self.crf,
+            'threads': self.threads,
+            'tune': self.tune,
+            'audio': self.audio,
+            'audio_bitrate': self.audio_bitrate,
+            'container': self.container,
+            'description': self.description,
+        }
+
+
+PROFILES = {}
+
+
+def register_profile(profile):
+    """Add or replace a profile in the registry"""
+    PROFILES[profile.name] = profile
+    return profile
+
+
+register_profile(EncoderProfile('fast', preset='veryfast', crf=23,
+                                description='Peak-load throughput; visibly softer on detailed scenes'))
+register_profile(EncoderProfile('balanced', preset='medium', crf=18,
+                                description='Default; near-transparent quality'))
+register_profile(EncoderProfile('archive', preset='slow', crf=16,
+                                description='Overnight batches; best quality per bit, slowest'))
+
+
+def load_profiles(path):
+    """Register profiles from a JSON object of name -> settings"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    for name, settings in data.items():
+        register_profile(EncoderProfile(name, **settings))
+
+
+def default_profile_name():
+    return os.environ.get('DAZZLO_ENCODE_PROFILE', DEFAULT_PROFILE_NAME)
+
+
+def get_profile(name=None):
+    """Look up a profile by name (None means the deployment default)
+
+    An EncoderProfile instance is returned as is, for one-off profiles.
+    """
+    if isinstance(name, EncoderProfile):
+        return name
+    name = name or default_profile_name()
+    if name not in PROFILES:
+        raise ValueError(f"Unknown encoder profile '{name}'. Choose from: {', '.join(sorted(PROFILES))}")
+    return PROFILES[name]
+
+
+if os.environ.get('DAZZLO_ENCODE_PROFILES_FILE'):
+    try:
+        load_profiles(os.environ['DAZZLO_ENCODE_PROFILES_FILE'])
+    except (OSError, ValueError, TypeError) as e:
+        print(f"⚠️ Could not load encoder profiles: {e}")
+
+
+def make_reference_clip(path, seconds=10):
+    """Synthesise a detailed 720p30 clip with audio to benchmark against"""
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', 'testsrc2=size=1280x720:rate=30',
+        '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100',
+        '-t', str(seconds), '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '10',
+        '-c:a', 'aac', '-shortest', '-y', path
+    ]
+    subprocess.run(cmd, check=True)
+    return path
+
+
+def benchmark(reference, profile_names=None, video_filter=None):
+    """Encode reference with each profile; returns a list of result dicts"""
+    results = []
+    source_size = os.path.getsize(reference)
+    with tempfile.TemporaryDirectory(prefix='dazzlo-bench-') as tmp:
+        for name in profile_names or sorted(PROFILES):
+            profile = get_profile(name)
+            output_path = os.path.join(tmp, f'{name}.{profile.container}')
+            cmd = ['ffmpeg', '-hide_banner', '-nostdin', '-i', reference]
+            if video_filter:
+                cmd += ['-vf', video_filter]
+            cmd += profile.output_args() + ['-y', output_path]
+
+            started = time.time()
+            result = subprocess.run(cmd, capture_output=True, text=True, errors='replace')
+            elapsed = time.time() - started
+
+            frames = re.findall(r'frame=\s*(\d+)', result.stderr or '')
+            frame_count = int(frames[-1]) if frames else 0
+            ok = result.returncode == 0 and os.path.exists(output_path)
+            size = os.path.getsize(output_path) if ok else None
+            results.append({
+                'profile': name,
+                'preset': profile.preset,
+                'crf': profile.crf,
+                'success': ok,
+                'seconds': round(elapsed, 2),
+                'frames': frame_count,
+                'fps': round(frame_count / elapsed, 1) if ok and elapsed else None,
+                'size': size,
+                'size_ratio': round(size / source_size, 3) if size else None,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DazzloGet encoder profiles')
+    parser.add_argument('--benchmark', nargs='?', const='', metavar='CLIP',
+                        help='benchmark profiles on CLIP (a synthetic 720p clip if omitted)')
+    parser.add_argument('--profiles', help='comma-separated profile names (default: all)')
+    parser.add_argument('--vf', help='filter graph applied before encoding')
+    parser.add_argument('--json', action='store_true', help='print machine-readable output')
+    args = parser.parse_args()
+
+    if args.benchmark is None:
+        # Just list the registry; '*' marks the deployment default
+        if args.json:
+            print(json.dumps({name: p.to_dict() for name, p in PROFILES.items()}, indent=2))
+            return 0
+        for profile in PROFILES.values():
+            marker = '*' if profile.name == default_profile_name() else ' '
+            print(f"{marker} {profile.name:10} preset={profile.preset:9} crf={profile.crf:<3} {profile.description}")
+        return 0
+
+    names = [n.strip() for n in args.profiles.split(',')] if args.profiles else None
+    with tempfile.TemporaryDirectory(prefix='dazzlo-ref-') as tmp:
+        reference = args.benchmark or make_reference_clip(os.path.join(tmp, 'reference.mp4'))
+        results = benchmark(reference, names, args.vf)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'profile':10} {'preset':9} {'crf':>3} {'fps':>8} {'seconds':>8} {'size':>12} {'ratio':>6}")
+        for r in results:
+            if not r['success']:
+                print(f"{r['profile']:10} failed")
+                continue
+            print(f"{r['profile']:10} {r['preset']:9} {r['crf']:>3} {r['fps']:>8} {r['seconds']:>8} "
+                  f"{r['size']:>12} {r['size_ratio']:>6}")
+    return 0 if all(r['success'] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Managed yt-dlp extractor cache for DazzloGet
+Keeps yt-dlp's on-disk cache (YouTube player signatures, nsig results, ...)
+between downloads instead of re-deriving it for every request, bounded in size.
+"""
+
+import os
+import shutil
+import threading
+import time
+
+# yt-dlp writes cache entries atomically (temp file + rename), so readers and
+# writers in other processes can share the directory without extra locking.
+
+# Default passed to yt-dlp's Cache.load to recognise misses
+_MISS = object()
+
+
+class ExtractorCache:
+    """Shared, size-bounded yt-dlp cache directory with hit/miss accounting"""
+
+    def __init__(self, path=None, max_bytes=None, prune_interval=60):
+        if path is None:
+            path = os.environ.get('DAZZLO_YTDLP_CACHE_DIR') or os.path.join(
+                os.path.expanduser("~"), ".cache", "dazzlo", "yt-dlp")
+        if max_bytes is None:
+            max_bytes = int(os.environ.get('DAZZLO_YTDLP_CACHE_MAX_BYTES', str(200 * 1024 ** 2)))
+        self.path = path
+        self.max_bytes = max_bytes
+        self.prune_interval = prune_interval
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.sections = {}
+        self._last_prune = 0
+        self._lock = threading.Lock()
+
+    def attach(self, ydl):
+        """Count cache lookups made by a YoutubeDL instance using this directory"""
+        cache = getattr(ydl, 'cache', None)
+        if cache is None:
+            return ydl
+        original_load = cache.load
+        original_store = cache.store
+
+        def load(section, key, dtype='json', default=None, **kwargs):
+            # A sentinel default tells a miss apart from a caller's own default
+            value = original_load(section, key, dtype, _MISS, **kwargs)
+            # None: an entry from an older yt-dlp, which it treats as missing
+            self._record(section, 'misses' if value is _MISS or value is None else 'hits')
+            return default if value is _MISS else value
+
+        def store(section, key, *args, **kwargs):
+            self._record(section, 'stores')
+            return original_store(section, key, *args, **kwargs)
+
+        cache.load = load
+        cache.store = store
+        return ydl
+
+    def _record(self, section, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+            counts = self.sections.setdefault(section, {'hits': 0, 'misses': 0, 'stores': 0})
+            counts[counter] += 1
+
+    def maybe_prune(self):
+        """Prune at most once per prune_interval seconds"""
+        now = time.time()
+        with self._lock:
+            if now - self._last_prune < self.prune_interval:
+                return
+            self._last_prune = now
+        self.prune()
+
+    def prune(self):
+        """Delete least recently modified entries until the cache fits max_bytes"""
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.path):
+            for name in names:
+                file_path = os.path.join(root, name)
+                try:
+                    st = os.stat(file_path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, file_path))
+                total += st.st_size
+        removed = 0
+        for _, size, file_path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(file_path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        if removed:
+            print(f"🧹 Pruned {removed} yt-dlp cache entries")
+        return total
+
+    def invalidate(self, section=None):
+        """Drop the whole cache, or a single yt-dlp section such as 'youtube-sigfuncs'"""
+        target = os.path.join(self.path, os.path.basename(section)) if section else self.path
+        if not os.path.exists(target):
+            return False
+        # Rename first so concurrent readers never see a half-deleted directory
+        doomed = f"{target}.invalid-{os.getpid()}-{threading.get_ident()}"
+        try:
+            os.rename(target, doomed)
+        except OSError:
+            doomed = target
+        shutil.rmtree(doomed, ignore_errors=True)
+        print(f"🧹 Invalidated yt-dlp cache: {section or 'all'}")
+        return True
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'path': self.path,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+                'sections': {k: dict(v) for k, v in self.sections.items()},
+            }
+
+
+# Process-wide cache used by every VideoDownloader
+default_extractor_cache = ExtractorCache()
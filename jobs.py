@@ -0,0 +1,669 @@
+#!/usr/bin/env python3
+"""
+Background job subsystem for DazzloGet
+Downloads run on a bounded worker pool so web requests return a job id
+immediately instead of holding a server worker for the whole download.
+Job state is written through to a JobStore (jobstore.py) so other worker
+processes can report on it and jobs outlive the process that started them.
+In distributed mode jobs are dispatched to a broker (broker.py) instead and
+run by worker.py processes.
+"""
+
+import itertools
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from jobstore import BROKER_OWNER, MemoryJobStore, owner_alive, process_owner
+from postprocess import PRIORITY_NORMAL
+
+# Job states
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_FINISHED = 'finished'
+JOB_FAILED = 'failed'
+
+FINAL_STATES = (JOB_FINISHED, JOB_FAILED)
+
+# Minimum spacing between forwarded yt-dlp progress events
+PROGRESS_INTERVAL = 0.5
+
+# Minimum spacing between progress writes to the job store
+STORE_INTERVAL = 2.0
+
+# Events kept per job for SSE clients; a subscriber further behind skips the oldest
+MAX_EVENTS = 200
+# Status messages kept per job
+MAX_STATUS_UPDATES = 50
+
+# Housekeeping cadence: heartbeats and cross-process cancels / orphan recovery and purging
+WATCH_INTERVAL = 5
+RECOVERY_INTERVAL = 30
+
+
+class JobCancelled(Exception):
+    """Raised from a progress hook to abort a cancelled or stalled job"""
+
+
+class Job:
+    """A single unit of work tracked by the JobManager"""
+
+    # Events are pushed to listeners, never polled for
+    poll_interval = None
+
+    def __init__(self, url, options=None, job_id=None, created_at=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.url = url
+        self.options = options or {}
+        self.state = JOB_QUEUED
+        self.message = 'Queued'
+        self.result = None
+        self.status_updates = deque(maxlen=MAX_STATUS_UPDATES)
+        self.phase = 'queued'
+        self.progress = {}
+        self.partial_path = None
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.last_event_id = 0
+        self.created_at = created_at or time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.last_activity = self.created_at
+        self.cancel_event = threading.Event()
+        self.cancel_reason = None
+        self.attempts = 0
+        self._cond = threading.Condition()
+        self._listeners = []
+        self._last_progress_event = 0
+        self._persisted_at = 0
+
+    @property
+    def done(self):
+        return self.state in FINAL_STATES
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def publish(self, event_type, data):
+        """Append an event to the job's stream and wake up subscribers"""
+        with self._cond:
+            self.last_activity = time.time()
+            self.last_event_id += 1
+            self.events.append((self.last_event_id, event_type, data))
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def add_listener(self, callback):
+        """Register a no-argument callback run after every published event
+
+        Used by the ASGI app to wake coroutines without parking a thread.
+        """
+        with self._cond:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._cond:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def events_since(self, last_id, timeout=None):
+        """Return events newer than last_id, waiting up to timeout for one"""
+        with self._cond:
+            if self.last_event_id <= last_id and not self.done and timeout:
+                self._cond.wait(timeout)
+            return _events_after(self.events, last_id)
+
+    def report_status(self, message, error=False):
+        """Status callback handed to VideoDownloader"""
+        self.message = message
+        self.status_updates.append((message, error))
+        print(f"[JOB {self.id[:8]}] {message}")
+        self.publish('status', {'message': message, 'error': error})
+
+    def report_progress(self, progress):
+        """Progress callback handed to VideoDownloader (yt-dlp hook data)"""
+        if self.cancelled:
+            raise JobCancelled(self.cancel_reason or 'Job cancelled')
+        self.phase = progress.get('stage', 'downloading')
+        if progress.get('_path'):
+            # File yt-dlp is currently writing, for live streaming
+            self.partial_path = progress['_path']
+        progress = {k: v for k, v in progress.items() if not k.startswith('_')}
+        self.progress = progress
+        now = time.time()
+        self.last_activity = now
+        # yt-dlp fires a hook per chunk; only forward a few per second
+        if progress.get('status') == 'downloading' and now - self._last_progress_event < PROGRESS_INTERVAL:
+            return
+        self._last_progress_event = now
+        self.publish('progress', progress)
+
+    def cancel(self, reason='Cancelled by user'):
+        """Ask the running download to stop at its next progress hook"""
+        if self.done:
+            return False
+        self.cancel_reason = reason
+        self.cancel_event.set()
+        self.publish('status', {'message': f'⏹️ {reason}', 'error': True})
+        return True
+
+    def memory_usage(self):
+        """Approximate bytes held by the job's events, messages and result"""
+        with self._cond:
+            return deep_size((self.__dict__, self.events, self.status_updates))
+
+    def to_dict(self):
+        """Public JSON representation of the job"""
+        data = {
+            'job_id': self.id,
+            'state': self.state,
+            'phase': self.phase,
+            'message': self.message,
+            'progress': self.progress,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if self.result:
+            data.update({k: v for k, v in self.result.items() if k != 'file_path'})
+        return data
+
+    def to_record(self, owner):
+        """Row for the job store"""
+        return {
+            'id': self.id,
+            'url': self.url,
+            'options': self.options,
+            'state': self.state,
+            'phase': self.phase,
+            'message': self.message,
+            'progress': self.progress,
+            'result': self.result,
+            'owner': owner,
+            'attempts': self.attempts,
+            'cancel_requested': self.cancelled,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class StoredJob:
+    """A job known only from the store: run by another process, or finished before a restart
+
+    Offers the read side of Job. Events are synthesised by polling the store,
+    so a client can follow the job from any worker; cancel() leaves a request
+    that the owning process acts on.
+    """
+
+    poll_interval = 1.0
+    partial_path = None  # Live streaming only works from the process downloading the file
+
+    def __init__(self, store, record):
+        self._store = store
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.last_event_id = 0
+        self._apply(record)
+        if self.done:
+            self._add_event('done', self.to_dict())
+        else:
+            self._add_event('state', {'state': self.state})
+
+    done = Job.done
+    to_dict = Job.to_dict
+
+    @property
+    def cancelled(self):
+        return self.cancel_requested
+
+    def _apply(self, record):
+        self.id = record['id']
+        self.url = record['url']
+        self.options = record['options'] or {}
+        self.state = record['state']
+        self.phase = record['phase']
+        self.message = record['message']
+        self.owner = record['owner']
+        self.progress = record['progress'] or {}
+        self.result = record['result']
+        self.cancel_requested = record['cancel_requested']
+        self.created_at = record['created_at']
+        self.started_at = record['started_at']
+        self.finished_at = record['finished_at']
+        self.updated_at = record['updated_at']
+
+    def refresh(self):
+        """Reload the record and turn what changed into events"""
+        record = self._store.load(self.id)
+        if record is None or record['updated_at'] == self.updated_at:
+            return
+        previous = (self.state, self.message, self.progress)
+        self._apply(record)
+        if self.message != previous[1]:
+            self._add_event('status', {'message': self.message, 'error': self.state == JOB_FAILED})
+        if self.progress != previous[2]:
+            self._add_event('progress', self.progress)
+        if self.state != previous[0]:
+            self._add_event('done' if self.done else 'state', self.to_dict() if self.done else {'state': self.state})
+
+    def _add_event(self, event_type, data):
+        self.last_event_id += 1
+        self.events.append((self.last_event_id, event_type, data))
+
+    def events_since(self, last_id, timeout=None):
+        deadline = time.time() + (timeout or 0)
+        while True:
+            self.refresh()
+            remaining = deadline - time.time()
+            if self.last_event_id > last_id or self.done or remaining <= 0:
+                return _events_after(self.events, last_id)
+            time.sleep(min(self.poll_interval, remaining))
+
+    def add_listener(self, callback):
+        pass  # Nothing publishes in this process; callers poll via poll_interval
+
+    def remove_listener(self, callback):
+        pass
+
+    def cancel(self, reason='Cancelled by user'):
+        if self.done:
+            return False
+        if self.owner == BROKER_OWNER and self._store.claim(self.id, BROKER_OWNER, process_owner()):
+            # No worker has taken it yet, so none would see the request; finish it here
+            self._store.update(self.id, state=JOB_FAILED, phase='done', message=reason, cancel_requested=True,
+                               result={'success': False, 'message': reason, 'file_url': None},
+                               finished_at=time.time())
+            return True
+        self._store.update(self.id, cancel_requested=True)
+        return True
+
+
+def _events_after(events, last_id):
+    """Events of a ring buffer with ids above last_id (ids are consecutive)"""
+    if not events:
+        return []
+    start = max(0, last_id - events[0][0] + 1)
+    return list(itertools.islice(events, start, None))
+
+
+def deep_size(obj, _seen=None):
+    """Approximate bytes held by obj and the containers and strings inside it"""
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_size(item, seen) for item in obj)
+    return size
+
+
+def process_rss():
+    """Resident memory of this process in bytes, where the platform says"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _Call:
+    """An in-flight execution shared by every job that asked for the same key"""
+
+    def __init__(self, member):
+        self.members = [member]
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into a single execution"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, member):
+        """Run fn(call) once per key; returns (result, shared)
+
+        Jobs arriving while a call for key is running attach to it as members
+        and receive its result instead of starting their own download.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call(member)
+                self._calls[key] = call
+                leader = True
+            else:
+                call.members.append(member)
+                leader = False
+
+        if not leader:
+            # Wait for the leader, but let a cancelled follower leave early
+            while not call.done.wait(1):
+                if member.cancelled:
+                    with self._lock:
+                        if member in call.members:
+                            call.members.remove(member)
+                    raise JobCancelled(member.cancel_reason)
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(call)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        with self._lock:
+            return {key: len(call.members) for key, call in self._calls.items()}
+
+
+class JobManager:
+    """Runs jobs on a bounded thread pool and keeps track of their state
+
+    Live Job objects stay in memory for job_ttl seconds after they finish and
+    never number more than max_jobs (oldest finished dropped first); after
+    that they are answered from the store.
+    """
+
+    def __init__(self, max_workers=None, stall_timeout=None, store=None, orphan_timeout=None, max_jobs=None,
+                 job_ttl=None):
+        if max_workers is None:
+            max_workers = int(os.environ.get('DAZZLO_MAX_WORKERS', '4'))
+        if stall_timeout is None:
+            stall_timeout = float(os.environ.get('DAZZLO_STALL_TIMEOUT', '60'))
+        if orphan_timeout is None:
+            orphan_timeout = float(os.environ.get('DAZZLO_ORPHAN_TIMEOUT', '60'))
+        if max_jobs is None:
+            max_jobs = int(os.environ.get('DAZZLO_MAX_JOBS', '1000'))
+        if job_ttl is None:
+            job_ttl = float(os.environ.get('DAZZLO_JOB_TTL', '900'))
+        self.max_workers = max(1, max_workers)
+        self.stall_timeout = stall_timeout
+        self.orphan_timeout = orphan_timeout
+        self.max_jobs = max(1, max_jobs)
+        self.job_ttl = job_ttl
+        self.evicted = 0
+        # Finished job records older than this are deleted from the store (seconds)
+        self.retention = float(os.environ.get('DAZZLO_JOB_RETENTION', str(7 * 24 * 3600)))
+        self.store = store or MemoryJobStore()
+        self.owner = process_owner()
+        self.recovered = 0
+        self._recovery_handler = None
+        self._max_attempts = 3
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='dazzlo-job')
+        # Insertion order is creation order, which eviction relies on
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+        # Stall watchdog, heartbeats, cancels from other processes and orphan recovery
+        watchdog = threading.Thread(target=self._watch, name='dazzlo-job-watchdog')
+        watchdog.daemon = True
+        watchdog.start()
+
+    def submit(self, url, handler, options=None):
+        """Queue a job; handler(job) runs on the pool and returns the result dict"""
+        job = Job(url, options)
+        self._track(job)
+        self._executor.submit(self._run, job, handler)
+        return job
+
+    def dispatch(self, broker, url, options=None):
+        """Record a job and publish it on broker for a worker process; returns a StoredJob view"""
+        job = Job(url, options)
+        self.store.save(job.to_record(BROKER_OWNER))
+        task = {'job_id': job.id, 'url': url, 'options': job.options}
+        try:
+            broker.publish(task, job.options.get('priority', PRIORITY_NORMAL))
+        except Exception as e:
+            self.store.update(job.id, state=JOB_FAILED, phase='done', message=f'Could not queue job: {e}',
+                              finished_at=time.time())
+            raise
+        return StoredJob(self.store, self.store.load(job.id))
+
+    def run_task(self, task, handler, deliveries=1):
+        """Run a job a broker handed to this process; returns its Future, or None if there is nothing to run
+
+        The job is taken over from its previous owner (the broker, or a worker
+        whose lease ran out). Jobs that already finished or were cancelled
+        while queued are skipped.
+        """
+        record = self.store.load(task['job_id'])
+        if record is not None:
+            if record['state'] in FINAL_STATES:
+                return None
+            if not self.store.claim(record['id'], record['owner'], self.owner):
+                return None  # Cancelled or taken over meanwhile
+        job = Job(task['url'], task.get('options'), job_id=task['job_id'],
+                  created_at=record['created_at'] if record else None)
+        job.attempts = deliveries - 1
+        self._track(job)
+        if record is not None and record['cancel_requested']:
+            job.cancel()
+        elif job.attempts > self._max_attempts:
+            job.cancel(f'Gave up after {self._max_attempts} interrupted attempts')
+        return self._executor.submit(self._run, job, handler)
+
+    def _track(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+            full = len(self._jobs) > self.max_jobs
+        if full:
+            self._evict()
+        job.add_listener(lambda: self._persist(job))
+        try:
+            self.store.save(job.to_record(self.owner))
+        except Exception as e:
+            print(f"⚠️ Could not save job {job.id[:8]}: {e}")
+
+    def get(self, job_id):
+        """The live Job if this process runs it, else a StoredJob view (or None)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        try:
+            record = self.store.load(job_id)
+        except Exception as e:
+            print(f"⚠️ Could not load job {job_id[:8]}: {e}")
+            return None
+        return StoredJob(self.store, record) if record else None
+
+    def cancel(self, job_id, reason='Cancelled by user'):
+        job = self.get(job_id)
+        return job is not None and job.cancel(reason)
+
+    def enable_recovery(self, handler, max_attempts=3):
+        """Re-run jobs whose owning process died, with handler, up to max_attempts times each"""
+        self._recovery_handler = handler
+        self._max_attempts = max_attempts
+        self._recover_orphans()
+
+    def stats(self):
+        with self._lock:
+            states = {}
+            for job in self._jobs.values():
+                states[job.state] = states.get(job.state, 0) + 1
+        try:
+            store = self.store.stats()
+        except Exception as e:
+            store = {'error': str(e)}
+        return {'owner': self.owner, 'local_jobs': states, 'evicted': self.evicted, 'recovered': self.recovered,
+                'store': store}
+
+    def memory_report(self, limit=20):
+        """Registry limits and estimated memory of the live jobs, largest first"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        now = time.time()
+        entries = []
+        for job in jobs:
+            entries.append({
+                'job_id': job.id,
+                'state': job.state,
+                'events': len(job.events),
+                'status_updates': len(job.status_updates),
+                'bytes': job.memory_usage(),
+                'age': round(now - job.created_at, 1),
+            })
+        entries.sort(key=lambda e: e['bytes'], reverse=True)
+        return {
+            'jobs': len(jobs),
+            'active': sum(1 for job in jobs if not job.done),
+            'max_jobs': self.max_jobs,
+            'job_ttl': self.job_ttl,
+            'max_events': MAX_EVENTS,
+            'evicted': self.evicted,
+            'estimated_bytes': sum(e['bytes'] for e in entries),
+            'process_rss': process_rss(),
+            'largest': entries[:limit],
+        }
+
+    def _evict(self):
+        """Forget finished jobs older than job_ttl, then the oldest finished ones over max_jobs
+
+        Running and queued jobs are never dropped.
+        """
+        now = time.time()
+        with self._lock:
+            excess = len(self._jobs) - self.max_jobs
+            for job in [j for j in self._jobs.values() if j.done]:
+                if excess > 0 or now - (job.finished_at or now) > self.job_ttl:
+                    del self._jobs[job.id]
+                    excess -= 1
+                    self.evicted += 1
+
+    def _persist(self, job, force=False):
+        """Write the job's current state to the store (progress at most every STORE_INTERVAL)"""
+        now = time.time()
+        if not force and now - job._persisted_at < STORE_INTERVAL:
+            return
+        job._persisted_at = now
+        try:
+            self.store.update(job.id, state=job.state, phase=job.phase, message=job.message,
+                              progress=job.progress, result=job.result, attempts=job.attempts,
+                              started_at=job.started_at, finished_at=job.finished_at)
+        except Exception as e:
+            # A store outage must not take the download down with it
+            print(f"⚠️ Could not persist job {job.id[:8]}: {e}")
+
+    def _watch(self):
+        """Housekeeping loop run by the watchdog thread"""
+        interval = min(WATCH_INTERVAL, self.stall_timeout) if self.stall_timeout > 0 else WATCH_INTERVAL
+        last_recovery = time.time()
+        while True:
+            time.sleep(interval)
+            if self.stall_timeout > 0:
+                self._cancel_stalled_jobs()
+            self._evict()
+            try:
+                self.store.heartbeat(self.owner)
+                self._apply_remote_cancels()
+                if time.time() - last_recovery >= RECOVERY_INTERVAL:
+                    last_recovery = time.time()
+                    self._recover_orphans()
+                    self.store.purge(time.time() - self.retention)
+            except Exception as e:
+                print(f"⚠️ Job store housekeeping failed: {e}")
+
+    def _cancel_stalled_jobs(self):
+        """Cancel downloads that have not reported progress for stall_timeout seconds"""
+        now = time.time()
+        with self._lock:
+            running = [j for j in self._jobs.values() if j.state == JOB_RUNNING]
+        for job in running:
+            # Only the network phase reports fine-grained progress
+            if job.phase == 'downloading' and now - job.last_activity > self.stall_timeout:
+                job.cancel(f'Download stalled for {int(self.stall_timeout)}s')
+
+    def _apply_remote_cancels(self):
+        """Cancel local jobs that a request to another worker asked to stop"""
+        for record in self.store.active():
+            if record['owner'] == self.owner and record['cancel_requested']:
+                job = self.get(record['id'])
+                if isinstance(job, Job):
+                    job.cancel()
+
+    def _recover_orphans(self):
+        """Claim and re-queue active jobs whose owner is no longer alive"""
+        if self._recovery_handler is None:
+            return
+        for record in self.store.active():
+            if record['owner'] == self.owner or owner_alive(record['owner'], record['updated_at'],
+                                                            self.orphan_timeout):
+                continue
+            if not self.store.claim(record['id'], record['owner'], self.owner):
+                continue  # Another worker got there first
+            job = Job(record['url'], record['options'], job_id=record['id'], created_at=record['created_at'])
+            job.attempts = (record['attempts'] or 0) + 1
+            self.recovered += 1
+            print(f"♻️ Resuming job {job.id[:8]} left behind by {record['owner']} (attempt {job.attempts})")
+            self._track(job)
+            if record['cancel_requested']:
+                job.cancel()
+            elif job.attempts > self._max_attempts:
+                # Probably the job itself keeps killing its worker
+                job.cancel(f'Gave up after {self._max_attempts} interrupted attempts')
+            self._executor.submit(self._run, job, self._recovery_handler)
+
+    def _run(self, job, handler):
+        """Execute a job and record its outcome"""
+        if job.cancelled:
+            self._finish(job, {
+                'success': False,
+                'message': job.cancel_reason,
+                'file_url': None
+            })
+            return
+        job.state = JOB_RUNNING
+        job.started_at = time.time()
+        job.last_activity = job.started_at
+        job.publish('state', {'state': job.state})
+        self._persist(job, force=True)
+        try:
+            result = handler(job) or {
+                'success': False,
+                'message': 'Unknown error occurred',
+                'file_url': None
+            }
+        except Exception as e:
+            error_msg = str(e)
+            print(f"Download error: {error_msg}")
+            result = {
+                'success': False,
+                'message': f'Download error: {error_msg[:100]}',
+                'file_url': None
+            }
+        if not result.get('success') and job.cancelled:
+            result['message'] = job.cancel_reason
+        self._finish(job, result)
+
+    def _finish(self, job, result):
+        job.result = result
+        job.message = result.get('message', job.message)
+        job.finished_at = time.time()
+        job.phase = 'done'
+        job.state = JOB_FINISHED if result.get('success') else JOB_FAILED
+        job.publish('done', job.to_dict())
+        self._persist(job, force=True)
+        with self._lock:
+            full = len(self._jobs) > self.max_jobs
+        if full:
+            self._evict()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Persistent job state for DazzloGet
+Job status, output paths, timings and errors are written through to a store
+shared by every worker process, so a job can be polled from any gunicorn
+worker and survives restarts. Jobs left queued or running by a process that
+died are picked up again by the survivors (see JobManager.enable_recovery).
+
+Pick the backend with DAZZLO_JOB_STORE:
+    sqlite:///var/lib/dazzlo/jobs.sqlite3   (default: jobs.sqlite3 in the download folder)
+    memory://                               (per process, nothing persisted)
+Other backends plug in with register_job_store(scheme, factory).
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+# Columns of a job record; dict-valued ones are stored as JSON
+RECORD_FIELDS = ('id', 'url', 'options', 'state', 'phase', 'message', 'progress', 'result', 'owner',
+                 'attempts', 'cancel_requested', 'created_at', 'started_at', 'finished_at', 'updated_at')
+JSON_FIELDS = ('options', 'progress', 'result')
+
+ACTIVE_STATES = ('queued', 'running')
+
+# Default SQLite store inside the download folder, shared by every process using it
+JOB_STORE_FILENAME = 'jobs.sqlite3'
+
+# Owner of jobs waiting in a broker (broker.py) for a worker process
+BROKER_OWNER = 'broker'
+
+
+def process_owner():
+    """Identity written into the jobs this process is running"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def owner_alive(owner, heartbeat, orphan_timeout):
+    """Best guess whether the process that owns a job is still running
+
+    Same-host owners whose pid is gone are dead at once; otherwise the job's
+    heartbeat (updated_at) must be younger than orphan_timeout. Jobs waiting
+    in a broker are alive for as long as the broker holds them.
+    """
+    if owner == BROKER_OWNER:
+        return True
+    host, _, pid = (owner or '').rpartition(':')
+    if host == socket.gethostname() and pid.isdigit():
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False  # Restarted or crashed; no need to wait for the heartbeat to age
+        except PermissionError:
+            pass
+    # A recycled pid still stops heartbeating
+    return heartbeat is not None and time.time() - heartbeat < orphan_timeout
+
+
+class JobStore(ABC):
+    """Interface every job-state backend implements
+
+    Records are plain dicts with RECORD_FIELDS keys. Implementations must be
+    safe to call from many threads, and from many processes when shared.
+    """
+
+    @abstractmethod
+    def save(self, record):
+        """Insert or replace a whole record"""
+
+    @abstractmethod
+    def update(self, job_id, **fields):
+        """Change some fields of a record (updated_at is set automatically)"""
+
+    @abstractmethod
+    def load(self, job_id):
+        """Return the record or None"""
+
+    @abstractmethod
+    def claim(self, job_id, expected_owner, new_owner):
+        """Atomically move a job from expected_owner to new_owner; True if this call won"""
+
+    @abstractmethod
+    def active(self):
+        """Records still queued or running, oldest first"""
+
+    @abstractmethod
+    def finished(self):
+        """Records no longer queued or running"""
+
+    @abstractmethod
+    def heartbeat(self, owner):
+        """Mark every active job of owner as recently alive"""
+
+    @abstractmethod
+    def purge(self, finished_before):
+        """Delete finished records older than the timestamp; returns how many"""
+
+    @abstractmethod
+    def stats(self):
+        """Backend name and counters for /health"""
+
+
+class MemoryJobStore(JobStore):
+    """Process-local store; what every job had before persistence existed"""
+
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def save(self, record):
+        with self._lock:
+            self._records[record['id']] = dict(record, updated_at=time.time())
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._records:
+                self._records[job_id].update(fields, updated_at=time.time())
+
+    def load(self, job_id):
+        with self._lock:
+            record = self._records.get(job_id)
+            return dict(record) if record else None
+
+    def claim(self, job_id, expected_owner, new_owner):
+        with self._lock:
+            record = self._records.get(job_id)
+            if not record or record['owner'] != expected_owner:
+                return False
+            record.update(owner=new_owner, updated_at=time.time())
+            return True
+
+    def active(self):
+        with self._lock:
+            records = [dict(r) for r in self._records.values() if r['state'] in ACTIVE_STATES]
+        return sorted(records, key=lambda r: r['created_at'])
+
+    def finished(self):
+        with self._lock:
+            return [dict(r) for r in self._records.values() if r['state'] not in ACTIVE_STATES]
+
+    def heartbeat(self, owner):
+        now = time.time()
+        with self._lock:
+            for record in self._records.values():
+                if record['owner'] == owner and record['state'] in ACTIVE_STATES:
+                    record['updated_at'] = now
+
+    def purge(self, finished_before):
+        with self._lock:
+            old = [job_id for job_id, r in self._records.items()
+                   if r['state'] not in ACTIVE_STATES and (r['finished_at'] or 0) < finished_before]
+            for job_id in old:
+                del self._records[job_id]
+        return len(old)
+
+    def stats(self):
+        with self._lock:
+            states = {}
+            for record in self._records.values():
+                states[record['state']] = states.get(record['state'], 0) + 1
+        return {'backend': 'memory', 'jobs': states}
+
+
+class SQLiteJobStore(JobStore):
+    """Job records in a SQLite database in WAL mode
+
+    WAL lets readers in every worker process run alongside the single
+    writer; writers queue on the database lock for up to busy_timeout.
+    Each thread gets its own connection.
+    """
+
+    def __init__(self, path, busy_timeout=10.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self.writes = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._write() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    options TEXT,
+                    state TEXT NOT NULL,
+                    phase TEXT,
+                    message TEXT,
+                    progress TEXT,
+                    result TEXT,
+                    owner TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL,
+                    started_at REAL,
+                    finished_at REAL,
+                    updated_at REAL
+                )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            # WAL is crash-safe with NORMAL; only the last commits can be lost on power failure
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _write(self):
+        return Transaction(self._conn())
+
+    def save(self, record):
+        record = dict(record, updated_at=time.time())
+        values = [_encode(field, record.get(field)) for field in RECORD_FIELDS]
+        with self._write() as conn:
+            conn.execute(f'INSERT OR REPLACE INTO jobs ({", ".join(RECORD_FIELDS)}) '
+                         f'VALUES ({", ".join("?" * len(RECORD_FIELDS))})', values)
+        self.writes += 1
+
+    def update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        values = [_encode(name, value) for name, value in fields.items()]
+        with self._write() as conn:
+            conn.execute(f'UPDATE jobs SET {columns} WHERE id = ?', values + [job_id])
+        self.writes += 1
+
+    def load(self, job_id):
+        row = self._conn().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return _decode(row) if row else None
+
+    def claim(self, job_id, expected_owner, new_owner):
+        with self._write() as conn:
+            cursor = conn.execute('UPDATE jobs SET owner = ?, updated_at = ? WHERE id = ? AND owner IS ?',
+                                  (new_owner, time.time(), job_id, expected_owner))
+        self.writes += 1
+        return cursor.rowcount == 1
+
+    def active(self):
+        rows = self._conn().execute('SELECT * FROM jobs WHERE state IN (?, ?) ORDER BY created_at',
+                                    ACTIVE_STATES).fetchall()
+        return [_decode(row) for row in rows]
+
+    def finished(self):
+        rows = self._conn().execute('SELECT * FROM jobs WHERE state NOT IN (?, ?)', ACTIVE_STATES).fetchall()
+        return [_decode(row) for row in rows]
+
+    def heartbeat(self, owner):
+        with self._write() as conn:
+            conn.execute('UPDATE jobs SET updated_at = ? WHERE owner = ? AND state IN (?, ?)',
+                         (time.time(), owner) + ACTIVE_STATES)
+        self.writes += 1
+
+    def purge(self, finished_before):
+        with self._write() as conn:
+            cursor = conn.execute('DELETE FROM jobs WHERE state NOT IN (?, ?) AND finished_at < ?',
+                                  ACTIVE_STATES + (finished_before,))
+        return cursor.rowcount
+
+    def stats(self):
+        rows = self._conn().execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall()
+        return {'backend': 'sqlite', 'path': self.path, 'jobs': {state: count for state, count in rows},
+                'writes': self.writes}
+
+
+class Transaction:
+    """BEGIN IMMEDIATE ... COMMIT around a block, so each write takes the lock once"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+def _encode(field, value):
+    if field in JSON_FIELDS and value is not None:
+        return json.dumps(value, default=str)
+    if field == 'cancel_requested':
+        return int(bool(value))
+    return value
+
+
+def _decode(row):
+    record = dict(row)
+    for field in JSON_FIELDS:
+        if record.get(field) is not None:
+            record[field] = json.loads(record[field])
+    record['cancel_requested'] = bool(record['cancel_requested'])
+    return record
+
+
+JOB_STORES = {}
+
+
+def register_job_store(scheme, factory):
+    """Make factory(location) available as DAZZLO_JOB_STORE=<scheme>://<location>"""
+    JOB_STORES[scheme] = factory
+
+
+register_job_store('memory', lambda location: MemoryJobStore())
+register_job_store('sqlite', SQLiteJobStore)
+
+
+def open_job_store(url=None, default_path=None):
+    """Build the store named by url (or DAZZLO_JOB_STORE), SQLite at default_path otherwise"""
+    url = url or os.environ.get('DAZZLO_JOB_STORE')
+    if not url:
+        return SQLiteJobStore(default_path) if default_path else MemoryJobStore()
+    scheme, sep, location = url.partition('://')
+    if not sep:
+        # A bare path means SQLite
+        return SQLiteJobStore(url)
+    if scheme not in JOB_STORES:
+        raise ValueError(f"Unknown job store '{scheme}'. Choose from: {', '.join(sorted(JOB_STORES))}")
+    return JOB_STORES[scheme](location)
@@ -27,30 +27,90 @@ import json
 import re
 import subprocess
 import shutil
+import queue
+from contextlib import contextmanager
 from pathlib import Path
 import urllib.parse
+from extractor_cache import default_extractor_cache
+from postprocess import default_scheduler, EncodeCancelled, PRIORITY_HIGH, PRIORITY_NORMAL
+from encoding import get_profile
+from segmented import encode_segmented
+from probe import probe_media
+from filtergraph import build_watermark_filter, encode_limits
+
+# Platforms without burned-in watermarks: a container remux is all they need
+REMUX_ONLY_PLATFORMS = ('youtube', 'twitter')
+
+# Codecs ffmpeg can stream-copy into MP4
+MP4_VIDEO_CODECS = ('h264', 'hevc', 'av1', 'vp9', 'mpeg4')
+MP4_AUDIO_CODECS = ('aac', 'mp3', 'opus', 'ac3', 'eac3', 'flac', 'alac')
+
+# FFmpeg capability is probed once per process
+_ffmpeg_available = None
+_ffmpeg_lock = threading.Lock()
+
+def default_download_path():
+    """Return the downloads folder, creating it if needed"""
+    download_path = os.path.join(os.path.expanduser("~"), "Downloads", "Dazzlo Downloads")
+    
+    try:
+        os.makedirs(download_path, exist_ok=True)
+        print(f"✅ Download folder ready: {download_path}")
+    except Exception as e:
+        print(f"⚠️ Could not create download folder: {e}")
+        # Fallback to regular Downloads folder
+        download_path = os.path.join(os.path.expanduser("~"), "Downloads")
+        print(f"📁 Using fallback folder: {download_path}")
+    return download_path
+
+def probe_ffmpeg(force=False):
+    """Check once whether FFmpeg is installed and remember the answer"""
+    global _ffmpeg_available
+    with _ffmpeg_lock:
+        if _ffmpeg_available is None or force:
+            try:
+                subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
+                print("✅ FFmpeg found - Watermark removal enabled!")
+                _ffmpeg_available = True
+            except (subprocess.CalledProcessError, FileNotFoundError):
+                print("⚠️ FFmpeg not found - Install for automatic watermark removal")
+                print("   Windows: winget install FFmpeg")
+                print("   Mac: brew install ffmpeg")
+                print("   Linux: sudo apt install ffmpeg")
+                _ffmpeg_available = False
+        return _ffmpeg_available
+
+def detect_platform(url):
+    """Detect platform from URL for appropriate watermark removal"""
+    url_lower = url.lower()
+    if 'tiktok.com' in url_lower or 'vm.tiktok.com' in url_lower:
+        return "tiktok"
+    elif 'instagram.com' in url_lower:
+        return "instagram"
+    elif 'snapchat.com' in url_lower:
+        return "snapchat"
+    elif 'facebook.com' in url_lower or 'fb.watch' in url_lower:
+        return "facebook"
+    elif 'youtube.com' in url_lower or 'youtu.be' in url_lower:
+        return "youtube"
+    elif 'twitter.com' in url_lower or 'x.com' in url_lower:
+        return "twitter"
+    else:
+        return "generic"
 
 class VideoDownloader:
-    def __init__(self, headless=False, status_callback=None):
+    def __init__(self, headless=False, status_callback=None, progress_callback=None, download_path=None,
+                 extractor_cache=None, scheduler=None):
         # Create downloads folder with better error handling
-        self.download_path = os.path.join(os.path.expanduser("~"), "Downloads", "Dazzlo Downloads")
-        
-        try:
-            os.makedirs(self.download_path, exist_ok=True)
-            print(f"✅ Download folder ready: {self.download_path}")
-        except Exception as e:
-            print(f"⚠️ Could not create download folder: {e}")
-            # Fallback to regular Downloads folder
-            self.download_path = os.path.join(os.path.expanduser("~"), "Downloads")
-            print(f"📁 Using fallback folder: {self.download_path}")
+        self.download_path = download_path or default_download_path()
         
         self.driver = None
         self.headless = headless
         self.status_callback = status_callback
+        self.progress_callback = progress_callback
+        self.extractor_cache = extractor_cache or default_extractor_cache
+        self.scheduler = scheduler or default_scheduler
         self.ffmpeg_available = self.check_ffmpeg()
-        
-        # Clean any existing yt-dlp cache to ensure fresh downloads
-        self.clean_download_cache()
     
     def safe_js_string(self, text):
         """Safely escape strings for JavaScript injection"""
@@ -73,9 +133,9 @@ class VideoDownloader:
         return text
         
     def clean_download_cache(self):
-        """Clean yt-dlp cache to ensure fresh downloads"""
+        """Explicitly invalidate the managed yt-dlp cache and legacy cache folders"""
         try:
-            import shutil
+            self.extractor_cache.invalidate()
             
             # Common yt-dlp cache locations
             cache_locations = [
@@ -97,16 +157,7 @@ class VideoDownloader:
     
     def check_ffmpeg(self):
         """Check if FFmpeg is installed for watermark removal"""
-        try:
-            subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
-            print("✅ FFmpeg found - Watermark removal enabled!")
-            return True
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            print("⚠️ FFmpeg not found - Install for automatic watermark removal")
-            print("   Windows: winget install FFmpeg")
-            print("   Mac: brew install ffmpeg")
-            print("   Linux: sudo apt install ffmpeg")
-            return False
+        return probe_ffmpeg()
     
     def is_valid_url(self, url):
         """Validate URL format"""
@@ -116,77 +167,55 @@ class VideoDownloader:
         except:
             return False
     
-    def remove_watermark_from_video(self, video_path, platform="generic"):
-        """Remove watermarks from downloaded video using FFmpeg with multiple strategies"""
+    def remove_watermark_from_video(self, video_path, platform="generic", priority=PRIORITY_NORMAL,
+                                    should_cancel=None, profile=None):
+        """Remove watermarks from downloaded video using FFmpeg with multiple strategies
+        
+        profile names an encoding.EncoderProfile (None uses the deployment default).
+        The encode runs on the shared post-processing scheduler; EncodeCancelled
+        propagates to the caller when should_cancel() turns true mid-encode.
+        """
         if not self.ffmpeg_available:
             return video_path  # Return original if FFmpeg not available
         
+        if platform in REMUX_ONLY_PLATFORMS:
+            # Nothing to paint out; never pay for a re-encode
+            return self.remux_video(video_path, should_cancel=should_cancel)
+        
         try:
+            profile = get_profile(profile)
+            # Resolution, rotation, frame rate and bitrate drive the filter graph and rate control
+            source = probe_media(video_path)
+            limits = encode_limits(source)
+            # Threads left unset by the profile share the cores between concurrent encodes
+            encode_args = profile.output_args(threads=self.scheduler.threads_per_encode, limits=limits)
+            
             # Create clean filename
             original_filename = Path(video_path).stem
-            clean_filename = f"{original_filename}_clean.mp4"
-            clean_path = os.path.join(self.download_path, clean_filename)
+            clean_filename = f"{original_filename}_clean.{profile.container}"
+            clean_path = os.path.join(os.path.dirname(video_path) or self.download_path, clean_filename)
             
             print(f"🧹 Removing watermarks from: {os.path.basename(video_path)}")
             
-            # More aggressive watermark removal strategies
-            if platform == "tiktok":
-                # TikTok: Remove multiple watermark areas + crop borders
-                cmd = [
-                    'ffmpeg', '-i', video_path,
-                    '-vf', '''crop=iw-40:ih-120:20:20,
-                              delogo=x=W-200:y=H-120:w=180:h=100:show=0,
-                              delogo=x=10:y=H-60:w=150:h=50:show=0,
-                              delogo=x=W-60:y=10:w=50:h=30:show=0,
-                              unsharp=5:5:0.8:5:5:0.0''',
-                    '-c:v', 'libx264', '-crf', '18', '-preset', 'medium',
-                    '-c:a', 'copy', '-y', clean_path
-                ]
-            elif platform == "instagram":
-                # Instagram: Remove username + crop + enhance
-                cmd = [
-                    'ffmpeg', '-i', video_path,
-                    '-vf', '''crop=iw-30:ih-80:15:40,
-                              delogo=x=10:y=10:w=220:h=60:show=0,
-                              delogo=x=W-100:y=H-40:w=90:h=30:show=0,
-                              unsharp=5:5:1.0:5:5:0.0''',
-                    '-c:v', 'libx264', '-crf', '18', '-preset', 'medium',
-                    '-c:a', 'copy', '-y', clean_path
-                ]
-            elif platform == "snapchat":
-                # Snapchat: More aggressive bottom removal
-                cmd = [
-                    'ffmpeg', '-i', video_path,
-                    '-vf', '''crop=iw-20:ih-100:10:10,
-                              delogo=x=10:y=H-100:w=200:h=80:show=0,
-                              delogo=x=W-150:y=H-50:w=140:h=40:show=0''',
-                    '-c:v', 'libx264', '-crf', '18', '-preset', 'medium',
-                    '-c:a', 'copy', '-y', clean_path
-                ]
-            elif platform == "facebook":
-                # Facebook: Remove corners + enhance
-                cmd = [
-                    'ffmpeg', '-i', video_path,
-                    '-vf', '''crop=iw-20:ih-40:10:20,
-                              delogo=x=10:y=10:w=180:h=40:show=0,
-                              delogo=x=W-120:y=H-50:w=110:h=40:show=0''',
-                    '-c:v', 'libx264', '-crf', '18', '-preset', 'medium',
-                    '-c:a', 'copy', '-y', clean_path
-                ]
-            else:
-                # Generic: Aggressive crop + blur edges method
-                cmd = [
-                    'ffmpeg', '-i', video_path,
-                    '-vf', '''crop=iw-60:ih-60:30:30,
-                              unsharp=5:5:1.0:5:5:0.0,
-                              scale=iw*1.1:ih*1.1,
-                              crop=iw-40:ih-40:20:20''',
-                    '-c:v', 'libx264', '-crf', '18', '-preset', 'medium',
-                    '-c:a', 'copy', '-y', clean_path
-                ]
+            # Platform watermark regions scaled to this video's size
+            video_filter = build_watermark_filter(platform, source)
+            if not video_filter:
+                print(f"⚠️ Video too small to clean, keeping original")
+                return video_path
             
-            # Run FFmpeg command with timeout
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+            cmd = ['ffmpeg', '-i', video_path, '-vf', video_filter, *encode_args, '-y', clean_path]
+            on_progress = self._encode_progress('watermark')
+            
+            # Long videos are cut at keyframes and encoded on several slots at once
+            if encode_segmented(self.scheduler, video_path, video_filter, clean_path, profile,
+                                priority=priority, should_cancel=should_cancel,
+                                progress_callback=on_progress, source=source, limits=limits):
+                result = subprocess.CompletedProcess(cmd, 0)
+            else:
+                # Queue the encode on the scheduler and wait for it (with timeout)
+                result = self.scheduler.run(cmd, priority=priority, should_cancel=should_cancel,
+                                            progress_callback=on_progress,
+                                            duration=source and source['duration'])
             
             if result.returncode == 0 and os.path.exists(clean_path):
                 # Check if the clean file is reasonable size
@@ -198,7 +227,7 @@ class VideoDownloader:
                     
                     # Optionally remove original and rename clean version
                     try:
-                        final_path = video_path.replace('.mp4', '_no_watermark.mp4')
+                        final_path = video_path.replace('.mp4', f'_no_watermark.{profile.container}')
                         if final_path == video_path:
                             final_path = clean_path
                         else:
@@ -222,28 +251,84 @@ class VideoDownloader:
                 
         except subprocess.TimeoutExpired:
             print(f"⚠️ Watermark removal timeout, keeping original")
+            self._remove_partial(clean_path)
             return video_path
+        except EncodeCancelled:
+            print(f"⏹️ Watermark removal cancelled")
+            self._remove_partial(clean_path)
+            raise
         except Exception as e:
             print(f"⚠️ Watermark removal error: {e}")
             return video_path
     
+    def remux_video(self, video_path, container='mp4', should_cancel=None):
+        """Rewrap video_path into container with stream copy (no re-encode)
+        
+        Returns the original path when it is already in that container or the
+        streams cannot be copied into it.
+        """
+        if not self.ffmpeg_available or video_path.lower().endswith(f'.{container}'):
+            return video_path
+        
+        media = probe_media(video_path)
+        if media and container in ('mp4', 'mov') and not self._mp4_compatible(media):
+            # e.g. VP8/Vorbis WebM; copying would only fail after reading the whole file
+            print(f"⚠️ Streams cannot be stream-copied into {container}, keeping original")
+            return video_path
+        
+        remux_path = os.path.join(os.path.dirname(video_path) or self.download_path,
+                                  f"{Path(video_path).stem}.{container}")
+        print(f"📦 Remuxing to {container}: {os.path.basename(video_path)}")
+        cmd = [
+            'ffmpeg', '-i', video_path,
+            '-map', '0:v', '-map', '0:a?',
+            '-c', 'copy', '-movflags', '+faststart',
+            '-y', remux_path
+        ]
+        try:
+            # Remuxing is I/O bound and takes seconds, so let it jump the encode queue
+            result = self.scheduler.run(cmd, priority=PRIORITY_HIGH, should_cancel=should_cancel)
+            if result.returncode == 0 and os.path.getsize(remux_path) > 0:
+                print(f"✅ Remuxed: {os.path.basename(remux_path)}")
+                return remux_path
+            print(f"⚠️ Remux failed, keeping original")
+            if result.stderr:
+                print(f"   Error: {result.stderr[-200:]}")
+        except subprocess.TimeoutExpired:
+            print(f"⚠️ Remux timeout, keeping original")
+        except EncodeCancelled:
+            self._remove_partial(remux_path)
+            raise
+        except Exception as e:
+            print(f"⚠️ Remux error: {e}")
+        self._remove_partial(remux_path)
+        return video_path
+    
+    @staticmethod
+    def _mp4_compatible(media):
+        """True when every stream's codec can be copied into an MP4 container"""
+        video, audio = media['video'], media['audio']
+        if video and video['codec'] not in MP4_VIDEO_CODECS:
+            return False
+        return not audio or audio['codec'] in MP4_AUDIO_CODECS
+    
+    def _encode_progress(self, stage):
+        """Scheduler progress callback that forwards ffmpeg events tagged with stage"""
+        def callback(event):
+            if self.progress_callback:
+                self.progress_callback(dict(event, stage=stage))
+        return callback
+    
+    def _remove_partial(self, path):
+        """Delete an output file left behind by a killed encode"""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    
     def detect_platform_from_url(self, url):
         """Detect platform from URL for appropriate watermark removal"""
-        url_lower = url.lower()
-        if 'tiktok.com' in url_lower or 'vm.tiktok.com' in url_lower:
-            return "tiktok"
-        elif 'instagram.com' in url_lower:
-            return "instagram"
-        elif 'snapchat.com' in url_lower:
-            return "snapchat"
-        elif 'facebook.com' in url_lower or 'fb.watch' in url_lower:
-            return "facebook"
-        elif 'youtube.com' in url_lower or 'youtu.be' in url_lower:
-            return "youtube"
-        elif 'twitter.com' in url_lower or 'x.com' in url_lower:
-            return "twitter"
-        else:
-            return "generic"
+        return detect_platform(url)
         
     def setup_browser(self):
         """Setup Chrome browser with automatic driver management"""
@@ -334,53 +419,128 @@ class VideoDownloader:
             except:
                 pass  # Ignore if browser is not available
 
-    def download_video(self, url):
-        """Download video using yt-dlp with improved error handling"""
+    def _progress_hook(self, d):
+        """Forward yt-dlp download progress to the progress callback"""
+        if not self.progress_callback:
+            return
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        downloaded = d.get('downloaded_bytes') or 0
+        progress = {
+            'stage': 'downloading',
+            'status': d.get('status'),
+            'downloaded_bytes': downloaded,
+            'total_bytes': total,
+            'speed': d.get('speed'),
+            'eta': d.get('eta'),
+            'percent': round(downloaded * 100.0 / total, 1) if total else None,
+            'filename': os.path.basename(d.get('filename') or ''),
+            # Private keys (not published to clients) used for live streaming
+            '_path': d.get('tmpfilename') or d.get('filename'),
+            '_final_path': d.get('filename'),
+        }
+        try:
+            self.progress_callback(progress)
+        except Exception as e:
+            # Raising from a hook is how yt-dlp expects downloads to be aborted
+            raise yt_dlp.utils.DownloadCancelled(str(e))
+
+    def _postprocessor_hook(self, d):
+        """Forward yt-dlp post-processing stages to the progress callback"""
+        if not self.progress_callback:
+            return
+        try:
+            self.progress_callback({
+                'stage': 'postprocessing',
+                'status': d.get('status'),
+                'postprocessor': d.get('postprocessor'),
+            })
+        except Exception as e:
+            raise yt_dlp.utils.DownloadCancelled(str(e))
+
+    def build_ydl_opts(self, url, output_dir=None, format=None):
+        """Build the yt-dlp options used for a URL"""
+        platform_config = self.get_platform_specific_config(url)
+        
+        # Base configuration with better error handling
+        ydl_opts = {
+            'outtmpl': os.path.join(output_dir or self.download_path, '%(title)s.%(ext)s'),
+            'format': 'best[height<=1080]/best',
+            'force_download': True,
+            'no_check_certificate': True,
+            'cachedir': self.extractor_cache.path,
+            'prefer_free_formats': True,
+            'extract_flat': False,
+            'ignoreerrors': False,
+            'no_warnings': False,
+            'writeinfojson': False,
+            'writethumbnail': False,
+            'writesubtitles': False,
+            'http_headers': {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                'Accept-Language': 'en-us,en;q=0.5',
+                'Accept-Encoding': 'gzip, deflate',
+                'DNT': '1',
+                'Connection': 'keep-alive',
+                'Upgrade-Insecure-Requests': '1',
+            },
+            'socket_timeout': 30,
+            'retries': 3,
+            'progress_hooks': [self._progress_hook],
+            'postprocessor_hooks': [self._postprocessor_hook],
+        }
+        
+        # Update with platform-specific config
+        ydl_opts.update(platform_config)
+        if format:
+            ydl_opts['format'] = format
+        return ydl_opts
+
+    def extract_video_info(self, url):
+        """Extract video metadata without downloading; returns None on failure"""
+        if not self.is_valid_url(url):
+            return None
+        
+        try:
+            ydl_opts = self.build_ydl_opts(url)
+            ydl_opts['quiet'] = True
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                self.extractor_cache.attach(ydl)
+                return ydl.extract_info(url, download=False)
+        except Exception as e:
+            print(f"⚠️ Could not extract info: {str(e)[:150]}")
+            return None
+
+    def download_video(self, url, output_dir=None, info=None, format=None):
+        """Download video using yt-dlp with improved error handling
+        
+        Returns the list of downloaded file paths (empty/False on failure).
+        Files go to output_dir when given, otherwise the downloads folder.
+        A previously extracted info dict can be passed to skip re-extraction,
+        and format overrides the platform's yt-dlp format selector.
+        """
         if not self.is_valid_url(url):
             self._report_status("Invalid URL format. Please provide a valid URL starting with http:// or https://", error=True)
             return False
         
         try:
-            platform_config = self.get_platform_specific_config(url)
-            temp_cache = tempfile.mkdtemp()
-            
-            # Base configuration with better error handling
-            ydl_opts = {
-                'outtmpl': os.path.join(self.download_path, '%(title)s.%(ext)s'),
-                'format': 'best[height<=1080]/best',
-                'force_download': True,
-                'no_check_certificate': True,
-                'cachedir': temp_cache,
-                'prefer_free_formats': True,
-                'extract_flat': False,
-                'ignoreerrors': False,
-                'no_warnings': False,
-                'writeinfojson': False,
-                'writethumbnail': False,
-                'writesubtitles': False,
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                    'Accept-Language': 'en-us,en;q=0.5',
-                    'Accept-Encoding': 'gzip, deflate',
-                    'DNT': '1',
-                    'Connection': 'keep-alive',
-                    'Upgrade-Insecure-Requests': '1',
-                },
-                'socket_timeout': 30,
-                'retries': 3,
-            }
+            ydl_opts = self.build_ydl_opts(url, output_dir=output_dir, format=format)
             
-            # Update with platform-specific config
-            ydl_opts.update(platform_config)
+            # yt-dlp reports each final file path once post-processing is done
+            downloaded_paths = []
+            ydl_opts['post_hooks'] = [downloaded_paths.append]
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
             
             self._report_status('🔍 Analyzing URL and extracting video info...')
             
             try:
                 with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    # First, extract info without downloading
+                    self.extractor_cache.attach(ydl)
+                    # First, extract info without downloading (unless already known)
                     try:
-                        info = ydl.extract_info(url, download=False)
+                        if info is None:
+                            info = ydl.extract_info(url, download=False)
                         if not info:
                             raise Exception("Could not extract video information from this URL")
                         
@@ -393,7 +553,7 @@ class VideoDownloader:
                             # For playlists, limit to first 5 videos to avoid overwhelming
                             if total_videos > 5:
                                 self._report_status(f"⚠️ Limiting to first 5 videos of {total_videos}")
-                                ydl_opts['playlistend'] = 5
+                                info['entries'] = valid_entries[:5]
                         else:
                             title = info.get('title', 'Unknown video')[:50]
                             uploader = info.get('uploader', 'Unknown')
@@ -410,11 +570,14 @@ class VideoDownloader:
                                     pass
                             self._report_status(status_msg)
                         
-                        # Now download the video(s)
-                        ydl.download([url])
+                        # Now download the video(s) from the extracted info,
+                        # without fetching the page a second time
+                        ydl.process_ie_result(info, download=True)
                         
                         # Verify download success
-                        return self.verify_download_success(url, info)
+                        if self.verify_download_success(url, info, downloaded_paths):
+                            return downloaded_paths
+                        return False
                         
                     except yt_dlp.utils.ExtractorError as ee:
                         error_msg = str(ee).lower()
@@ -430,6 +593,10 @@ class VideoDownloader:
                             self._report_status(f"❌ Extraction failed: {str(ee)[:100]}", error=True)
                         return False
                         
+            except yt_dlp.utils.DownloadCancelled as e:
+                self._report_status(f"⏹️ Download cancelled: {str(e)[:100]}", error=True)
+                return False
+                
             except yt_dlp.DownloadError as e:
                 error_str = str(e).lower()
                 if "private" in error_str:
@@ -451,11 +618,10 @@ class VideoDownloader:
                 return False
                 
             finally:
-                # Clean up temp cache
+                # Keep the shared extractor cache within its size budget
                 try:
-                    if os.path.exists(temp_cache):
-                        shutil.rmtree(temp_cache)
-                except:
+                    self.extractor_cache.maybe_prune()
+                except Exception:
                     pass
                     
         except Exception as e:
@@ -474,27 +640,20 @@ class VideoDownloader:
             self._report_status(error_msg, error=True)
             return False
     
-    def verify_download_success(self, url, info=None):
-        """Verify that files were actually downloaded"""
+    def verify_download_success(self, url, info=None, paths=None):
+        """Verify that the files reported by yt-dlp were actually downloaded"""
         try:
             downloaded_files = []
-            current_time = time.time()
             
-            if os.path.exists(self.download_path):
-                for file in os.listdir(self.download_path):
-                    file_path = os.path.join(self.download_path, file)
-                    if os.path.isfile(file_path):
-                        # Check if file was created recently (within last 5 minutes)
-                        file_mtime = os.path.getmtime(file_path)
-                        if current_time - file_mtime < 300:  # 5 minutes
-                            file_size = os.path.getsize(file_path)
-                            if file_size > 1024:  # At least 1KB
-                                downloaded_files.append({
-                                    'name': file,
-                                    'path': file_path,
-                                    'size': file_size / (1024*1024),  # MB
-                                    'mtime': file_mtime
-                                })
+            for file_path in paths or []:
+                if os.path.isfile(file_path):
+                    file_size = os.path.getsize(file_path)
+                    if file_size > 1024:  # At least 1KB
+                        downloaded_files.append({
+                            'name': os.path.basename(file_path),
+                            'path': file_path,
+                            'size': file_size / (1024*1024),  # MB
+                        })
             
             if not downloaded_files:
                 self._report_status("❌ No files were downloaded. Please check the URL and try again.", error=True)
@@ -505,7 +664,7 @@ class VideoDownloader:
             video_files = [f for f in downloaded_files if f['name'].lower().endswith(video_exts)]
             
             if video_files:
-                main_video = max(video_files, key=lambda x: x['mtime'])
+                main_video = video_files[0]
                 title = info.get('title', 'Video') if info else 'Video'
                 safe_title = title[:40] if title else 'Video'
                 success_msg = f"✅ Downloaded: {safe_title} ({main_video['size']:.1f}MB)"
@@ -936,6 +1095,59 @@ class VideoDownloader:
             except:
                 pass
 
+class PoolTimeout(Exception):
+    """No pooled downloader became free in time"""
+
+
+class DownloaderPool:
+    """Thread-safe pool of pre-initialised headless VideoDownloaders
+    
+    Capability probing and folder setup happen once when a downloader is
+    created; jobs borrow one with acquire() and attach their own callbacks.
+    """
+    
+    def __init__(self, size=None, download_path=None):
+        if size is None:
+            size = int(os.environ.get('DAZZLO_MAX_WORKERS', '4'))
+        self.size = 0
+        self.download_path = download_path or default_download_path()
+        probe_ffmpeg()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self.resize(size)
+    
+    def resize(self, size):
+        """Grow the pool to size downloaders, creating the new ones now"""
+        with self._lock:
+            while self._created < size:
+                self._idle.put(VideoDownloader(headless=True, download_path=self.download_path))
+                self._created += 1
+            self.size = max(self.size, self._created, 1)
+    
+    def _get(self, timeout=None):
+        # Pool exhausted; wait for a downloader to be returned
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise PoolTimeout(f'No downloader free after {timeout}s')
+    
+    @contextmanager
+    def acquire(self, status_callback=None, progress_callback=None, timeout=None):
+        """Borrow a downloader wired to the given callbacks (PoolTimeout after timeout seconds)"""
+        downloader = self._get(timeout)
+        downloader.status_callback = status_callback
+        downloader.progress_callback = progress_callback
+        try:
+            yield downloader
+        finally:
+            downloader.status_callback = None
+            downloader.progress_callback = None
+            self._idle.put(downloader)
+    
+    def stats(self):
+        return {'size': self.size, 'created': self._created, 'idle': self._idle.qsize()}
+
 def main():
     """Main function"""
     print("=" * 60)
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+Download pipeline executed by the job workers
+Fetches the video with VideoDownloader and applies post-processing.
+"""
+
+import os
+import shutil
+from main import DownloaderPool, REMUX_ONLY_PLATFORMS, detect_platform, probe_ffmpeg
+from cache import InfoCache, ResultCache, make_cache_key
+from jobs import JobCancelled, JobManager, SingleFlight
+from jobstore import JOB_STORE_FILENAME, open_job_store
+from broker import open_broker
+from retention import RetentionManager
+from storage import open_name_index, token_dir
+from postprocess import default_scheduler, EncodeCancelled, PRIORITIES, PRIORITY_NORMAL
+from encoding import get_profile
+
+VIDEO_EXTS = ('.mp4', '.mkv', '.webm', '.mov', '.avi', '.flv', '.m4v')
+
+# Per-job work directories live under <download_path>/jobs/<shard>/<shard>/<job_id> (see storage.py)
+JOBS_DIRNAME = 'jobs'
+
+# Where DAZZLO_BROKER=sqlite:// keeps its queue
+BROKER_FILENAME = 'broker.sqlite3'
+
+# Post-processing modes, cheapest last
+POSTPROCESS_ENCODE = 'encode'
+POSTPROCESS_REMUX = 'remux'
+
+# Single-file HTTP formats can be streamed while they download
+STREAM_FORMAT = 'best[height<=1080][protocol^=http]/best[protocol^=http]/best'
+
+# Pre-initialised downloaders shared by the job workers
+downloader_pool = DownloaderPool()
+
+# /info has downloaders of its own so previews never queue behind downloads
+info_pool = DownloaderPool(size=int(os.environ.get('DAZZLO_INFO_WORKERS', '2')),
+                           download_path=downloader_pool.download_path)
+
+# Longest /info waits for a free info downloader before answering 503 (seconds)
+INFO_ACQUIRE_TIMEOUT = 10
+
+# Finished outputs shared by every job in this process
+result_cache = ResultCache(downloader_pool.download_path)
+
+# Recent extract_info results, shared by /info and the download jobs
+info_cache = InfoCache()
+
+# Concurrent jobs for the same video share one download
+download_flights = SingleFlight()
+
+# Distributed mode: web processes publish jobs here and worker.py runs them
+broker = open_broker(default_path=os.path.join(downloader_pool.download_path, BROKER_FILENAME))
+
+# Bare filenames of the top-level videos `python storage.py` moved into token directories
+name_index = open_name_index(downloader_pool.download_path)
+
+
+def job_work_dir(download_path, job_id):
+    """Directory a job downloads and post-processes into"""
+    return token_dir(os.path.join(download_path, JOBS_DIRNAME), job_id)
+
+
+def job_file_path(download_path, token, filename):
+    """Path of an output by its public token; unmigrated flat job directories still resolve"""
+    path = os.path.join(job_work_dir(download_path, token), filename)
+    if not os.path.exists(path):
+        flat_path = os.path.join(download_path, JOBS_DIRNAME, token, filename)
+        if os.path.exists(flat_path):
+            return flat_path
+    return path
+
+
+def legacy_file_path(download_path, filename):
+    """Path of a file linked by bare name, from before every output had a token directory"""
+    token = name_index.token_for(filename) if name_index else None
+    if token:
+        return os.path.join(job_work_dir(download_path, token), filename)
+    return os.path.join(download_path, filename)
+
+
+def file_url_for(path):
+    """Public URL for an output file inside a job directory"""
+    job_id = os.path.basename(os.path.dirname(path))
+    return f'/file/{job_id}/{os.path.basename(path)}'
+
+
+def file_result(path, message):
+    """Build the success result dict for a finished output file"""
+    filename = os.path.basename(path)
+    return {
+        'success': True,
+        'message': message,
+        'file_url': file_url_for(path),
+        'file_path': path,
+        'filename': filename,
+        'size': os.path.getsize(path)
+    }
+
+
+def get_video_info(url, downloader):
+    """Return the yt-dlp info dict for url, using the in-memory info cache"""
+    info = info_cache.get(url)
+    if info is None:
+        info = downloader.extract_video_info(url)
+        info_cache.put(url, info)
+    return info
+
+
+def extract_preview_info(url):
+    """get_video_info for /info on an info_pool downloader; raises PoolTimeout when all stay busy"""
+    with info_pool.acquire(timeout=INFO_ACQUIRE_TIMEOUT) as info_downloader:
+        return get_video_info(url, info_downloader)
+
+
+def info_summary(info):
+    """Compact, JSON-safe preview of a yt-dlp info dict"""
+    formats = []
+    for f in info.get('formats') or []:
+        formats.append({
+            'format_id': f.get('format_id'),
+            'ext': f.get('ext'),
+            'width': f.get('width'),
+            'height': f.get('height'),
+            'fps': f.get('fps'),
+            'vcodec': f.get('vcodec'),
+            'acodec': f.get('acodec'),
+            'filesize': f.get('filesize') or f.get('filesize_approx'),
+            'format_note': f.get('format_note'),
+        })
+    return {
+        'id': info.get('id'),
+        'extractor': info.get('extractor_key') or info.get('extractor'),
+        'title': info.get('title'),
+        'uploader': info.get('uploader'),
+        'duration': info.get('duration'),
+        'thumbnail': info.get('thumbnail'),
+        'webpage_url': info.get('webpage_url'),
+        'is_playlist': 'entries' in info,
+        'formats': formats,
+    }
+
+
+def parse_download_request(data):
+    """Validate a /download request body; returns (url, options, error_message)"""
+    url = (data or {}).get('url')
+    if not url:
+        return None, None, 'No URL provided.'
+    
+    # Validate URL format
+    if not url.startswith(('http://', 'https://')):
+        return None, None, 'Please provide a valid URL starting with http:// or https://'
+    
+    profile = data.get('profile')
+    if profile is not None:
+        try:
+            get_profile(profile)
+        except ValueError as e:
+            return None, None, str(e)
+    
+    options = {
+        'remove_watermark': data.get('removeWatermark', True),
+        'stream': bool(data.get('stream', False)),
+        'remux_only': bool(data.get('remuxOnly', False)),
+        'priority': PRIORITIES.get(data.get('priority'), PRIORITY_NORMAL),
+        'profile': profile,
+    }
+    return url, options, None
+
+
+def postprocess_mode(platform, options, ffmpeg_available=True):
+    """Decide how much work a job's output needs: encode, remux or None
+
+    Only watermark removal on platforms that burn one into the picture needs a
+    re-encode; everything else at most has its container rewritten.
+    """
+    if options.get('stream') or not ffmpeg_available:
+        return None  # Streamed bytes go out exactly as downloaded
+    if options.get('remux_only'):
+        return POSTPROCESS_REMUX
+    if options.get('remove_watermark', True):
+        return POSTPROCESS_REMUX if platform in REMUX_ONLY_PLATFORMS else POSTPROCESS_ENCODE
+    return None
+
+
+def create_job_manager(max_workers=None, recover=None):
+    """JobManager on the shared job store
+
+    recover (default: when there is no broker) makes it resume downloads
+    orphaned by dead workers; with a broker, the broker redelivers them.
+    """
+    store = open_job_store(default_path=os.path.join(downloader_pool.download_path, JOB_STORE_FILENAME))
+    manager = JobManager(max_workers=max_workers, store=store)
+    if recover is None:
+        recover = broker is None
+    if recover:
+        manager.enable_recovery(run_download_job)
+    return manager
+
+
+def start_retention(job_manager):
+    """Start the disk retention sweep for the download folder
+
+    Directories of jobs queued or running in any process (per the shared
+    job store) are never evicted.
+    """
+    def active_jobs():
+        return [record['id'] for record in job_manager.store.active()]
+    return RetentionManager(downloader_pool.download_path, active_jobs=active_jobs,
+                            jobs_dirname=JOBS_DIRNAME).start()
+
+
+def submit_download(job_manager, url, options):
+    """Queue a download job; returns (job, retry_after)
+
+    job is None and retry_after is a hint in seconds when post-processing
+    is saturated, so the caller can answer 503 instead of queueing more work.
+    With a broker the job is handed to the worker processes, which only
+    take on what they can run.
+    """
+    if broker is not None:
+        return job_manager.dispatch(broker, url, options), None
+    needs_encode = postprocess_mode(detect_platform(url), options, probe_ffmpeg()) == POSTPROCESS_ENCODE
+    if needs_encode and default_scheduler.saturated():
+        return None, default_scheduler.retry_after()
+    job = job_manager.submit(url, run_download_job, options)
+    if needs_encode:
+        default_scheduler.admit(job)
+    return job, None
+
+
+def info_busy_response():
+    """JSON body returned with 503 when every /info downloader stayed busy"""
+    return {
+        'success': False,
+        'message': 'Too many previews in progress. Please try again shortly.',
+        'retry_after': INFO_ACQUIRE_TIMEOUT
+    }
+
+
+def busy_response(retry_after):
+    """JSON body returned with 503 when post-processing is saturated"""
+    return {
+        'success': False,
+        'message': 'Server is busy processing other videos. Please try again shortly.',
+        'retry_after': retry_after
+    }
+
+
+def queued_response(job):
+    """JSON body returned when a download job has been queued"""
+    response = {
+        'success': True,
+        'job_id': job.id,
+        'state': job.state,
+        'status_url': f'/jobs/{job.id}',
+        'message': 'Download queued'
+    }
+    if job.options.get('stream'):
+        response['stream_url'] = f'/jobs/{job.id}/stream'
+    return response
+
+
+class DownloadPlan:
+    """Everything the shared download needs to know about a request"""
+
+    def __init__(self, url, work_dir, platform, info=None, cache_key=None,
+                 postprocess=None, format=None, priority=PRIORITY_NORMAL, profile=None, flight_key=None):
+        self.url = url
+        self.work_dir = work_dir
+        self.platform = platform
+        self.info = info
+        self.cache_key = cache_key
+        self.postprocess = postprocess
+        self.format = format
+        self.priority = priority
+        self.profile = profile
+        # Identical requests in flight share one download
+        self.flight_key = flight_key or cache_key
+
+
+def run_download_job(job):
+    """Download a job's URL and return the result dict served by /jobs/<id>"""
+    with downloader_pool.acquire(job.report_status, job.report_progress) as current_downloader:
+        plan, cached = _plan_download(job, current_downloader)
+    if cached:
+        return cached
+
+    def lead(call):
+        # Only the leader holds a downloader; followers just wait for its result
+        with downloader_pool.acquire() as leader_downloader:
+            return _download_and_process(call, leader_downloader, plan)
+
+    # Coalesce with any identical download already in flight
+    result, shared = download_flights.do(plan.flight_key, lead, job)
+    if job.cancelled:
+        raise JobCancelled(job.cancel_reason)
+    if shared:
+        print(f"[DEBUG] Shared in-flight download for URL: {job.url}")
+    return result
+
+
+def _plan_download(job, current_downloader):
+    """Cache lookup and DownloadPlan for a job; returns (plan, None), or (None, result) on a cache hit"""
+    url = job.url
+    stream = bool(job.options.get('stream', False))
+    print(f"[DEBUG] Using download path: {current_downloader.download_path}")
+
+    # Detect platform
+    platform = current_downloader.detect_platform_from_url(url)
+    print(f"[DEBUG] Detected platform: {platform}")
+
+    # Live streaming serves the raw file, so it cannot be post-processed
+    postprocess = postprocess_mode(platform, job.options, current_downloader.ffmpeg_available)
+    print(f"[DEBUG] Post-processing: {postprocess or 'none'}")
+
+    # Serve repeated requests for the same video from the result cache
+    info = get_video_info(url, current_downloader)
+    options = {'postprocess': postprocess, 'stream': stream}
+    profile = None
+    if postprocess == POSTPROCESS_ENCODE:
+        # Different profiles produce different files
+        profile = get_profile(job.options.get('profile')).name
+        options['profile'] = profile
+    cache_key = make_cache_key(info, options)
+    cached = result_cache.get(cache_key)
+    if cached:
+        job.report_status('⚡ Served from cache')
+        return None, file_result(cached['path'], f"Download completed: {os.path.basename(cached['path'])}")
+
+    plan = DownloadPlan(
+        url,
+        job_work_dir(current_downloader.download_path, job.id),
+        platform,
+        info=info,
+        cache_key=cache_key,
+        postprocess=postprocess,
+        format=STREAM_FORMAT if stream else None,
+        priority=job.options.get('priority', PRIORITY_NORMAL),
+        profile=profile,
+        flight_key=cache_key or f'url:{url}:{sorted(options.items())}'
+    )
+    return plan, None
+
+
+def _fan_out(call):
+    """Status and progress callbacks that reach every job attached to a call"""
+    def status_callback(message, error=False):
+        for member in list(call.members):
+            member.report_status(message, error)
+
+    def progress_callback(progress):
+        active = 0
+        for member in list(call.members):
+            try:
+                member.report_progress(progress)
+                active += 1
+            except JobCancelled:
+                pass
+        # Only abort the shared download once every attached job has given up
+        if not active:
+            raise JobCancelled('All jobs for this download were cancelled')
+
+    return status_callback, progress_callback
+
+
+def _download_and_process(call, current_downloader, plan):
+    """Download and post-process once on behalf of every job in call"""
+    status_callback, progress_callback = _fan_out(call)
+    current_downloader.status_callback = status_callback
+    current_downloader.progress_callback = progress_callback
+
+    # Download video into the job's own directory
+    downloaded_paths = current_downloader.download_video(
+        plan.url, output_dir=plan.work_dir, info=plan.info, format=plan.format)
+    print(f"[DEBUG] Downloaded files: {downloaded_paths}")
+
+    if not downloaded_paths:
+        print(f"[DEBUG] Download failed for URL: {plan.url}")
+        # Drop partial files left in the job directory
+        shutil.rmtree(plan.work_dir, ignore_errors=True)
+        return {
+            'success': False,
+            'message': 'Download failed. Please check the URL and try again.',
+            'file_url': None
+        }
+
+    video_files = [p for p in downloaded_paths if p.lower().endswith(VIDEO_EXTS) and os.path.isfile(p)]
+    if not video_files:
+        return {
+            'success': False,
+            'message': 'No video files found after download.',
+            'file_url': None
+        }
+
+    result_path = video_files[0]
+
+    def should_cancel():
+        return all(member.cancelled for member in call.members)
+
+    try:
+        if plan.postprocess == POSTPROCESS_ENCODE:
+            # Remove watermark if requested and FFmpeg is available
+            progress_callback({'stage': 'watermark', 'status': 'started'})
+            status_callback('🧹 Removing watermarks...')
+            cleaned_path = current_downloader.remove_watermark_from_video(
+                result_path, plan.platform, priority=plan.priority, should_cancel=should_cancel,
+                profile=plan.profile)
+            if cleaned_path and cleaned_path != result_path and os.path.exists(cleaned_path):
+                result_path = cleaned_path
+                status_callback('✨ Watermarks removed successfully!')
+            progress_callback({'stage': 'watermark', 'status': 'finished'})
+        elif plan.postprocess == POSTPROCESS_REMUX:
+            # Container change only; streams are copied untouched
+            progress_callback({'stage': 'remux', 'status': 'started'})
+            remuxed_path = current_downloader.remux_video(result_path, should_cancel=should_cancel)
+            if remuxed_path != result_path:
+                result_path = remuxed_path
+                status_callback('📦 Converted to MP4 without re-encoding')
+            progress_callback({'stage': 'remux', 'status': 'finished'})
+    except EncodeCancelled:
+        shutil.rmtree(plan.work_dir, ignore_errors=True)
+        raise
+
+    if result_path != video_files[0]:
+        # Only the post-processed file is served; don't leave the download for the retention sweep
+        try:
+            os.remove(video_files[0])
+        except OSError:
+            pass
+
+    result_cache.put(plan.cache_key, result_path, {'url': plan.url, 'title': (plan.info or {}).get('title')})
+    return file_result(result_path, f'Download completed: {os.path.basename(result_path)}')
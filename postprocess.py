@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Post-processing scheduler for DazzloGet
+FFmpeg encodes are CPU-bound, so they run on a small fixed set of encode
+slots sized to the machine instead of inside whichever worker asked for them.
+Tasks wait in a priority queue, have their own timeout, can be cancelled
+(the ffmpeg child is killed) and the queue depth drives backpressure to /download.
+
+ffmpeg is run with -progress pipe:1, parsed into frame/time/speed events as
+it encodes; only a short tail of stderr is kept, and an encode whose output
+time stops advancing is killed as stalled.
+"""
+
+import heapq
+import itertools
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+
+# Lower numbers are encoded first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+PRIORITIES = {'high': PRIORITY_HIGH, 'normal': PRIORITY_NORMAL, 'low': PRIORITY_LOW}
+
+# How often a waiting or running task checks for cancellation and its deadline
+POLL_INTERVAL = 0.5
+
+# Lines of output kept per task for error messages
+OUTPUT_TAIL_LINES = 50
+
+
+class EncodeCancelled(Exception):
+    """Raised by run() when the task was cancelled before ffmpeg finished"""
+
+
+class _Task:
+    """One queued ffmpeg invocation"""
+
+    def __init__(self, cmd, timeout, progress_callback=None, duration=None):
+        self.cmd = cmd
+        self.timeout = timeout
+        self.progress_callback = progress_callback
+        self.duration = duration
+        self.progress = {}
+        self.last_progress = None
+        self.cancel_event = threading.Event()
+        self.done = threading.Event()
+        self.started = False
+        self.timed_out = False
+        self.stalled = False
+        self.returncode = None
+        self.stdout = None
+        self.stderr = None
+        self.queued_at = time.time()
+
+
+class PostProcessScheduler:
+    """Bounded, prioritised executor for ffmpeg subprocesses"""
+
+    def __init__(self, max_concurrent=None, max_queue=None, timeout=None, stall_timeout=None):
+        cpus = os.cpu_count() or 1
+        if max_concurrent is None:
+            # libx264 already uses several threads; two encodes per four cores keeps the box responsive
+            max_concurrent = int(os.environ.get('DAZZLO_ENCODE_WORKERS', str(max(1, cpus // 2))))
+        if max_queue is None:
+            max_queue = int(os.environ.get('DAZZLO_ENCODE_QUEUE', str(max_concurrent * 4)))
+        if timeout is None:
+            timeout = float(os.environ.get('DAZZLO_ENCODE_TIMEOUT', '300'))
+        if stall_timeout is None:
+            stall_timeout = float(os.environ.get('DAZZLO_ENCODE_STALL_TIMEOUT', '60'))
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        # Split the cores between the encode slots
+        self.threads_per_encode = max(1, cpus // self.max_concurrent)
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.stalls = 0
+        self.cancelled = 0
+        self._avg_seconds = None
+        self._heap = []
+        self._seq = itertools.count()
+        self._running = 0
+        self._admitted = set()
+        self._workers = []
+        self._cond = threading.Condition()
+
+    def run(self, cmd, priority=PRIORITY_NORMAL, timeout=None, should_cancel=None,
+            progress_callback=None, duration=None):
+        """Queue cmd and block until it finishes; returns a CompletedProcess
+
+        progress_callback(event) is called from the encode thread with parsed
+        ffmpeg progress; duration (seconds of media) adds percent and eta.
+        Raises subprocess.TimeoutExpired when the encode overruns its timeout
+        or stalls, and EncodeCancelled when should_cancel() turns true first.
+        """
+        task = _Task(cmd, self.timeout if timeout is None else timeout, progress_callback, duration)
+        with self._cond:
+            self._start_workers()
+            heapq.heappush(self._heap, (priority, next(self._seq), task))
+            self._cond.notify()
+
+        while not task.done.wait(POLL_INTERVAL):
+            if should_cancel and should_cancel():
+                task.cancel_event.set()
+                with self._cond:
+                    if not task.started:
+                        # Still queued; the worker will skip it
+                        self.cancelled += 1
+                        raise EncodeCancelled('Post-processing cancelled')
+                # Running; wait for the worker to kill ffmpeg
+                task.done.wait()
+                break
+
+        if task.cancel_event.is_set():
+            raise EncodeCancelled('Post-processing cancelled')
+        if task.timed_out:
+            raise subprocess.TimeoutExpired(cmd, task.timeout, output=task.stdout, stderr=task.stderr)
+        return subprocess.CompletedProcess(cmd, task.returncode, task.stdout, task.stderr)
+
+    def admit(self, job):
+        """Count a queued job towards the backlog until job.done"""
+        with self._cond:
+            self._admitted.add(job)
+
+    def saturated(self):
+        """True when admitted jobs already fill every encode slot and the queue"""
+        return self.backlog() >= self.max_concurrent + self.max_queue
+
+    def backlog(self):
+        with self._cond:
+            self._admitted = {job for job in self._admitted if not job.done}
+            return len(self._admitted)
+
+    def retry_after(self):
+        """Rough number of seconds until an encode slot frees up"""
+        avg = self._avg_seconds or 30
+        waves = max(1, self.backlog() - self.max_concurrent - self.max_queue + 1) / self.max_concurrent
+        return int(min(300, max(5, avg * waves)))
+
+    def stats(self):
+        with self._cond:
+            queued = sum(1 for _, _, task in self._heap if not task.cancel_event.is_set())
+            running = self._running
+        return {
+            'max_concurrent': self.max_concurrent,
+            'max_queue': self.max_queue,
+            'threads_per_encode': self.threads_per_encode,
+            'timeout': self.timeout,
+            'stall_timeout': self.stall_timeout,
+            'running': running,
+            'queued': queued,
+            'backlog': self.backlog(),
+            'completed': self.completed,
+            'failed': self.failed,
+            'timeouts': self.timeouts,
+            'stalls': self.stalls,
+            'cancelled': self.cancelled,
+            'avg_seconds': round(self._avg_seconds, 2) if self._avg_seconds else None,
+        }
+
+    def _start_workers(self):
+        """Start the encode threads on first use (caller holds the lock)"""
+        while len(self._workers) < self.max_concurrent:
+            worker = threading.Thread(target=self._worker, name=f'dazzlo-encode-{len(self._workers)}')
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, task = heapq.heappop(self._heap)
+                if task.cancel_event.is_set():
+                    continue
+                task.started = True
+                self._running += 1
+            try:
+                self._execute(task)
+            finally:
+                with self._cond:
+                    self._running -= 1
+                task.done.set()
+
+    def _execute(self, task):
+        """Run one ffmpeg process, killing it on cancellation, timeout or stall"""
+        started = time.time()
+        deadline = started + task.timeout if task.timeout else None
+        cmd = task.cmd
+        watch_progress = os.path.basename(cmd[0]).startswith('ffmpeg')
+        if watch_progress:
+            # Machine-readable progress on stdout instead of the stats line on stderr
+            cmd = [cmd[0], '-nostats', '-progress', 'pipe:1'] + list(cmd[1:])
+        try:
+            proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, text=True, errors='replace')
+        except OSError as e:
+            task.returncode = -1
+            task.stderr = str(e)
+            self.failed += 1
+            return
+
+        task.last_progress = started
+        stdout_tail = deque(maxlen=OUTPUT_TAIL_LINES)
+        stderr_tail = deque(maxlen=OUTPUT_TAIL_LINES)
+        readers = [
+            threading.Thread(target=self._read_progress if watch_progress else self._read_tail,
+                             args=(proc.stdout, task) if watch_progress else (proc.stdout, stdout_tail)),
+            threading.Thread(target=self._read_tail, args=(proc.stderr, stderr_tail)),
+        ]
+        for reader in readers:
+            reader.daemon = True
+            reader.start()
+
+        while True:
+            try:
+                proc.wait(timeout=POLL_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            now = time.time()
+            if deadline and now > deadline:
+                task.timed_out = True
+            elif watch_progress and self.stall_timeout and now - task.last_progress > self.stall_timeout:
+                print(f"⚠️ ffmpeg made no progress for {int(self.stall_timeout)}s, killing it")
+                task.timed_out = task.stalled = True
+            elif not task.cancel_event.is_set():
+                continue
+            self._kill(proc)
+            break
+
+        for reader in readers:
+            reader.join(timeout=5)
+        task.stdout = ''.join(stdout_tail)
+        task.stderr = ''.join(stderr_tail)
+        task.returncode = proc.returncode
+        if task.cancel_event.is_set():
+            self.cancelled += 1
+        elif task.stalled:
+            self.stalls += 1
+        elif task.timed_out:
+            self.timeouts += 1
+        elif proc.returncode == 0:
+            self.completed += 1
+            elapsed = time.time() - started
+            self._avg_seconds = elapsed if self._avg_seconds is None else 0.8 * self._avg_seconds + 0.2 * elapsed
+        else:
+            self.failed += 1
+
+    def _read_tail(self, stream, tail):
+        """Drain a pipe, keeping only its last lines"""
+        for line in stream:
+            tail.append(line)
+
+    def _read_progress(self, stream, task):
+        """Parse ffmpeg's key=value progress blocks as they arrive"""
+        block = {}
+        for line in stream:
+            key, _, value = line.strip().partition('=')
+            if key != 'progress':
+                block[key] = value
+                continue
+            event = parse_progress(block, task.duration)
+            event['status'] = 'finished' if value == 'end' else 'encoding'
+            block = {}
+
+            previous = task.progress
+            if (event.get('out_time') or 0) > (previous.get('out_time') or 0) or \
+                    (event.get('frame') or 0) > (previous.get('frame') or 0):
+                task.last_progress = time.time()
+            task.progress = event
+            if task.progress_callback:
+                try:
+                    task.progress_callback(event)
+                except Exception:
+                    pass  # A listener's problem must not kill the encode thread
+
+    def _kill(self, proc):
+        """Ask ffmpeg to stop, then force it"""
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def parse_progress(block, duration=None):
+    """Turn one ffmpeg -progress block into frame/fps/out_time/speed (+percent/eta)"""
+    def number(key, cast=float):
+        try:
+            return cast(block.get(key, '').rstrip('x'))
+        except ValueError:
+            return None  # 'N/A' before the first frame
+
+    out_time_us = number('out_time_us', int)
+    event = {
+        'frame': number('frame', int),
+        'fps': number('fps'),
+        'out_time': round(out_time_us / 1e6, 2) if out_time_us is not None and out_time_us >= 0 else None,
+        'speed': number('speed'),
+        'total_size': number('total_size', int),
+    }
+    if duration and event['out_time'] is not None:
+        event['percent'] = round(min(100.0, 100.0 * event['out_time'] / duration), 1)
+        if event['speed']:
+            event['eta'] = int(max(0.0, duration - event['out_time']) / event['speed'])
+    return event
+
+
+# Process-wide scheduler shared by every VideoDownloader
+default_scheduler = PostProcessScheduler()
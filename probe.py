@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Media probing for DazzloGet
+One ffprobe call per file (cached until the file changes) supplies the
+resolution, rotation, frame rate, codecs, bitrate and stream timing that the
+filter-graph builder, remuxer and segmented encoder need.
+"""
+
+import json
+import subprocess
+from cache import ProbeCache
+
+# Shared by every VideoDownloader in this process
+probe_cache = ProbeCache()
+
+
+def probe_media(path):
+    """Return a summary of path's first video and audio streams, or None
+
+    {'duration', 'bit_rate', 'format',
+     'video': {'codec', 'width', 'height', 'rotation', 'display_width', 'display_height',
+               'frame_rate', 'bit_rate', 'duration', 'start_time', 'nb_frames', 'pix_fmt'},
+     'audio': {'codec', 'bit_rate', 'duration', 'start_time', 'nb_frames', 'channels'}}
+    """
+    key = ProbeCache.key_for(path)
+    if key is None:
+        return None
+    media = probe_cache.get(key)
+    if media is None:
+        media = _run_ffprobe(path)
+        probe_cache.put(key, media)
+    return media
+
+
+def _run_ffprobe(path):
+    cmd = ['ffprobe', '-v', 'error', '-show_format', '-show_streams', '-of', 'json', path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        if result.returncode != 0:
+            return None
+        data = json.loads(result.stdout or '{}')
+    except (OSError, subprocess.TimeoutExpired, ValueError):
+        return None  # No ffprobe, or unreadable output
+
+    fmt = data.get('format', {})
+    media = {
+        'duration': _float(fmt.get('duration')),
+        'bit_rate': _int(fmt.get('bit_rate')),
+        'format': fmt.get('format_name'),
+        'video': None,
+        'audio': None,
+    }
+    for stream in data.get('streams', []):
+        kind = stream.get('codec_type')
+        if kind not in ('video', 'audio') or media[kind] is not None:
+            continue
+        if kind == 'video' and (stream.get('disposition') or {}).get('attached_pic'):
+            continue  # Cover art, not the picture
+        summary = {
+            'codec': stream.get('codec_name'),
+            'bit_rate': _int(stream.get('bit_rate')),
+            'duration': _float(stream.get('duration')),
+            'start_time': _float(stream.get('start_time')) or 0.0,
+            'nb_frames': _int(stream.get('nb_frames')),
+        }
+        if kind == 'video':
+            width, height = _int(stream.get('width')), _int(stream.get('height'))
+            rotation = _rotation(stream)
+            # ffmpeg autorotates before filtering, so filters see the display size
+            swapped = rotation in (90, 270)
+            summary.update({
+                'width': width,
+                'height': height,
+                'rotation': rotation,
+                'display_width': height if swapped else width,
+                'display_height': width if swapped else height,
+                'frame_rate': _rate(stream.get('avg_frame_rate')) or _rate(stream.get('r_frame_rate')),
+                'pix_fmt': stream.get('pix_fmt'),
+            })
+        else:
+            summary['channels'] = _int(stream.get('channels'))
+        media[kind] = summary
+    return media
+
+
+def video_bit_rate(media):
+    """Best estimate of the source video bitrate in bits/s, or None"""
+    if not media or not media['video']:
+        return None
+    if media['video']['bit_rate']:
+        return media['video']['bit_rate']
+    # WebM/MKV often only carry an overall bitrate
+    audio = (media['audio'] or {}).get('bit_rate') or 0
+    return media['bit_rate'] - audio if media['bit_rate'] and media['bit_rate'] > audio else None
+
+
+def _rotation(stream):
+    """Display rotation in degrees normalised to 0-359 (90/270 mean width and height swap)"""
+    rotation = 0
+    for side_data in stream.get('side_data_list') or []:
+        if 'rotation' in side_data:
+            rotation = _float(side_data['rotation']) or 0
+            break
+    else:
+        rotation = _float((stream.get('tags') or {}).get('rotate')) or 0
+    return int(round(rotation)) % 360
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _rate(value):
+    try:
+        num, den = (value or '0/0').split('/')
+        return float(num) / float(den) if float(den) else None
+    except ValueError:
+        return None
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Watermark removal core for DazzloGet
+Everything the Visual Watermark Remover does short of drawing its window:
+mapping selected areas onto the video, building the ffmpeg filter graph and
+running the encode on the post-processing scheduler. Nothing here touches
+Tk, so servers and batch.py can import it.
+"""
+
+import os
+import subprocess
+import time
+from encoding import EncoderProfile, get_profile
+from filtergraph import build_watermark_filter, encode_limits
+from postprocess import default_scheduler, EncodeCancelled, PRIORITY_HIGH, PRIORITY_NORMAL
+from probe import probe_media
+
+VIDEO_EXTS = ('.mp4', '.mkv', '.webm', '.mov', '.avi', '.flv', '.m4v')
+
+# Size of the preview canvas in watermark.py
+CANVAS_SIZE = (600, 400)
+
+# Length of a preview render (seconds)
+PREVIEW_SECONDS = 3
+# Previews only have to show where the areas land; ultrafast halves the encode time of 'fast'
+PREVIEW_PROFILE = EncoderProfile('preview', preset='ultrafast', crf=23,
+                                 description='Region-check previews; not for output')
+
+# "Crop borders" and "Enhance quality" options
+CROP_FILTER = 'crop=iw-40:ih-60:20:30'
+ENHANCE_FILTER = 'unsharp=5:5:1.0:5:5:0.0'
+
+
+class PreviewTransform:
+    """Mapping between video pixels and the letterboxed preview canvas
+
+    The frame is scaled uniformly to fit the canvas and centered, so one
+    scale and two offsets describe both directions. watermark.py uses the
+    same instance to place the preview image and to export selections.
+    """
+
+    def __init__(self, video_size, canvas_size=CANVAS_SIZE):
+        self.video_width, self.video_height = video_size
+        canvas_width, canvas_height = canvas_size
+        self.scale = min(canvas_width / self.video_width, canvas_height / self.video_height)
+        self.display_width = max(1, int(self.video_width * self.scale))
+        self.display_height = max(1, int(self.video_height * self.scale))
+        self.offset_x = (canvas_width - self.display_width) // 2
+        self.offset_y = (canvas_height - self.display_height) // 2
+
+    def to_canvas(self, x, y):
+        return (int(round(self.offset_x + x * self.scale)), int(round(self.offset_y + y * self.scale)))
+
+    def to_video(self, x, y):
+        """Canvas point to video pixels, clamped to the frame (clicks can land in the bars)"""
+        vx = (x - self.offset_x) / self.scale
+        vy = (y - self.offset_y) / self.scale
+        return (int(round(min(max(vx, 0), self.video_width))), int(round(min(max(vy, 0), self.video_height))))
+
+    def area_to_video(self, area):
+        """(x1, y1, x2, y2) on the canvas -> (x, y, w, h) in video pixels"""
+        x1, y1 = self.to_video(area[0], area[1])
+        x2, y2 = self.to_video(area[2], area[3])
+        return (x1, y1, x2 - x1, y2 - y1)
+
+    def region_to_canvas(self, region):
+        """(x, y, w, h) in video pixels -> (x1, y1, x2, y2) on the canvas"""
+        x, y, w, h = region
+        return self.to_canvas(x, y) + self.to_canvas(x + w, y + h)
+
+
+def clamp_region(region, video_size):
+    """Fit (x, y, w, h) strictly inside the frame (delogo rejects boxes touching the edge)"""
+    x, y, w, h = (int(v) for v in region)
+    if not video_size:
+        return (x, y, w, h)
+    width, height = video_size
+    x1, y1 = max(1, x), max(1, y)
+    x2, y2 = min(width - 1, x + w), min(height - 1, y + h)
+    if x2 - x1 < 4 or y2 - y1 < 4:
+        return None
+    return (x1, y1, x2 - x1, y2 - y1)
+
+
+def build_filter(regions=(), video_size=None, crop=True, enhance=True, preset=None, media=None):
+    """ffmpeg -vf graph painting out regions (video pixels) plus the optional passes
+
+    preset names a filtergraph.WATERMARK_PRESETS entry; it brings its own
+    crop and sharpening, scaled to media, in place of crop/enhance.
+    Returns None when there is nothing to do.
+    """
+    filters = []
+    for region in regions:
+        box = clamp_region(region, video_size)
+        if box:
+            filters.append('delogo=x={}:y={}:w={}:h={}:show=0'.format(*box))
+
+    if preset:
+        preset_filter = build_watermark_filter(preset, media)
+        if preset_filter:
+            filters.append(preset_filter)
+    else:
+        if crop:
+            filters.append(CROP_FILTER)
+        if enhance:
+            filters.append(ENHANCE_FILTER)
+    return ','.join(filters) or None
+
+
+# Stem suffixes of files this module writes
+OUTPUT_SUFFIXES = ('_no_watermark', '_preview')
+
+
+def output_path_for(video_path, profile, output_dir=None, root=None):
+    """<name>_no_watermark.<container>, next to the input or in output_dir
+
+    With root, the input's directory relative to root is recreated under
+    output_dir, so same-named videos from different folders don't collide.
+    """
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    directory = output_dir or os.path.dirname(video_path)
+    if output_dir and root:
+        relative = os.path.relpath(os.path.dirname(os.path.abspath(video_path)), os.path.abspath(root))
+        if relative != os.curdir and not relative.startswith(os.pardir):
+            directory = os.path.join(output_dir, relative)
+    return os.path.join(directory, f"{base_name}_no_watermark.{profile.container}")
+
+
+def remove_watermarks(video_path, regions=(), output_path=None, crop=True, enhance=True, preset=None,
+                      detect=False, profile=None, scheduler=None, priority=PRIORITY_NORMAL, timeout=None,
+                      should_cancel=None, progress_callback=None, start=None, seconds=None):
+    """Paint out regions (x, y, w, h in video pixels) and re-encode video_path
+
+    detect=True adds the static overlays found by overlays.detect_static_regions.
+    start/seconds limit the encode to part of the video (see render_preview).
+    Returns a result dict with 'success', 'message', 'output_path', the filter
+    used and per-stage 'timings' in seconds. EncodeCancelled propagates.
+    """
+    started = time.time()
+    scheduler = scheduler or default_scheduler
+    timings = {}
+    result = {
+        'input': video_path,
+        'output_path': None,
+        'success': False,
+        'message': None,
+        'regions': [list(r) for r in regions],
+        'filter': None,
+        'timings': timings,
+    }
+    try:
+        profile = get_profile(profile)
+    except ValueError as e:
+        result['message'] = str(e)
+        return result
+    output_path = output_path or output_path_for(video_path, profile)
+    result['output_path'] = output_path
+
+    media = probe_media(video_path)
+    timings['probe'] = round(time.time() - started, 3)
+    if not media or not media['video']:
+        result['message'] = 'Not a readable video'
+        return result
+    video_size = (media['video']['display_width'], media['video']['display_height'])
+
+    regions = list(regions)
+    if detect:
+        try:
+            # OpenCV / numpy are only needed for detection, not for plain removal
+            from overlays import detect_static_regions
+        except ImportError as e:
+            result['message'] = f'Overlay detection needs opencv-python and numpy ({e})'
+            return result
+        detect_started = time.time()
+        found = detect_static_regions(video_path)
+        timings['detect'] = round(time.time() - detect_started, 3)
+        regions += found
+        result['detected'] = [list(r) for r in found]
+
+    video_filter = build_filter(regions, video_size, crop, enhance, preset, media)
+    if not video_filter:
+        result['message'] = 'Nothing to remove'
+        return result
+    result['filter'] = video_filter
+
+    duration = media['duration']
+    cmd = ['ffmpeg']
+    if start:
+        cmd += ['-ss', str(start)]
+    cmd += ['-i', video_path]
+    if seconds:
+        cmd += ['-t', str(seconds)]
+        duration = min(duration or seconds, seconds)
+    cmd += [
+        '-vf', video_filter,
+        *profile.output_args(threads=scheduler.threads_per_encode, limits=encode_limits(media)),
+        '-y', output_path
+    ]
+    encode_started = time.time()
+    try:
+        completed = scheduler.run(cmd, priority=priority, timeout=timeout, should_cancel=should_cancel,
+                                  progress_callback=progress_callback, duration=duration)
+    except subprocess.TimeoutExpired:
+        completed = None
+    except EncodeCancelled:
+        _remove(output_path)
+        raise
+    finally:
+        timings['encode'] = round(time.time() - encode_started, 3)
+        timings['total'] = round(time.time() - started, 3)
+
+    if completed is None:
+        result['message'] = 'Encode timed out or stalled'
+        _remove(output_path)
+    elif completed.returncode == 0 and os.path.exists(output_path):
+        result['success'] = True
+        result['message'] = 'Watermarks removed'
+        result['size'] = os.path.getsize(output_path)
+        result['duration'] = duration
+    else:
+        result['message'] = (completed.stderr or 'ffmpeg failed').strip()[-300:]
+        _remove(output_path)
+    return result
+
+
+def render_preview(video_path, regions=(), seconds=PREVIEW_SECONDS, start=0, output_path=None, **options):
+    """Encode only seconds of video from start with PREVIEW_PROFILE to check the regions
+
+    Takes the same options as remove_watermarks and returns its result dict;
+    the clip is written next to the input as <name>_preview.mp4 unless
+    output_path says otherwise. Runs ahead of queued full encodes.
+    """
+    options.setdefault('profile', PREVIEW_PROFILE)
+    options.setdefault('priority', PRIORITY_HIGH)
+    if output_path is None:
+        base_name = os.path.splitext(video_path)[0]
+        output_path = f"{base_name}_preview.{get_profile(options['profile']).container}"
+    return remove_watermarks(video_path, regions, output_path, start=start, seconds=seconds, **options)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Disk retention for DazzloGet's download folder
+A background sweep keeps the folder inside its quota and the disk below its
+high watermark: once either is crossed it deletes least recently served
+outputs until both are back under the low watermark. Originals left next to
+their _no_watermark / _clean / remuxed versions are removed as soon as the
+final file exists (the download pipeline already drops the source of each
+new output; the sweep catches the rest).
+
+Only job directories (see storage.py) and video files at the top of the folder
+are ever deleted. Jobs still queued or running, files being served and
+anything used in the last DAZZLO_RETENTION_MIN_AGE seconds are pinned.
+
+    DAZZLO_DISK_QUOTA             bytes the folder may use (0: no quota, disk watermarks only)
+    DAZZLO_DISK_HIGH_WATERMARK    start evicting above this fraction (0.9)
+    DAZZLO_DISK_LOW_WATERMARK     stop once below this fraction (0.8)
+    DAZZLO_RETENTION_MIN_AGE      seconds a new or served file is kept regardless (600)
+    DAZZLO_RETENTION_INTERVAL     seconds between sweeps (60)
+"""
+
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from storage import iter_token_dirs, token_dir, token_dir_of
+
+try:
+    import fcntl
+except ImportError:  # Windows: sweeps are not coordinated between processes
+    fcntl = None
+
+VIDEO_EXTS = ('.mp4', '.mkv', '.webm', '.mov', '.avi', '.flv', '.m4v')
+
+# Suffixes of post-processed outputs whose originals are intermediate
+OUTPUT_SUFFIXES = ('_no_watermark', '_clean')
+
+# Container every remux produces; the source beside it is intermediate
+REMUX_EXT = '.mp4'
+
+# Serving a file bumps its access time at most this often (seconds)
+TOUCH_INTERVAL = 60
+
+LOCK_FILENAME = '.dazzlo-retention.lock'
+
+
+def disk_size(st):
+    """Bytes a file really occupies (allocated blocks where the platform reports them)"""
+    blocks = getattr(st, 'st_blocks', None)
+    return blocks * 512 if blocks is not None else st.st_size
+
+
+def intermediate_files(directory):
+    """Video files in directory superseded by a post-processed version next to them"""
+    try:
+        names = [entry.name for entry in os.scandir(directory) if entry.is_file()]
+    except OSError:
+        return []
+    videos = {name for name in names if name.lower().endswith(VIDEO_EXTS)}
+    stems = {}
+    for name in videos:
+        stems.setdefault(Path(name).stem, []).append(name)
+
+    intermediates = set()
+    for stem, files in stems.items():
+        for suffix in OUTPUT_SUFFIXES:
+            if stem.endswith(suffix) and stem[:-len(suffix)] in stems:
+                intermediates.update(stems[stem[:-len(suffix)]])
+        remuxed = [name for name in files if name.lower().endswith(REMUX_EXT)]
+        if remuxed and len(files) > 1:
+            intermediates.update(name for name in files if name not in remuxed)
+    return [os.path.join(directory, name) for name in sorted(intermediates)]
+
+
+class _Item:
+    """Unit of eviction: a job directory or a loose file"""
+
+    def __init__(self, path, is_dir):
+        self.path = path
+        self.is_dir = is_dir
+        self.size = 0
+        self.last_used = 0
+
+
+class RetentionManager:
+    """Keeps a download folder within its quota and the disk below its watermarks"""
+
+    def __init__(self, root, quota=None, high_watermark=None, low_watermark=None, min_age=None, interval=None,
+                 active_jobs=None, jobs_dirname='jobs'):
+        if quota is None:
+            quota = int(os.environ.get('DAZZLO_DISK_QUOTA', '0'))
+        if high_watermark is None:
+            high_watermark = float(os.environ.get('DAZZLO_DISK_HIGH_WATERMARK', '0.9'))
+        if low_watermark is None:
+            low_watermark = float(os.environ.get('DAZZLO_DISK_LOW_WATERMARK', '0.8'))
+        if min_age is None:
+            min_age = float(os.environ.get('DAZZLO_RETENTION_MIN_AGE', '600'))
+        if interval is None:
+            interval = float(os.environ.get('DAZZLO_RETENTION_INTERVAL', '60'))
+        self.root = os.path.abspath(root)
+        self.jobs_dir = os.path.join(self.root, jobs_dirname)
+        self.quota = quota
+        self.high_watermark = high_watermark
+        self.low_watermark = min(low_watermark, high_watermark)
+        self.min_age = min_age
+        self.interval = interval
+        # Callable returning the ids of jobs still queued or running, in any process
+        self.active_jobs = active_jobs or (lambda: ())
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self.intermediates_removed = 0
+        self.intermediate_bytes = 0
+        self.last_sweep = None
+        self._pins = {}
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Run sweeps every interval seconds on a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='dazzlo-retention')
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def _item_path(self, path):
+        """Job directory a path belongs to, or the path itself for loose files"""
+        return token_dir_of(self.jobs_dir, path) or os.path.abspath(path)
+
+    def pin(self, path):
+        """Protect the file (and its job directory) from eviction until unpin()"""
+        item = self._item_path(path)
+        with self._lock:
+            self._pins[item] = self._pins.get(item, 0) + 1
+
+    def unpin(self, path):
+        item = self._item_path(path)
+        with self._lock:
+            count = self._pins.get(item, 0) - 1
+            if count > 0:
+                self._pins[item] = count
+            else:
+                self._pins.pop(item, None)
+
+    def touch(self, path):
+        """Record that path was served: its access time is the LRU clock"""
+        now = time.time()
+        with self._lock:
+            if now - self._touched.get(path, 0) < TOUCH_INTERVAL:
+                return
+            self._touched[path] = now
+            if len(self._touched) > 10000:
+                self._touched = {p: t for p, t in self._touched.items() if now - t < TOUCH_INTERVAL}
+        try:
+            # Explicit, so noatime/relatime mounts still keep the clock; mtime is
+            # written back to the nanosecond so the ETag (built from it) stays stable
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+        except OSError:
+            pass
+
+    def serving(self, path):
+        """touch() and pin() path for a response; returns the callable that unpins it"""
+        self.touch(path)
+        self.pin(path)
+        return lambda: self.unpin(path)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️ Retention sweep failed: {e}")
+
+    def sweep(self):
+        """Remove intermediates, then evict LRU items while over the high watermark
+
+        Returns a summary dict, or None when another process is sweeping.
+        """
+        lock = self._acquire_lock()
+        if lock is False:
+            return None
+        try:
+            return self._sweep()
+        finally:
+            if lock:
+                lock.close()
+
+    def _acquire_lock(self):
+        """Non-blocking flock on the folder's lock file; None where unsupported"""
+        if fcntl is None:
+            return None
+        try:
+            lock = open(os.path.join(self.root, LOCK_FILENAME), 'a')
+        except OSError:
+            return None
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        return lock
+
+    def _sweep(self):
+        started = time.time()
+        pinned = self._pinned_items()
+        items = self._scan()
+
+        def evictable(item):
+            if item.path in pinned or started - item.last_used < self.min_age:
+                return False
+            # Without the list of running jobs nothing in jobs/ is known to be idle
+            return not (item.is_dir and None in pinned)
+
+        removed = 0
+        loose_intermediates = set(intermediate_files(self.root))
+        for item in items:
+            if not evictable(item):
+                continue
+            if item.is_dir:
+                paths = intermediate_files(item.path)
+            else:
+                paths = [item.path] if item.path in loose_intermediates else []
+            for path in paths:
+                freed = self._delete(path)
+                if freed is not None:
+                    item.size -= freed
+                    removed += freed
+                    self.intermediates_removed += 1
+                    self.intermediate_bytes += freed
+        items = [item for item in items if item.is_dir or os.path.exists(item.path)]
+
+        used = sum(item.size for item in items)
+        evicted = 0
+        excess = 0
+        if self._excess(used, self.high_watermark) > 0:
+            # Evict down to the low watermark, least recently used first
+            excess = self._excess(used, self.low_watermark)
+            for item in sorted(items, key=lambda i: i.last_used):
+                if excess <= 0:
+                    break
+                if not evictable(item):
+                    continue
+                freed = self._delete(item.path)
+                if freed is None:
+                    continue
+                print(f"🧹 Evicted {os.path.relpath(item.path, self.root)} ({freed // (1024 * 1024)}MB)")
+                excess -= freed
+                evicted += freed
+                self.evicted_files += 1
+                self.evicted_bytes += freed
+
+        self.last_sweep = {
+            'at': started,
+            'seconds': round(time.time() - started, 3),
+            'items': len(items),
+            'bytes': used - evicted,
+            'intermediate_bytes': removed,
+            'evicted_bytes': evicted,
+            # Everything left over the low watermark is pinned or too recent
+            'short_by': max(0, int(excess)),
+        }
+        return self.last_sweep
+
+    def _excess(self, used, watermark):
+        """Bytes to free to get both the quota and the disk under watermark"""
+        excess = 0
+        if self.quota > 0:
+            excess = used - self.quota * watermark
+        try:
+            disk = shutil.disk_usage(self.root)
+        except OSError:
+            return excess
+        return max(excess, disk.used - disk.total * watermark)
+
+    def _pinned_items(self):
+        """Paths that must not be deleted; contains None when active jobs are unknown"""
+        with self._lock:
+            pinned = set(self._pins)
+        try:
+            for job_id in self.active_jobs():
+                # Both layouts, in case the folder has not been migrated yet
+                pinned.add(token_dir(self.jobs_dir, job_id))
+                pinned.add(os.path.join(self.jobs_dir, job_id))
+        except Exception as e:
+            print(f"⚠️ Retention could not list active jobs: {e}")
+            pinned.add(None)
+        return pinned
+
+    def _scan(self):
+        """Job directories and loose video files with their size and last use"""
+        items = []
+        for path in iter_token_dirs(self.jobs_dir):
+            item = _Item(path, True)
+            for dirpath, _, filenames in os.walk(path):
+                for name in filenames:
+                    try:
+                        st = os.stat(os.path.join(dirpath, name))
+                    except OSError:
+                        continue
+                    item.size += disk_size(st)
+                    item.last_used = max(item.last_used, st.st_atime, st.st_mtime)
+            if not item.last_used:
+                try:
+                    item.last_used = os.stat(path).st_mtime
+                except OSError:
+                    continue
+            items.append(item)
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            entries = []
+        for entry in entries:
+            if not entry.name.lower().endswith(VIDEO_EXTS + ('.part',)):
+                continue
+            try:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            item = _Item(entry.path, False)
+            item.size = disk_size(st)
+            item.last_used = max(st.st_atime, st.st_mtime)
+            items.append(item)
+        return items
+
+    def _delete(self, path):
+        """Remove a file or job directory; returns bytes freed or None"""
+        try:
+            if os.path.isdir(path) and not os.path.islink(path):
+                freed = sum(disk_size(os.stat(os.path.join(d, n))) for d, _, names in os.walk(path) for n in names)
+                shutil.rmtree(path)
+            else:
+                freed = disk_size(os.stat(path))
+                os.remove(path)
+            return freed
+        except OSError as e:
+            print(f"⚠️ Could not delete {path}: {e}")
+            return None
+
+    def stats(self):
+        with self._lock:
+            pins = len(self._pins)
+        try:
+            disk = shutil.disk_usage(self.root)
+            disk_used = round(disk.used / disk.total, 3)
+        except OSError:
+            disk_used = None
+        return {
+            'quota': self.quota,
+            'high_watermark': self.high_watermark,
+            'low_watermark': self.low_watermark,
+            'disk_used': disk_used,
+            'pinned': pins,
+            'evicted_files': self.evicted_files,
+            'evicted_bytes': self.evicted_bytes,
+            'intermediates_removed': self.intermediates_removed,
+            'intermediate_bytes': self.intermediate_bytes,
+            'last_sweep': self.last_sweep,
+        }
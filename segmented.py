@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Segment-parallel encoding for DazzloGet
+A single ffmpeg process cannot keep a many-core box busy on one long video.
+Long inputs are cut at keyframes into segments (stream copy, no decode),
+each segment is filtered and encoded as its own post-processing task, and
+the encoded pieces are concatenated losslessly with the untouched source
+audio muxed back in. The result is checked for duration and A/V sync before
+it is accepted; on any problem the caller falls back to a single-pass encode.
+
+Only stateless per-frame filters (crop, delogo, unsharp, scale, ...) give
+identical output this way; temporal filters would see a seam at each cut.
+"""
+
+import glob
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from postprocess import PRIORITY_NORMAL, EncodeCancelled
+from probe import probe_media
+
+# Inputs shorter than this are encoded in one pass (seconds, 0 disables segmenting)
+MIN_DURATION = float(os.environ.get('DAZZLO_SEGMENT_MIN_DURATION', '600'))
+# Number of segments; 0 means one per post-processing slot
+SEGMENTS = int(os.environ.get('DAZZLO_ENCODE_SEGMENTS', '0'))
+# Never cut pieces shorter than this (seconds)
+MIN_SEGMENT_SECONDS = 30
+
+
+def plan_segments(duration, slots):
+    """How many pieces to cut a video of duration seconds into (1 = don't split)"""
+    if not duration or MIN_DURATION <= 0 or duration < MIN_DURATION:
+        return 1
+    count = SEGMENTS or slots
+    return max(1, min(count, int(duration // MIN_SEGMENT_SECONDS)))
+
+
+def encode_segmented(scheduler, video_path, video_filter, output_path, profile,
+                     priority=PRIORITY_NORMAL, should_cancel=None, progress_callback=None, source=None,
+                     limits=None):
+    """Encode video_path to output_path in parallel segments
+
+    Returns True when output_path was written and verified, False when the
+    caller should fall back to a single-pass encode. EncodeCancelled and
+    subprocess.TimeoutExpired from the scheduler propagate. progress_callback
+    receives the pieces' progress combined into one event for the whole video;
+    source is a probe.probe_media() result if the caller already has one and
+    limits are extra video encoder arguments for every piece.
+    """
+    source = source or probe_media(video_path)
+    if not source or not source['video']:
+        return False
+    duration = source['video']['duration'] or source['duration']
+    count = plan_segments(duration, scheduler.max_concurrent)
+    if count < 2:
+        return False
+
+    work_dir = tempfile.mkdtemp(prefix='.segments-', dir=os.path.dirname(output_path) or None)
+    try:
+        print(f"🧩 Encoding {os.path.basename(video_path)} in {count} parallel segments")
+        pieces = _split(scheduler, video_path, work_dir, duration / count, priority, should_cancel)
+        if len(pieces) < 2:
+            return False
+
+        encoded = _encode_pieces(scheduler, pieces, video_filter, profile, limits, priority, should_cancel,
+                                 _CombinedProgress(duration, progress_callback))
+        if encoded is None:
+            return False
+
+        if not _join(scheduler, encoded, video_path, source, output_path, profile, priority, should_cancel):
+            return False
+
+        problem = verify_output(source, probe_media(output_path), profile)
+        if problem:
+            print(f"⚠️ Segmented encode rejected: {problem}")
+            _remove(output_path)
+            return False
+        return True
+    except (EncodeCancelled, subprocess.TimeoutExpired):
+        _remove(output_path)
+        raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _split(scheduler, video_path, work_dir, segment_time, priority, should_cancel):
+    """Cut the video stream at the first keyframe after every segment_time seconds"""
+    pattern = os.path.join(work_dir, 'src_%04d.mkv')
+    cmd = [
+        'ffmpeg', '-i', video_path,
+        '-map', '0:v:0', '-c', 'copy', '-an',
+        '-f', 'segment', '-segment_time', f'{segment_time:.3f}', '-reset_timestamps', '1',
+        '-y', pattern
+    ]
+    result = scheduler.run(cmd, priority=priority, should_cancel=should_cancel)
+    if result.returncode != 0:
+        return []
+    return sorted(glob.glob(os.path.join(work_dir, 'src_*.mkv')))
+
+
+class _CombinedProgress:
+    """Sums per-piece ffmpeg progress into whole-video percent and eta"""
+
+    def __init__(self, duration, callback):
+        self.duration = duration
+        self.callback = callback
+        self.pieces = {}
+        self._lock = threading.Lock()
+
+    def for_piece(self, piece):
+        if not self.callback:
+            return None
+        return lambda event: self.update(piece, event)
+
+    def update(self, piece, event):
+        with self._lock:
+            self.pieces[piece] = event
+            events = list(self.pieces.values())
+        out_time = sum(e.get('out_time') or 0 for e in events)
+        # Pieces encode side by side, so their speeds add up
+        speed = sum(e.get('speed') or 0 for e in events if e.get('status') != 'finished')
+        combined = {
+            'status': 'encoding',
+            'frame': sum(e.get('frame') or 0 for e in events),
+            'fps': round(sum(e.get('fps') or 0 for e in events if e.get('status') != 'finished'), 1),
+            'out_time': round(out_time, 2),
+            'speed': round(speed, 2) or None,
+            'segments': len(events),
+        }
+        if self.duration:
+            combined['percent'] = round(min(100.0, 100.0 * out_time / self.duration), 1)
+            if speed:
+                combined['eta'] = int(max(0.0, self.duration - out_time) / speed)
+        self.callback(combined)
+
+
+def _encode_pieces(scheduler, pieces, video_filter, profile, limits, priority, should_cancel, progress):
+    """Filter and encode every piece concurrently; None if any piece failed"""
+    def encode(piece):
+        out = os.path.join(os.path.dirname(piece), 'enc_' + os.path.basename(piece)[len('src_'):])
+        cmd = ['ffmpeg', '-i', piece]
+        if video_filter:
+            cmd += ['-vf', video_filter]
+        cmd += profile.video_args(threads=scheduler.threads_per_encode, limits=limits) + ['-an', '-y', out]
+        result = scheduler.run(cmd, priority=priority, should_cancel=should_cancel,
+                               progress_callback=progress.for_piece(piece))
+        return out if result.returncode == 0 and os.path.exists(out) else None
+
+    # Each call blocks on the scheduler, which bounds how many actually run at once
+    with ThreadPoolExecutor(max_workers=len(pieces), thread_name_prefix='dazzlo-segment') as executor:
+        encoded = list(executor.map(encode, pieces))
+    return None if None in encoded else encoded
+
+
+def _join(scheduler, encoded, video_path, source, output_path, profile, priority, should_cancel):
+    """Concatenate the encoded pieces and mux the source audio back in"""
+    list_path = os.path.join(os.path.dirname(encoded[0]), 'concat.txt')
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for piece in encoded:
+            f.write("file '{}'\n".format(piece.replace("'", "'\\''")))
+
+    cmd = []
+    if source['audio'] and profile.audio != 'none':
+        # Pieces restart at zero; put the video back where it started in the source
+        offset = source['video']['start_time']
+        if offset:
+            cmd += ['-itsoffset', f'{offset:.6f}']
+    cmd = ['ffmpeg'] + cmd + ['-f', 'concat', '-safe', '0', '-i', list_path]
+    if source['audio'] and profile.audio != 'none':
+        cmd += ['-i', video_path, '-map', '0:v', '-map', '1:a:0', '-c:v', 'copy'] + profile.audio_args()
+    else:
+        cmd += ['-map', '0:v', '-c:v', 'copy', '-an']
+    if profile.container in ('mp4', 'mov'):
+        cmd += ['-movflags', '+faststart']
+    cmd += ['-y', output_path]
+
+    result = scheduler.run(cmd, priority=priority, should_cancel=should_cancel)
+    return result.returncode == 0 and os.path.exists(output_path)
+
+
+def verify_output(source, output, profile):
+    """Return a description of what is wrong with a joined encode, or None"""
+    if not output or not output['video']:
+        return 'output has no video stream'
+    video = source['video']
+    frame_time = 1.0 / video['frame_rate'] if video['frame_rate'] else 0.04
+    tolerance = max(0.1, 2 * frame_time)
+
+    src_duration = video['duration'] or source['duration']
+    out_duration = output['video']['duration'] or output['duration']
+    if src_duration and out_duration and abs(src_duration - out_duration) > tolerance:
+        return f'video duration {out_duration:.3f}s != source {src_duration:.3f}s'
+
+    if video['nb_frames'] and output['video']['nb_frames'] and video['nb_frames'] != output['video']['nb_frames']:
+        return f"{output['video']['nb_frames']} frames != source {video['nb_frames']}"
+
+    if source['audio'] and profile.audio != 'none':
+        if not output['audio']:
+            return 'audio stream was lost'
+        # A/V sync: the audio/video start and end offsets must match the source
+        src_skew = (source['audio']['start_time'] - video['start_time'])
+        out_skew = (output['audio']['start_time'] - output['video']['start_time'])
+        if abs(src_skew - out_skew) > tolerance:
+            return f'audio starts {out_skew:.3f}s from video, source {src_skew:.3f}s'
+        src_audio = source['audio']['duration']
+        out_audio = output['audio']['duration']
+        if src_audio and out_audio and abs(src_audio - out_audio) > tolerance:
+            return f'audio duration {out_audio:.3f}s != source {src_audio:.3f}s'
+    return None
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
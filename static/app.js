@@ -3,6 +3,19 @@ const statusDiv = document.getElementById('status');
 const loader = document.getElementById('loader');
 const downloadBtn = document.getElementById('downloadBtn');
 
+// Poll a queued download job until it finishes
+function waitForJob(statusUrl) {
+    return fetch(statusUrl)
+        .then(res => res.json())
+        .then(job => {
+            if (job.state === 'finished' || job.state === 'failed') {
+                return job;
+            }
+            return new Promise(resolve => setTimeout(resolve, 1500))
+                .then(() => waitForJob(statusUrl));
+        });
+}
+
 form.addEventListener('submit', function(e) {
     e.preventDefault();
 
@@ -20,6 +33,7 @@ form.addEventListener('submit', function(e) {
         body: JSON.stringify({ url, removeWatermark })
     })
     .then(res => res.json())
+    .then(data => data.job_id ? waitForJob(data.status_url) : data)
     .then(data => {
         loader.style.display = 'none';
         downloadBtn.disabled = false;
@@ -45,6 +45,45 @@ document.addEventListener('DOMContentLoaded', function() {
     // Default select first
     formatOptions.querySelector('button').classList.add('ring', 'ring-2', 'ring-neon-pink');
 
+    function setProgress(percent) {
+        progressText.textContent = `${Math.round(percent)}%`;
+        progressBar.style.width = `${percent}%`;
+        progressCircle.style.strokeDashoffset = 251 - (251 * percent / 100);
+    }
+
+    // Resolve with the final job state, updating the progress UI from SSE events
+    function followJob(statusUrl) {
+        return new Promise((resolve, reject) => {
+            const events = new EventSource(statusUrl + '/events');
+            events.addEventListener('status', e => {
+                progressStatus.textContent = JSON.parse(e.data).message;
+            });
+            events.addEventListener('progress', e => {
+                const p = JSON.parse(e.data);
+                if (p.stage === 'downloading' && p.percent !== null) {
+                    setProgress(p.percent);
+                } else if (p.stage === 'watermark' && p.percent != null) {
+                    progressStatus.textContent = `Removing watermarks... ${p.percent}%`;
+                    setProgress(p.percent);
+                }
+            });
+            events.addEventListener('done', e => {
+                events.close();
+                resolve(JSON.parse(e.data));
+            });
+            events.onerror = () => {
+                events.close();
+                fetch(statusUrl).then(r => r.json()).then(job => {
+                    if (job.state === 'finished' || job.state === 'failed') {
+                        resolve(job);
+                    } else {
+                        setTimeout(() => followJob(statusUrl).then(resolve, reject), 1500);
+                    }
+                }, reject);
+            };
+        });
+    }
+
     // Download button
     downloadBtn.addEventListener('click', async function() {
         if (isDownloading) return;
@@ -70,7 +109,11 @@ document.addEventListener('DOMContentLoaded', function() {
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ url, quality: selectedQuality, format: selectedFormat })
             });
-            const data = await res.json();
+            let data = await res.json();
+            // Downloads run as background jobs; follow their progress stream
+            if (data.job_id) {
+                data = await followJob(data.status_url || `/jobs/${data.job_id}`);
+            }
             let percent = 100;
             if (data.success) {
                 progressStatus.textContent = 'Download complete!';
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Sharded layout of DazzloGet's download folder
+Every output lives in a directory of its own, keyed by its public file token
+(the job id, or one issued by the migration):
+
+    jobs/<aa>/<bb>/<token>/<filename>
+
+where aa and bb are the first hex digits of the token's SHA-1. A token maps
+to its directory without touching the disk or an index, names can't collide
+across jobs, and no directory grows past a few hundred entries.
+
+Folders written by older versions - flat jobs/<id> directories and videos at
+the top of the folder - are moved into the layout with
+
+    python storage.py                        # the default download folder
+    python storage.py /srv/dazzlo --dry-run
+
+Old bare-filename links (/file/<name>) to the moved videos keep working
+through the names index it writes (files.sqlite3). Stop the web and worker
+processes while it runs, and restart them afterwards.
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from jobstore import Transaction
+
+VIDEO_EXTS = ('.mp4', '.mkv', '.webm', '.mov', '.avi', '.flv', '.m4v')
+
+# Two levels of 256 directories each
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+# Bare filename -> token of the directory the migration moved it to
+NAMES_FILENAME = 'files.sqlite3'
+
+
+def new_token():
+    """Token for an output that doesn't belong to a job"""
+    return uuid.uuid4().hex
+
+
+def token_dir(jobs_dir, token):
+    """Directory holding the outputs of token"""
+    digest = hashlib.sha1(token.encode('utf-8')).hexdigest()
+    shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_LEVELS)]
+    return os.path.join(jobs_dir, *shards, token)
+
+
+def is_shard_name(name):
+    return len(name) == SHARD_WIDTH and all(c in '0123456789abcdef' for c in name)
+
+
+def iter_token_dirs(jobs_dir):
+    """Yield every token directory under jobs_dir, sharded or flat (pre-migration)"""
+    def subdirs(path):
+        try:
+            return [entry for entry in os.scandir(path) if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return []
+
+    for entry in subdirs(jobs_dir):
+        if not is_shard_name(entry.name):
+            yield entry.path
+            continue
+        level = [entry]
+        for _ in range(SHARD_LEVELS - 1):
+            level = [sub for shard in level for sub in subdirs(shard.path) if is_shard_name(sub.name)]
+        for shard in level:
+            for sub in subdirs(shard.path):
+                yield sub.path
+
+
+def token_dir_of(jobs_dir, path):
+    """Token directory a path under jobs_dir belongs to, or None"""
+    path = os.path.abspath(path)
+    jobs_dir = os.path.abspath(jobs_dir)
+    if not path.startswith(jobs_dir + os.sep):
+        return None
+    parts = path[len(jobs_dir) + 1:].split(os.sep)
+    depth = SHARD_LEVELS + 1 if all(is_shard_name(part) for part in parts[:SHARD_LEVELS]) else 1
+    if len(parts) < depth:
+        return None
+    return os.path.join(jobs_dir, *parts[:depth])
+
+
+class NameIndex:
+    """Bare filenames of migrated top-level videos, in SQLite, mapped to their tokens"""
+
+    def __init__(self, path, busy_timeout=10.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        with Transaction(self._conn()) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS names (
+                    name TEXT PRIMARY KEY,
+                    token TEXT NOT NULL,
+                    created_at REAL
+                )''')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def add(self, name, token):
+        with Transaction(self._conn()) as conn:
+            conn.execute('INSERT OR REPLACE INTO names (name, token, created_at) VALUES (?, ?, ?)',
+                         (name, token, time.time()))
+
+    def token_for(self, name):
+        row = self._conn().execute('SELECT token FROM names WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+
+def moved_path(path, moves):
+    """Where path is after moves ({old: new} paths of files or their directories)"""
+    if path in moves:
+        return moves[path]
+    directory = os.path.dirname(path)
+    if directory in moves:
+        return os.path.join(moves[directory], os.path.basename(path))
+    return path
+
+
+def open_name_index(root):
+    """The folder's names index, or None when nothing was ever migrated"""
+    path = os.path.join(root, NAMES_FILENAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        return NameIndex(path)
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not open {path}: {e}")
+        return None
+
+
+def migrate(root, jobs_dirname='jobs', dry_run=False, log=print, store=None, cache=None):
+    """Move flat job directories and top-level videos into the sharded layout
+
+    Output paths in the job store's finished records and in the ResultCache
+    are rewritten to match. Returns {old path: new path} for everything moved
+    (or, with dry_run, everything that would be).
+    """
+    jobs_dir = os.path.join(root, jobs_dirname)
+    moves = {}
+
+    for path in list(iter_token_dirs(jobs_dir)):
+        if os.path.dirname(path) == jobs_dir:
+            moves[path] = token_dir(jobs_dir, os.path.basename(path))
+
+    tokens = {}
+    for entry in sorted(os.scandir(root), key=lambda e: e.name):
+        if not entry.name.lower().endswith(VIDEO_EXTS) or not entry.is_file(follow_symlinks=False):
+            continue
+        tokens[entry.path] = new_token()
+        moves[entry.path] = os.path.join(token_dir(jobs_dir, tokens[entry.path]), entry.name)
+
+    index = None
+    moved = {}
+    for old, new in moves.items():
+        log(f"{'Would move' if dry_run else 'Moving'} {os.path.relpath(old, root)} -> {os.path.relpath(new, root)}")
+        if dry_run:
+            continue
+        if os.path.exists(new):
+            log(f"⚠️ {os.path.relpath(new, root)} already exists; left {os.path.relpath(old, root)} in place")
+            continue
+        try:
+            os.makedirs(os.path.dirname(new), exist_ok=True)
+            os.rename(old, new)
+        except OSError as e:
+            log(f"⚠️ Could not move {old}: {e}")
+            continue
+        moved[old] = new
+        if old in tokens:
+            if index is None:
+                index = NameIndex(os.path.join(root, NAMES_FILENAME))
+            index.add(os.path.basename(old), tokens[old])
+    if dry_run:
+        return moves
+
+    if moved and store is not None:
+        for record in store.finished():
+            result = record.get('result') or {}
+            path = result.get('file_path')
+            if path and moved_path(path, moved) != path:
+                store.update(record['id'], result=dict(result, file_path=moved_path(path, moved)))
+    if moved and cache is not None:
+        cache.relocate(moved)
+    return moved
+
+
+def main():
+    from cache import ResultCache
+    from jobstore import JOB_STORE_FILENAME, open_job_store
+    from main import default_download_path
+
+    parser = argparse.ArgumentParser(description='Move a DazzloGet download folder into the sharded layout')
+    parser.add_argument('folder', nargs='?', help='download folder (default: the one the app uses)')
+    parser.add_argument('--dry-run', action='store_true', help='only list what would move')
+    args = parser.parse_args()
+
+    root = os.path.abspath(args.folder or default_download_path())
+    if not os.path.isdir(root):
+        print(f"❌ {root} is not a directory", file=sys.stderr)
+        return 2
+
+    store = open_job_store(default_path=os.path.join(root, JOB_STORE_FILENAME))
+    moved = migrate(root, dry_run=args.dry_run, store=store, cache=ResultCache(root))
+    print(f"{'🔎' if args.dry_run else '✅'} {len(moved)} item(s) {'to move' if args.dry_run else 'moved'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+import json
+
+from batch import collect_jobs, run_batch
+
+
+def test_bad_manifest_entries_fail_alone(tmp_path):
+    manifest = tmp_path / 'm.json'
+    manifest.write_text(json.dumps([
+        {'input': 'a.mp4', 'profile': 'bogus'},
+        {'input': 'b.mp4', 'preset': 'nope'},
+        {'input': 'c.mp4', 'preset': 'tiktok', 'profile': 'fast'},
+    ]))
+    jobs = collect_jobs([str(manifest)], {'profile': 'balanced', 'preset': None})
+    assert 'bogus' in jobs[0]['error']
+    assert 'nope' in jobs[1]['error']
+    assert 'error' not in jobs[2]
+
+    report = run_batch(jobs[:2], workers=1)
+    assert report['failed'] == 2
+    assert [r['message'] for r in report['results']] == [jobs[0]['error'], jobs[1]['error']]
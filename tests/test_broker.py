@@ -0,0 +1,164 @@
+import socket
+import threading
+import time
+import uuid
+
+import pytest
+
+from broker import Broker, RedisBroker, RedisConnection, RedisError, SQLiteBroker, open_broker
+from postprocess import PRIORITY_NORMAL
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope='module')
+def redis_address():
+    fakeredis = pytest.importorskip('fakeredis')
+    port = free_port()
+    server = fakeredis.TcpFakeServer(('127.0.0.1', port), server_type='redis')
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield '127.0.0.1', port
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def redis(redis_address):
+    connection = RedisConnection(*redis_address)
+    yield connection
+    connection.close()
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def broker(request, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteBroker(str(tmp_path / 'broker.sqlite3'))
+    # A fresh prefix keeps tests apart on the shared server
+    return RedisBroker(request.getfixturevalue('redis'), prefix=f'test-{uuid.uuid4().hex[:8]}')
+
+
+def test_lower_priority_first_then_fifo(broker):
+    broker.publish({'n': 1}, priority=5)
+    broker.publish({'n': 2}, priority=1)
+    broker.publish({'n': 3}, priority=5)
+    order = [broker.reserve('w').task['n'] for _ in range(3)]
+    assert order == [2, 1, 3]
+    assert broker.reserve('w') is None
+
+
+def test_ack_removes_task(broker):
+    broker.publish({'n': 1})
+    delivery = broker.reserve('w', lease=30)
+    assert delivery.deliveries == 1
+    broker.ack(delivery)
+    assert broker.reserve('w', lease=30) is None
+    assert broker.stats()['queued'] == 0
+
+
+def test_expired_lease_is_redelivered(broker):
+    broker.publish({'n': 1})
+    first = broker.reserve('dead', lease=0.2)
+    assert broker.reserve('other', lease=30) is None
+    time.sleep(0.3)
+    second = broker.reserve('other', lease=30)
+    assert second.task == {'n': 1}
+    assert second.deliveries == 2
+    # The first worker lost its lease: it can neither extend nor ack for the new owner
+    assert not broker.extend(first, 30)
+    broker.ack(first)
+    assert broker.extend(second, 30)
+    broker.ack(second)
+    assert broker.reserve('other', lease=30) is None
+
+
+def test_extend_keeps_lease(broker):
+    broker.publish({'n': 1})
+    delivery = broker.reserve('w', lease=0.3)
+    time.sleep(0.15)
+    assert broker.extend(delivery, 30)
+    time.sleep(0.25)
+    assert broker.reserve('other', lease=30) is None
+
+
+def test_release_hands_task_back_at_once(broker):
+    broker.publish({'n': 1})
+    delivery = broker.reserve('w', lease=30)
+    broker.release(delivery)
+    again = broker.reserve('other', lease=30)
+    assert again.task == {'n': 1}
+    assert again.consumer == 'other'
+
+
+def test_concurrent_consumers_get_each_task_once(broker):
+    for n in range(50):
+        broker.publish({'n': n})
+    seen = []
+    lock = threading.Lock()
+
+    def consume(name):
+        while True:
+            delivery = broker.reserve(name, lease=30)
+            if delivery is None:
+                return
+            with lock:
+                seen.append(delivery.task['n'])
+            broker.ack(delivery)
+
+    threads = [threading.Thread(target=consume, args=(f'w{i}',)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(seen) == list(range(50))
+
+
+def test_redis_orphan_without_lease_is_redelivered(redis):
+    broker = RedisBroker(redis, prefix=f'test-{uuid.uuid4().hex[:8]}')
+    broker.ORPHAN_CHECK_INTERVAL = 0
+    broker.publish({'n': 1})
+    # A worker that died between RPOPLPUSH and ZADD
+    redis.execute('RPOPLPUSH', broker._queue(PRIORITY_NORMAL), broker._key('leased'))
+    assert broker.reserve('w', lease=0.2) is None
+    time.sleep(0.3)
+    delivery = broker.reserve('w', lease=30)
+    assert delivery.task == {'n': 1}
+
+
+def test_resp_client_replies(redis):
+    key = f'test-{uuid.uuid4().hex[:8]}'
+    assert redis.execute('SET', key, 'värde') == 'OK'
+    assert redis.execute('GET', key) == 'värde'
+    assert redis.execute('GET', key + ':missing') is None
+    assert redis.execute('RPUSH', key + ':list', 'a', 'b') == 2
+    assert redis.execute('LRANGE', key + ':list', 0, -1) == ['a', 'b']
+    with pytest.raises(RedisError):
+        redis.execute('LPUSH', key, 'x')  # wrong type
+
+
+def test_resp_client_reconnects(redis):
+    redis.execute('PING')
+    redis._sock.close()
+    assert redis.execute('PING') == 'PONG'
+
+
+def test_open_broker(tmp_path, monkeypatch):
+    monkeypatch.delenv('DAZZLO_BROKER', raising=False)
+    assert open_broker() is None
+    assert isinstance(open_broker(str(tmp_path / 'b.sqlite3')), SQLiteBroker)
+    assert isinstance(open_broker('sqlite://', default_path=str(tmp_path / 'b.sqlite3')), SQLiteBroker)
+    with pytest.raises(ValueError):
+        open_broker('amqp://host')
+
+
+def test_incomplete_broker_fails_at_construction():
+    class Partial(Broker):
+        def publish(self, task, priority=0):
+            pass
+
+    with pytest.raises(TypeError):
+        Partial()
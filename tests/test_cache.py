@@ -0,0 +1,48 @@
+from cache import ResultCache, make_cache_key
+
+
+def info(**fields):
+    data = {'extractor_key': 'Youtube', 'id': 'abc123', 'format_id': '22',
+            'webpage_url': 'https://www.youtube.com/watch?v=abc123'}
+    data.update(fields)
+    return data
+
+
+def test_generic_files_on_different_hosts_do_not_collide():
+    first = info(extractor_key='Generic', id='clip', webpage_url='http://a.example/clip.mp4')
+    second = info(extractor_key='Generic', id='clip', webpage_url='http://b.example/clip.mp4')
+    assert make_cache_key(first) != make_cache_key(second)
+
+
+def test_generic_falls_back_to_original_url():
+    first = info(extractor_key='Generic', id='clip', webpage_url=None, original_url='http://a.example/clip.mp4')
+    second = info(extractor_key='Generic', id='clip', webpage_url=None, original_url='http://b.example/clip.mp4')
+    assert make_cache_key(first) != make_cache_key(second)
+
+
+def test_site_video_keyed_by_id_not_url():
+    # youtu.be and youtube.com links to one video share the cached output
+    assert make_cache_key(info()) == make_cache_key(info(webpage_url='https://youtu.be/abc123'))
+    assert make_cache_key(info()) != make_cache_key(info(id='other'))
+    assert make_cache_key(info()) != make_cache_key(info(format_id='18'))
+
+
+def test_options_are_part_of_the_key():
+    assert make_cache_key(info(), {'postprocess': 'encode'}) != make_cache_key(info(), {'postprocess': 'remux'})
+    assert make_cache_key(info(), {'a': 1, 'b': 2}) == make_cache_key(info(), {'b': 2, 'a': 1})
+
+
+def test_uncacheable_infos():
+    assert make_cache_key(None) is None
+    assert make_cache_key(info(id=None)) is None
+    assert make_cache_key(info(_type='playlist')) is None
+
+
+def test_result_cache_drops_entries_whose_file_is_gone(tmp_path):
+    path = tmp_path / 'out.mp4'
+    path.write_bytes(b'x' * 10)
+    cache = ResultCache(str(tmp_path), max_bytes=1000, ttl=0)
+    cache.put('k', str(path))
+    assert cache.get('k')['path'] == str(path)
+    path.unlink()
+    assert cache.get('k') is None
@@ -0,0 +1,144 @@
+import os
+
+import pytest
+from flask import Flask, request
+
+from delivery import StreamAborted, make_etag, resolve_range, serve_media, stream_job_file
+from jobs import JOB_FAILED, JOB_RUNNING, Job
+from retention import RetentionManager
+
+SIZE = 1000
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / 'clip.mp4'
+    path.write_bytes(bytes(range(256)) * 3 + bytes(SIZE - 768))
+    # A sub-microsecond mtime, which a float round trip would lose
+    os.utime(path, ns=(1_600_000_000_123_456_789, 1_600_000_000_123_456_789))
+    return str(path)
+
+
+@pytest.fixture
+def pins():
+    return []
+
+
+@pytest.fixture
+def client(video, pins):
+    app = Flask(__name__)
+
+    def pin(path):
+        pins.append(path)
+        return lambda: pins.remove(path)
+
+    @app.route('/file', methods=['GET', 'HEAD'])
+    def serve():
+        return serve_media(request, video, 'clip.mp4', pin=pin)
+
+    return app.test_client()
+
+
+def test_resolve_range():
+    assert resolve_range(None, None, SIZE, 'e') is None
+    assert resolve_range('bytes=0-99', None, SIZE, 'e') == (0, 100)
+    assert resolve_range('bytes=900-', None, SIZE, 'e') == (900, SIZE)
+    assert resolve_range('bytes=-100', None, SIZE, 'e') == (900, SIZE)
+    assert resolve_range('bytes=5000-6000', None, SIZE, 'e') is False
+    # Multipart ranges get the whole file
+    assert resolve_range('bytes=0-1,5-6', None, SIZE, 'e') is None
+    # If-Range keeps the range only for a matching ETag
+    assert resolve_range('bytes=0-99', '"e"', SIZE, 'e') == (0, 100)
+    assert resolve_range('bytes=0-99', '"old"', SIZE, 'e') is None
+
+
+def test_full_response(client, video):
+    response = client.get('/file')
+    assert response.status_code == 200
+    assert response.data == open(video, 'rb').read()
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['Content-Length'] == str(SIZE)
+
+
+def test_partial_response(client, video):
+    response = client.get('/file', headers={'Range': 'bytes=10-19'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 10-19/{SIZE}'
+    assert response.data == open(video, 'rb').read()[10:20]
+
+
+def test_unsatisfiable_range(client):
+    response = client.get('/file', headers={'Range': f'bytes={SIZE}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{SIZE}'
+
+
+def test_conditional_requests(client):
+    etag = client.head('/file').headers['ETag']
+    assert client.get('/file', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/file', headers={'Range': 'bytes=0-9', 'If-Range': etag}).status_code == 206
+    assert client.get('/file', headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'}).status_code == 200
+
+
+def test_missing_file_is_404(tmp_path):
+    app = Flask(__name__)
+    with app.test_request_context('/'):
+        with pytest.raises(Exception) as error:
+            serve_media(request, str(tmp_path / 'nope.mp4'), 'nope.mp4')
+    assert getattr(error.value, 'code', None) == 404
+
+
+def test_pin_released_after_response(client, pins, video):
+    response = client.get('/file', headers={'Range': 'bytes=0-9'})
+    response.close()
+    assert pins == []
+    client.head('/file').close()
+    assert pins == []
+
+
+def test_etag_stable_across_serves(client, video, tmp_path):
+    retention = RetentionManager(str(tmp_path), quota=0, interval=3600)
+    before = make_etag(os.stat(video))
+    etag = client.head('/file').headers['ETag']
+    # Serving records the access time; the mtime the ETag is built from must survive it
+    retention.touch(video)
+    assert make_etag(os.stat(video)) == before
+    assert client.get('/file', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/file', headers={'Range': 'bytes=0-9', 'If-Range': etag}).status_code == 206
+
+
+def growing_job(tmp_path, data):
+    job = Job('https://example.com/v')
+    job.state = JOB_RUNNING
+    job.partial_path = str(tmp_path / 'clip.mp4.part')
+    with open(job.partial_path, 'wb') as f:
+        f.write(data)
+    return job
+
+
+def stream(job):
+    app = Flask(__name__)
+    with app.test_request_context('/'):
+        return stream_job_file(request, job, wait_timeout=0)
+
+
+def test_stream_follows_a_renamed_partial_file(tmp_path):
+    job = growing_job(tmp_path, b'x' * 100)
+    os.rename(job.partial_path, job.partial_path[:-len('.part')])
+    job.progress = {'status': 'finished'}
+    assert b''.join(stream(job).response) == b'x' * 100
+
+
+def test_stream_aborts_when_the_job_fails(tmp_path):
+    job = growing_job(tmp_path, b'x' * 100)
+    response = stream(job)
+    job.result = {'success': False, 'message': 'Download error'}
+    job.state = JOB_FAILED
+    with pytest.raises(StreamAborted):
+        b''.join(response.response)
+
+
+def test_stream_of_a_removed_work_dir_is_none(tmp_path):
+    job = growing_job(tmp_path, b'x')
+    os.remove(job.partial_path)
+    assert stream(job) is None
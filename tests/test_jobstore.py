@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+from jobstore import JobStore, MemoryJobStore, SQLiteJobStore
+
+
+def record(job_id, state='queued', owner='host:1', **fields):
+    now = time.time()
+    data = {'id': job_id, 'url': 'https://example.com/v', 'options': {'stream': False}, 'state': state,
+            'phase': None, 'message': '', 'progress': {}, 'result': None, 'owner': owner, 'attempts': 0,
+            'cancel_requested': False, 'created_at': now, 'started_at': None, 'finished_at': None}
+    data.update(fields)
+    return data
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryJobStore()
+    return SQLiteJobStore(str(tmp_path / 'jobs.sqlite3'))
+
+
+def test_save_load_update(store):
+    store.save(record('a'))
+    store.update('a', state='running', progress={'percent': 50})
+    loaded = store.load('a')
+    assert loaded['state'] == 'running'
+    assert loaded['progress'] == {'percent': 50}
+    assert loaded['options'] == {'stream': False}
+    assert store.load('missing') is None
+
+
+def test_claim_is_compare_and_swap(store):
+    store.save(record('a', owner='dead:1'))
+    assert store.claim('a', 'dead:1', 'me:2')
+    assert not store.claim('a', 'dead:1', 'other:3')
+    assert store.load('a')['owner'] == 'me:2'
+
+
+def test_active_finished_and_purge(store):
+    store.save(record('q', created_at=1))
+    store.save(record('r', state='running', created_at=2))
+    store.save(record('f', state='finished', finished_at=10))
+    store.save(record('g', state='failed', finished_at=100))
+    assert [r['id'] for r in store.active()] == ['q', 'r']
+    assert sorted(r['id'] for r in store.finished()) == ['f', 'g']
+    assert store.purge(50) == 1
+    assert store.load('f') is None
+    assert store.load('g') is not None
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    SQLiteJobStore(path).save(record('a'))
+    assert SQLiteJobStore(path).load('a')['url'] == 'https://example.com/v'
+
+
+def test_incomplete_backend_fails_at_construction():
+    class Partial(JobStore):
+        def save(self, record):
+            pass
+
+    with pytest.raises(TypeError):
+        Partial()
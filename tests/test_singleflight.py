@@ -0,0 +1,101 @@
+import threading
+import time
+
+from jobs import JobCancelled, SingleFlight
+
+
+class Member:
+    def __init__(self):
+        self.cancelled = False
+        self.cancel_reason = 'Cancelled by user'
+
+
+def start(flight, key, fn, member, results):
+    def run():
+        try:
+            results[member] = flight.do(key, fn, member)
+        except Exception as e:
+            results[member] = e
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def wait_for_members(flight, key, count):
+    deadline = time.time() + 5
+    while flight.in_flight().get(key) != count:
+        assert time.time() < deadline, flight.in_flight()
+        time.sleep(0.01)
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn(call):
+        calls.append(call)
+        release.wait(5)
+        return 'file.mp4'
+
+    members = [Member() for _ in range(4)]
+    results = {}
+    threads = [start(flight, 'k', fn, members[0], results)]
+    wait_for_members(flight, 'k', 1)
+    threads += [start(flight, 'k', fn, member, results) for member in members[1:]]
+    wait_for_members(flight, 'k', 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results[members[0]] == ('file.mp4', False)
+    assert all(results[member] == ('file.mp4', True) for member in members[1:])
+    assert flight.in_flight() == {}
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do('a', lambda call: 1, Member()) == (1, False)
+    assert flight.do('b', lambda call: 2, Member()) == (2, False)
+
+
+def test_cancelled_follower_leaves_without_stopping_the_leader():
+    flight = SingleFlight()
+    release = threading.Event()
+    leader, follower = Member(), Member()
+    results = {}
+    threads = [start(flight, 'k', lambda call: release.wait(5) and 'done', leader, results)]
+    wait_for_members(flight, 'k', 1)
+    threads.append(start(flight, 'k', None, follower, results))
+    wait_for_members(flight, 'k', 2)
+
+    follower.cancelled = True
+    threads[1].join(5)
+    assert isinstance(results[follower], JobCancelled)
+    assert flight.in_flight() == {'k': 1}
+
+    release.set()
+    threads[0].join()
+    assert results[leader] == ('done', False)
+
+
+def test_leader_error_reaches_followers():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fn(call):
+        release.wait(5)
+        raise RuntimeError('download failed')
+
+    leader, follower = Member(), Member()
+    results = {}
+    threads = [start(flight, 'k', fn, leader, results)]
+    wait_for_members(flight, 'k', 1)
+    threads.append(start(flight, 'k', fn, follower, results))
+    wait_for_members(flight, 'k', 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert isinstance(results[leader], RuntimeError)
+    assert results[follower] is results[leader]
@@ -0,0 +1,103 @@
+import os
+import time
+
+import pytest
+
+from cache import ResultCache
+from jobstore import MemoryJobStore
+from storage import iter_token_dirs, migrate, moved_path, open_name_index, token_dir, token_dir_of
+
+TOKEN = '0123abcd0123abcd0123abcd0123abcd'
+
+
+def write(path, size=100):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+    return path
+
+
+def finished_record(job_id, file_path):
+    now = time.time()
+    return {'id': job_id, 'url': 'u', 'options': {}, 'state': 'finished', 'phase': 'done', 'message': '',
+            'progress': {}, 'owner': None, 'attempts': 0, 'cancel_requested': False, 'created_at': now,
+            'started_at': now, 'finished_at': now,
+            'result': {'success': True, 'file_path': file_path, 'filename': os.path.basename(file_path)}}
+
+
+def test_token_dir_is_sharded_and_stable(tmp_path):
+    jobs_dir = str(tmp_path / 'jobs')
+    path = token_dir(jobs_dir, TOKEN)
+    assert path == token_dir(jobs_dir, TOKEN)
+    shard1, shard2, token = os.path.relpath(path, jobs_dir).split(os.sep)
+    assert token == TOKEN
+    assert len(shard1) == len(shard2) == 2
+    assert token_dir(jobs_dir, 'other') != path
+
+
+def test_token_dir_of(tmp_path):
+    jobs_dir = str(tmp_path / 'jobs')
+    sharded = token_dir(jobs_dir, TOKEN)
+    assert token_dir_of(jobs_dir, os.path.join(sharded, 'a.mp4')) == sharded
+    assert token_dir_of(jobs_dir, os.path.join(jobs_dir, TOKEN, 'a.mp4')) == os.path.join(jobs_dir, TOKEN)
+    assert token_dir_of(jobs_dir, str(tmp_path / 'elsewhere.mp4')) is None
+
+
+def test_iter_token_dirs_finds_both_layouts(tmp_path):
+    jobs_dir = str(tmp_path / 'jobs')
+    write(os.path.join(token_dir(jobs_dir, 'a' * 32), 'x.mp4'))
+    write(os.path.join(jobs_dir, 'b' * 32, 'y.mp4'))
+    assert sorted(os.path.basename(p) for p in iter_token_dirs(jobs_dir)) == ['a' * 32, 'b' * 32]
+
+
+def test_moved_path():
+    moves = {'/r/jobs/t': '/r/jobs/aa/bb/t', '/r/top.mp4': '/r/jobs/cc/dd/u/top.mp4'}
+    assert moved_path('/r/jobs/t/a.mp4', moves) == '/r/jobs/aa/bb/t/a.mp4'
+    assert moved_path('/r/top.mp4', moves) == '/r/jobs/cc/dd/u/top.mp4'
+    assert moved_path('/r/other.mp4', moves) == '/r/other.mp4'
+
+
+@pytest.fixture
+def legacy_folder(tmp_path):
+    root = str(tmp_path)
+    job_file = write(os.path.join(root, 'jobs', TOKEN, 'a.mp4'))
+    top_file = write(os.path.join(root, 'My Video.mp4'))
+    write(os.path.join(root, 'notes.txt'))
+    return root, job_file, top_file
+
+
+def test_dry_run_moves_nothing(legacy_folder):
+    root, job_file, top_file = legacy_folder
+    planned = migrate(root, dry_run=True, log=lambda line: None)
+    assert set(planned) == {os.path.dirname(job_file), top_file}
+    assert os.path.exists(job_file) and os.path.exists(top_file)
+    assert open_name_index(root) is None
+
+
+def test_migrate_moves_rewrites_and_indexes(legacy_folder):
+    root, job_file, top_file = legacy_folder
+    store = MemoryJobStore()
+    store.save(finished_record(TOKEN, job_file))
+    store.save(finished_record('old', top_file))
+    cache = ResultCache(root, max_bytes=10 ** 9, ttl=0)
+    cache.put('k', top_file)
+
+    moved = migrate(root, log=lambda line: None, store=store, cache=cache)
+
+    new_job_file = os.path.join(token_dir(os.path.join(root, 'jobs'), TOKEN), 'a.mp4')
+    assert os.path.exists(new_job_file)
+    assert not os.path.exists(job_file) and not os.path.exists(top_file)
+    assert os.path.exists(os.path.join(root, 'notes.txt'))
+
+    # Old bare-name links resolve through the names index
+    token = open_name_index(root).token_for('My Video.mp4')
+    new_top_file = os.path.join(token_dir(os.path.join(root, 'jobs'), token), 'My Video.mp4')
+    assert moved[top_file] == new_top_file
+    assert os.path.exists(new_top_file)
+
+    assert store.load(TOKEN)['result']['file_path'] == new_job_file
+    assert store.load('old')['result']['file_path'] == new_top_file
+    assert ResultCache(root).get('k')['path'] == new_top_file
+
+    # Nothing left to do the second time
+    assert migrate(root, log=lambda line: None, store=store, cache=cache) == {}
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 Visual Watermark Remover Tool
-This tool lets you manually select watermark areas to remove from videos
+This tool lets you manually select watermark areas to remove from videos.
+The processing itself lives in removal.py; batch.py runs it without a display.
 """
 
 import os
@@ -11,7 +12,11 @@ from tkinter import filedialog, messagebox, ttk
 import cv2
 import numpy as np
 from PIL import Image, ImageTk
+import sys
 import threading
+from encoding import PROFILES, default_profile_name
+from overlays import detect_static_regions
+from removal import CANVAS_SIZE, PREVIEW_SECONDS, PreviewTransform, remove_watermarks, render_preview
 
 class VisualWatermarkRemover:
     def __init__(self):
@@ -22,6 +27,7 @@ class VisualWatermarkRemover:
         self.video_path = None
         self.frame = None
         self.original_frame = None
+        self.transform = None  # Canvas <-> video mapping of the loaded frame
         self.removal_areas = []
         self.current_selection = None
         
@@ -42,7 +48,7 @@ class VisualWatermarkRemover:
         self.file_label.pack(side=tk.LEFT, padx=10)
         
         # Canvas for video preview
-        self.canvas = tk.Canvas(main_frame, width=600, height=400, bg='black')
+        self.canvas = tk.Canvas(main_frame, width=CANVAS_SIZE[0], height=CANVAS_SIZE[1], bg='black')
         self.canvas.grid(row=1, column=0, padx=10, pady=10)
         self.canvas.bind("<Button-1>", self.start_selection)
         self.canvas.bind("<B1-Motion>", self.update_selection)
@@ -62,6 +68,7 @@ class VisualWatermarkRemover:
         ttk.Button(preset_frame, text="TikTok", command=lambda: self.apply_preset("tiktok")).pack(pady=2, fill=tk.X)
         ttk.Button(preset_frame, text="Instagram", command=lambda: self.apply_preset("instagram")).pack(pady=2, fill=tk.X)
         ttk.Button(preset_frame, text="Snapchat", command=lambda: self.apply_preset("snapchat")).pack(pady=2, fill=tk.X)
+        ttk.Button(preset_frame, text="🔍 Auto-detect", command=self.auto_detect).pack(pady=2, fill=tk.X)
         
         # Manual selection
         ttk.Separator(control_frame, orient='horizontal').pack(fill=tk.X, pady=10)
@@ -85,7 +92,15 @@ class VisualWatermarkRemover:
         self.enhance_var = tk.BooleanVar(value=True)
         ttk.Checkbutton(control_frame, text="Enhance quality", variable=self.enhance_var).pack(pady=2)
         
-        # Process button
+        # Encoder speed/quality profile
+        ttk.Label(control_frame, text="Encoding profile:").pack(pady=2)
+        self.profile_var = tk.StringVar(value=default_profile_name())
+        ttk.Combobox(control_frame, textvariable=self.profile_var, values=sorted(PROFILES),
+                     state='readonly', width=22).pack(pady=2)
+        
+        # Preview and process buttons
+        ttk.Button(control_frame, text=f"👁️ Preview ({PREVIEW_SECONDS}s)",
+                  command=self.preview_video).pack(pady=2, fill=tk.X)
         ttk.Button(control_frame, text="🚀 Remove Watermarks", 
                   command=self.process_video, style='Accent.TButton').pack(pady=10, fill=tk.X)
         
@@ -113,22 +128,23 @@ class VisualWatermarkRemover:
     
     def load_video_frame(self):
         """Load first frame of video for preview"""
+        # Don't keep showing (or mapping selections through) the previous video's frame
+        self.transform = None
+        self.frame = None
+        self.original_frame = None
+        # Areas are canvas coordinates inside the previous video's letterbox
+        self.clear_areas()
         try:
             cap = cv2.VideoCapture(self.video_path)
             ret, frame = cap.read()
             cap.release()
             
             if ret:
-                # Resize frame to fit canvas
+                # Fit the canvas while maintaining aspect ratio; the same transform maps selections back
                 height, width = frame.shape[:2]
-                canvas_width, canvas_height = 600, 400
+                self.transform = PreviewTransform((width, height))
                 
-                # Calculate scaling to fit canvas while maintaining aspect ratio
-                scale = min(canvas_width/width, canvas_height/height)
-                new_width = int(width * scale)
-                new_height = int(height * scale)
-                
-                frame = cv2.resize(frame, (new_width, new_height))
+                frame = cv2.resize(frame, (self.transform.display_width, self.transform.display_height))
                 frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                 
                 self.original_frame = frame.copy()
@@ -147,7 +163,7 @@ class VisualWatermarkRemover:
             
             # Clear canvas and display image
             self.canvas.delete("all")
-            self.canvas.create_image(300, 200, image=photo)
+            self.canvas.create_image(self.transform.offset_x, self.transform.offset_y, image=photo, anchor='nw')
             self.canvas.image = photo  # Keep a reference
             
             # Draw removal areas
@@ -215,6 +231,10 @@ class VisualWatermarkRemover:
                     (w-150, h-60, w-10, h-10),   # Bottom-right
                 ]
             
+            # Presets are relative to the picture, which sits inside the letterbox bars
+            dx, dy = self.transform.offset_x, self.transform.offset_y
+            self.removal_areas = [(x1+dx, y1+dy, x2+dx, y2+dy) for x1, y1, x2, y2 in self.removal_areas]
+            
             # Update listbox
             for i, (x1, y1, x2, y2) in enumerate(self.removal_areas):
                 self.areas_listbox.insert(tk.END, f"Area {i+1}: {x2-x1}x{y2-y1}")
@@ -222,6 +242,45 @@ class VisualWatermarkRemover:
             self.display_frame()
             self.status_label.config(text=f"{platform.title()} preset applied")
     
+    def auto_detect(self):
+        """Find static overlays in the video and add them as removal areas"""
+        if not self.video_path:
+            messagebox.showwarning("Warning", "Please select a video first")
+            return
+        if self.transform is None:
+            # Detected regions are drawn through the preview's transform
+            messagebox.showwarning("Warning", "Could not read a frame from this video")
+            return
+        
+        self.progress.start()
+        self.status_label.config(text="Looking for static overlays...")
+        
+        def detect():
+            try:
+                regions = detect_static_regions(self.video_path)
+                self.root.after(0, self._detection_complete, regions)
+            except Exception as e:
+                self.root.after(0, self._processing_error, str(e))
+        
+        thread = threading.Thread(target=detect)
+        thread.daemon = True
+        thread.start()
+    
+    def _detection_complete(self, regions):
+        """Show detected overlays (video pixels) on the letterboxed preview"""
+        self.progress.stop()
+        if not regions:
+            self.status_label.config(text="No static overlays found")
+            return
+        
+        for region in regions:
+            area = self.transform.region_to_canvas(region)
+            self.removal_areas.append(area)
+            self.areas_listbox.insert(tk.END, f"Area {len(self.removal_areas)}: {area[2]-area[0]}x{area[3]-area[1]}")
+        
+        self.display_frame()
+        self.status_label.config(text=f"Found {len(regions)} static overlay(s)")
+    
     def clear_areas(self):
         """Clear all removal areas"""
         self.removal_areas = []
@@ -229,21 +288,72 @@ class VisualWatermarkRemover:
         if self.frame is not None:
             self.display_frame()
     
-    def process_video(self):
-        """Process video to remove watermarks"""
+    def _ready_to_process(self):
+        """Check there is something to do and FFmpeg to do it with"""
         if not self.video_path:
             messagebox.showwarning("Warning", "Please select a video first")
-            return
+            return False
+        
+        if self.transform is None:
+            # Areas are mapped to video pixels through the preview's transform
+            messagebox.showwarning("Warning", "Could not read a frame from this video")
+            return False
         
         if not self.removal_areas and not (self.crop_var.get() or self.enhance_var.get()):
             messagebox.showwarning("Warning", "Please select watermark areas or enable processing options")
-            return
+            return False
         
         # Check FFmpeg
         try:
             subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
         except (subprocess.CalledProcessError, FileNotFoundError):
             messagebox.showerror("Error", "FFmpeg not found! Please install FFmpeg first.")
+            return False
+        return True
+    
+    def preview_video(self):
+        """Render the first few seconds with the current settings to check the areas"""
+        if not self._ready_to_process():
+            return
+        
+        self.progress.start()
+        self.status_label.config(text=f"Rendering {PREVIEW_SECONDS}s preview...")
+        
+        def render():
+            try:
+                result = render_preview(self.video_path, self._video_areas(),
+                                        crop=self.crop_var.get(), enhance=self.enhance_var.get())
+                self.root.after(0, self._preview_complete, result)
+            except Exception as e:
+                self.root.after(0, self._processing_error, str(e))
+        
+        thread = threading.Thread(target=render)
+        thread.daemon = True
+        thread.start()
+    
+    def _preview_complete(self, result):
+        """Offer to play the preview clip"""
+        self.progress.stop()
+        if not result['success']:
+            self.status_label.config(text="❌ Preview failed")
+            messagebox.showerror("Error", f"Preview failed:\n{result['message'][:300]}")
+            return
+        
+        output_path = result['output_path']
+        self.status_label.config(text=f"👁️ Preview ready ({result['timings']['total']}s): {os.path.basename(output_path)}")
+        if messagebox.askyesno("Preview", f"Preview rendered:\n{output_path}\n\nPlay it now?"):
+            if os.name == 'nt':  # Windows
+                os.startfile(output_path)
+            else:
+                subprocess.Popen(['open' if sys.platform == 'darwin' else 'xdg-open', output_path])
+    
+    def _video_areas(self):
+        """Selected areas in video pixels, through the transform used to draw them"""
+        return [self.transform.area_to_video(area) for area in self.removal_areas]
+    
+    def process_video(self):
+        """Process video to remove watermarks"""
+        if not self._ready_to_process():
             return
         
         # Start processing in separate thread
@@ -257,68 +367,26 @@ class VisualWatermarkRemover:
     def _process_video_thread(self):
         """Process video in separate thread"""
         try:
-            # Get video dimensions
-            cap = cv2.VideoCapture(self.video_path)
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            cap.release()
-            
-            # Calculate scaling factor from canvas to video
-            canvas_width, canvas_height = 600, 400
-            scale_x = width / canvas_width
-            scale_y = height / canvas_height
-            
             # Convert removal areas to video coordinates
-            video_areas = []
-            for x1, y1, x2, y2 in self.removal_areas:
-                vx1 = int(x1 * scale_x)
-                vy1 = int(y1 * scale_y)
-                vx2 = int(x2 * scale_x)
-                vy2 = int(y2 * scale_y)
-                video_areas.append((vx1, vy1, vx2-vx1, vy2-vy1))  # x, y, width, height
-            
-            # Build FFmpeg filter
-            filters = []
-            
-            # Add delogo filters for each area
-            for x, y, w, h in video_areas:
-                filters.append(f"delogo=x={x}:y={y}:w={w}:h={h}:show=0")
-            
-            # Add crop if enabled
-            if self.crop_var.get():
-                filters.append("crop=iw-40:ih-60:20:30")
-            
-            # Add enhancement if enabled
-            if self.enhance_var.get():
-                filters.append("unsharp=5:5:1.0:5:5:0.0")
-            
-            # Create output filename
-            base_name = os.path.splitext(self.video_path)[0]
-            output_path = f"{base_name}_no_watermark.mp4"
-            
-            # Build and run FFmpeg command
-            filter_string = ",".join(filters) if filters else "copy"
-            
-            cmd = [
-                'ffmpeg', '-i', self.video_path,
-                '-vf', filter_string,
-                '-c:v', 'libx264', '-crf', '18', '-preset', 'medium',
-                '-c:a', 'copy', '-y', output_path
-            ]
+            video_areas = self._video_areas()
             
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            # No deadline for desktop encodes; a stalled ffmpeg is still killed
+            result = remove_watermarks(self.video_path, video_areas,
+                                       crop=self.crop_var.get(), enhance=self.enhance_var.get(),
+                                       profile=self.profile_var.get(), timeout=0)
             
             # Update UI in main thread
-            self.root.after(0, self._processing_complete, result, output_path)
+            self.root.after(0, self._processing_complete, result)
             
         except Exception as e:
             self.root.after(0, self._processing_error, str(e))
     
-    def _processing_complete(self, result, output_path):
+    def _processing_complete(self, result):
         """Handle processing completion"""
         self.progress.stop()
         
-        if result.returncode == 0 and os.path.exists(output_path):
+        if result['success']:
+            output_path = result['output_path']
             self.status_label.config(text=f"✅ Success! Saved: {os.path.basename(output_path)}")
             
             # Ask if user wants to open output folder
@@ -328,7 +396,7 @@ class VisualWatermarkRemover:
                     os.startfile(folder)
         else:
             self.status_label.config(text="❌ Processing failed")
-            messagebox.showerror("Error", f"Processing failed:\n{result.stderr[:300]}")
+            messagebox.showerror("Error", f"Processing failed:\n{result['message'][:300]}")
     
     def _processing_error(self, error_msg):
         """Handle processing error"""
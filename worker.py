@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Worker process for DazzloGet's distributed mode
+Reserves download jobs from the broker (DAZZLO_BROKER, see broker.py), runs
+them - download, watermark removal, remux - and writes their state to the
+shared job store, where the web processes pick it up. Web nodes only need
+the same DAZZLO_BROKER, job store and download folder, so encoding can move
+to large CPU boxes while the web tier stays small.
+
+    DAZZLO_BROKER=redis://queue:6379/0 python worker.py --concurrency 8
+
+SIGTERM or Ctrl+C stops taking jobs and lets the running ones finish; a
+second signal exits at once, and the broker hands the unfinished jobs to
+another worker when their leases run out.
+"""
+
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from broker import LEASE_SECONDS, open_broker
+from pipeline import BROKER_FILENAME, create_job_manager, downloader_pool, run_download_job
+
+# Longest wait for a task before the loop renews leases and checks for shutdown
+RESERVE_TIMEOUT = 5
+
+
+class Worker:
+    """Feeds tasks from a broker to a JobManager, never more than concurrency at a time"""
+
+    def __init__(self, broker, manager, handler, concurrency, lease=LEASE_SECONDS):
+        self.broker = broker
+        self.manager = manager
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.lease = lease
+        # Renew well before a lease can run out
+        self.extend_interval = lease / 4
+        self.stopping = False
+        self.completed = 0
+        self._running = {}
+        self._lock = threading.Lock()
+        self._slot_free = threading.Event()
+
+    def running(self):
+        with self._lock:
+            return len(self._running)
+
+    def run(self):
+        """Take and run tasks until stop(), then wait for the running ones"""
+        last_extend = time.time()
+        while not self.stopping or self.running():
+            if time.time() - last_extend >= self.extend_interval:
+                last_extend = time.time()
+                self._extend_leases()
+            if self.stopping or self.running() >= self.concurrency:
+                self._slot_free.wait(1)
+                self._slot_free.clear()
+                continue
+            try:
+                delivery = self.broker.reserve(self.manager.owner, self.lease, RESERVE_TIMEOUT)
+                if delivery is not None:
+                    self._start(delivery)
+            except Exception as e:
+                print(f"⚠️ Broker error: {e}")
+                time.sleep(RESERVE_TIMEOUT)
+
+    def stop(self):
+        self.stopping = True
+        self._slot_free.set()
+
+    def _start(self, delivery):
+        future = self.manager.run_task(delivery.task, self.handler, delivery.deliveries)
+        if future is None:
+            # Finished, cancelled or taken over since it was queued
+            self.broker.ack(delivery)
+            return
+        with self._lock:
+            self._running[delivery.id] = delivery
+        future.add_done_callback(lambda _: self._finished(delivery))
+
+    def _finished(self, delivery):
+        try:
+            self.broker.ack(delivery)
+        except Exception as e:
+            # The job's outcome is in the store; a redelivery finds it finished
+            print(f"⚠️ Could not acknowledge job {delivery.task['job_id'][:8]}: {e}")
+        with self._lock:
+            self._running.pop(delivery.id, None)
+            self.completed += 1
+        self._slot_free.set()
+
+    def _extend_leases(self):
+        with self._lock:
+            deliveries = list(self._running.values())
+        for delivery in deliveries:
+            try:
+                if not self.broker.extend(delivery, self.lease):
+                    print(f"⚠️ Lost the lease on job {delivery.task['job_id'][:8]}; another worker may take it")
+            except Exception as e:
+                print(f"⚠️ Could not extend lease on job {delivery.task['job_id'][:8]}: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run DazzloGet download jobs from a broker')
+    parser.add_argument('--broker', help='broker URL (default: $DAZZLO_BROKER)')
+    parser.add_argument('--concurrency', type=int, default=int(os.environ.get('DAZZLO_MAX_WORKERS', '4')),
+                        help='jobs run at once (default: $DAZZLO_MAX_WORKERS or 4)')
+    parser.add_argument('--lease', type=float, default=LEASE_SECONDS,
+                        help='seconds before the jobs of a silent worker go to another (default: %(default)s)')
+    args = parser.parse_args()
+
+    try:
+        broker = open_broker(args.broker, default_path=os.path.join(downloader_pool.download_path, BROKER_FILENAME))
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    if broker is None:
+        print("❌ No broker configured: set DAZZLO_BROKER or pass --broker", file=sys.stderr)
+        return 2
+
+    # Every running job needs a downloader of its own
+    downloader_pool.resize(args.concurrency)
+    manager = create_job_manager(max_workers=args.concurrency, recover=False)
+    worker = Worker(broker, manager, run_download_job, args.concurrency, args.lease)
+
+    def shutdown(signum, frame):
+        if worker.stopping:
+            os._exit(1)
+        print(f"🛑 Finishing {worker.running()} running job(s); signal again to quit now", flush=True)
+        worker.stop()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    print(f"👷 Worker {manager.owner} running up to {worker.concurrency} job(s) from "
+          f"{broker.stats()['backend']} broker", flush=True)
+    worker.run()
+    print(f"🏁 Worker stopped after {worker.completed} job(s)", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())